@@ -1,22 +1,79 @@
 import os
 import uuid
+import base64
 import hashlib
+import hmac
+import math
 import datetime
+import functools
 import logging
 import json
+import socket
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import traceback
+import urllib.parse
+import weakref
+import asyncio
+import random
+import re
+from contextlib import contextmanager
 import jwt
 import psycopg2
-from psycopg2.extras import RealDictCursor, Json
+import psycopg2.errors
+import psycopg2.pool
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.extras import RealDictCursor, DictCursor, Json, execute_values
 from decimal import Decimal
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, has_app_context, has_request_context, stream_with_context
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 from dotenv import load_dotenv
+import orjson
 import psycopg2
 
 
+# Instante de carga del módulo: permite distinguir arranques en frío y en caliente
+PROCESS_STARTED_AT = time.perf_counter()
+
 load_dotenv()
+
+
+def _json_default(obj):
+    """Tipos que orjson no serializa de forma nativa"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class OrjsonProvider(JSONProvider):
+    """Proveedor JSON de Flask basado en orjson.
+
+    Serializa de forma nativa UUID, date/datetime (ISO 8601), Decimal (número)
+    y las filas de psycopg2 (RealDictRow), sin conversiones por fila.
+    """
+    options = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_json_default, option=self.options).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=_json_default, option=self.options),
+            mimetype="application/json",
+        )
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 # Combined CORS configuration
 CORS(app, resources={
     r"/*": {
@@ -44,25 +101,1268 @@ logging.basicConfig(level=logging.INFO)
 
 SECRET_KEY = os.getenv("SECRET_KEY", "super_secreto_por_defecto")
 
+# Configuración del pool de conexiones
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 5))
+# Solo se hace ping a conexiones que llevan más de estos segundos sin usarse
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", 30))
+# Conexiones inactivas más tiempo que esto se descartan sin probarlas (0 = nunca)
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", 300))
+# DATABASE_URL permite apuntar a un pooler externo como PgBouncer
+DATABASE_URL = os.getenv("DATABASE_URL")
+# En modo transacción de PgBouncer no se puede depender de estado de sesión
+DB_PGBOUNCER_TRANSACTION_MODE = os.getenv("DB_PGBOUNCER_TRANSACTION_MODE", "false").lower() in ("1", "true", "yes")
+
+
+class PoolTimeoutError(Exception):
+    """No se obtuvo una conexión libre del pool dentro del tiempo de espera"""
+
+
+# Trazado de consultas lentas: las sentencias que superan SLOW_QUERY_MS se registran
+# sin valores de parámetros y una fracción de ellas guarda su EXPLAIN ANALYZE en un
+# buffer circular visible en GET /admin/slow-queries. El EXPLAIN ANALYZE vuelve a
+# ejecutar la lectura dentro de la misma petición, así que en las peticiones
+# muestreadas el tiempo de base de datos de esa consulta se duplica.
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 200))
+SLOW_QUERY_EXPLAIN_SAMPLE = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE", 0.1))
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER_SIZE", 50))
+SLOW_QUERIES = deque(maxlen=SLOW_QUERY_BUFFER_SIZE)
+_slow_queries_lock = threading.Lock()
+# EXPLAIN ANALYZE ejecuta la sentencia: solo se aplica a lecturas
+_READ_ONLY_STATEMENT = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+_WRITE_KEYWORD = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE)\b", re.IGNORECASE)
+_PREPARED_EXECUTE = re.compile(r"^\s*EXECUTE\s+q_(\w+)", re.IGNORECASE)
+_PLACEHOLDER = re.compile(r"%%|%\((\w+)\)s|%s")
+# Texto que se guarda en lugar de sentencias con valores incrustados (p. ej. execute_values)
+INLINED_STATEMENT = "<omitida: valores incrustados en el texto>"
+
+
+def redact_params(params):
+    """Reemplaza los valores de los parámetros por su tipo"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {name: type(value).__name__ for name, value in params.items()}
+    return [type(value).__name__ for value in params]
+
+
+def has_inlined_values(query, params):
+    """Sin parámetros, solo el SQL escrito como str en el código es texto fijo;
+    bytes o sql.Composed vienen de helpers como execute_values con los valores ya incrustados"""
+    return params is None and not isinstance(query, str)
+
+
+def is_explainable(cursor, statement):
+    if cursor.name:
+        # Cursor con nombre (streaming): el EXECUTE es un DECLARE
+        return False
+    prepared = _PREPARED_EXECUTE.match(statement)
+    if prepared:
+        statement = QUERIES.get(prepared.group(1), "")
+    return bool(_READ_ONLY_STATEMENT.match(statement)) and not _WRITE_KEYWORD.search(statement)
+
+
+def unbind_placeholders(query, params):
+    """Convierte los %s / %(nombre)s de psycopg2 en $1, $2... y devuelve los valores en ese orden"""
+    names, values = [], []
+
+    def replace(match):
+        if match.group(0) == "%%":
+            return "%"
+        if match.group(1) is None:
+            values.append(params[len(values)])
+            return f"${len(values)}"
+        if match.group(1) not in names:
+            names.append(match.group(1))
+            values.append(params[match.group(1)])
+        return f"${names.index(match.group(1)) + 1}"
+
+    return _PLACEHOLDER.sub(replace, query), values
+
+
+def explain_analyze(cursor, query, params):
+    """EXPLAIN (ANALYZE, BUFFERS) con plan genérico, dentro de un savepoint.
+
+    La sentencia se prepara sin enlazar los valores y con plan_cache_mode =
+    force_generic_plan, así que el plan muestra $1, $2... en Index Cond/Filter y
+    no los literales de la petición.
+    """
+    raw = cursor.connection
+    name = f"slow_explain_{uuid.uuid4().hex[:12]}"
+    prepared = False
+    # Cursor plano para no volver a pasar por la instrumentación
+    with raw.cursor(cursor_factory=psycopg2.extensions.cursor) as explain:
+        explain.execute("SAVEPOINT slow_query_explain")
+        try:
+            explain.execute("SET LOCAL plan_cache_mode = force_generic_plan")
+            if _PREPARED_EXECUTE.match(query):
+                # Sentencia del registro, ya preparada en esta conexión por run_query
+                explain.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query, params)
+            else:
+                statement, values = unbind_placeholders(query, params or ())
+                explain.execute(f"PREPARE {name} AS {statement}")
+                prepared = True
+                placeholders = f" ({', '.join(['%s'] * len(values))})" if values else ""
+                explain.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) EXECUTE {name}{placeholders}", values)
+            plan = explain.fetchone()[0]
+            return json.loads(plan) if isinstance(plan, str) else plan
+        finally:
+            explain.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            # PREPARE no es transaccional: sobrevive al rollback y hay que liberarlo
+            if prepared:
+                explain.execute(f"DEALLOCATE {name}")
+            explain.execute("RELEASE SAVEPOINT slow_query_explain")
+
+
+def trace_slow_query(cursor, query, params, elapsed):
+    inlined = has_inlined_values(query, params)
+    statement = INLINED_STATEMENT if inlined else " ".join(query.split())
+    route = request.url_rule.rule if has_request_context() and request.url_rule else None
+    entry = {
+        "captured_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "route": route,
+        "method": request.method if has_request_context() else None,
+        "duration_ms": round(elapsed * 1000, 2),
+        "rows": cursor.rowcount,
+        "statement": statement[:2000],
+        "params": redact_params(params),
+        "plan": None,
+    }
+    logging.warning(
+        f"Consulta lenta ({entry['duration_ms']} ms, {entry['rows']} filas) en {route}: "
+        f"{statement[:500]} params={entry['params']}"
+    )
+    # En autocommit no hay transacción donde aislar el EXPLAIN con un savepoint
+    if (not inlined and not cursor.connection.autocommit
+            and random.random() < SLOW_QUERY_EXPLAIN_SAMPLE and is_explainable(cursor, statement)):
+        try:
+            entry["plan"] = explain_analyze(cursor, query, params)
+        except Exception as e:
+            logging.warning(f"No se pudo capturar EXPLAIN ANALYZE: {e}")
+    with _slow_queries_lock:
+        SLOW_QUERIES.append(entry)
+
+
+class InstrumentedCursorMixin:
+    """Suma a la petición en curso cada consulta ejecutada y su duración (ver GET /metrics) y traza las lentas"""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            result = super().execute(query, vars)
+        except Exception:
+            record_db_call(time.perf_counter() - started)
+            raise
+        elapsed = time.perf_counter() - started
+        record_db_call(elapsed)
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            try:
+                trace_slow_query(self, query, vars, elapsed)
+            except Exception as e:
+                logging.warning(f"Error trazando una consulta lenta: {e}")
+        return result
+
+
+class InstrumentedCursor(InstrumentedCursorMixin, RealDictCursor):
+    pass
+
+
+class InstrumentedDictCursor(InstrumentedCursorMixin, DictCursor):
+    pass
+
+
+# Los handlers piden RealDictCursor/DictCursor explícitamente; se sustituyen por su versión instrumentada
+INSTRUMENTED_CURSORS = {
+    None: InstrumentedCursor,
+    RealDictCursor: InstrumentedCursor,
+    DictCursor: InstrumentedDictCursor,
+}
+
+
+class PooledConnection:
+    """Conexión prestada por el pool; close() la devuelve al pool en vez de cerrarla"""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise psycopg2.InterfaceError("La conexión ya fue devuelta al pool")
+        return getattr(self._raw, name)
+
+    def cursor(self, *args, **kwargs):
+        if self._raw is None:
+            raise psycopg2.InterfaceError("La conexión ya fue devuelta al pool")
+        factory = kwargs.get('cursor_factory')
+        kwargs['cursor_factory'] = INSTRUMENTED_CURSORS.get(factory, factory)
+        return self._raw.cursor(*args, **kwargs)
+
+    @property
+    def released(self):
+        return self._raw is None
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.putconn(raw)
+
+
+class ConnectionPool:
+    """Pool de conexiones PostgreSQL compartido por todo el proceso"""
+
+    def __init__(self, minconn, maxconn, timeout, ping_after=0, max_idle=0, **connect_kwargs):
+        self.timeout = timeout
+        self.maxconn = maxconn
+        self.ping_after = ping_after
+        self.max_idle = max_idle
+        self.stats = {"connections_created": 0, "reconnects": 0, "pings": 0, "checkouts": 0}
+        # Estado por conexión; psycopg2 cierra las que exceden minconn al devolverlas,
+        # así que se indexa por referencia débil y no por id()
+        self._last_used = weakref.WeakKeyDictionary()
+        self.prepared = weakref.WeakKeyDictionary()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, **connect_kwargs)
+
+    def getconn(self):
+        """Presta una conexión sana, esperando como máximo `timeout` segundos"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeoutError(f"Sin conexiones libres tras {self.timeout}s")
+        try:
+            # Tras un periodo congelado (p. ej. entre invocaciones serverless) varias
+            # conexiones inactivas pueden estar muertas; se descartan hasta dar con una sana
+            for _ in range(self.maxconn + 1):
+                raw = self._pool.getconn()
+                if self._is_healthy(raw):
+                    break
+                self.stats["reconnects"] += 1
+                self._discard(raw)
+            else:
+                raise psycopg2.OperationalError("No se pudo obtener una conexión sana")
+        except Exception:
+            self._slots.release()
+            raise
+        self.stats["checkouts"] += 1
+        return PooledConnection(self, raw)
+
+    def putconn(self, raw):
+        """Devuelve la conexión al pool sin transacciones abiertas"""
+        try:
+            if not raw.closed and raw.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                raw.rollback()
+            if raw.closed:
+                self._discard(raw)
+            else:
+                self._last_used[raw] = time.monotonic()
+                self._pool.putconn(raw)
+        except Exception as e:
+            logging.warning(f"Descartando conexión del pool: {e}")
+            self._discard(raw)
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        self._pool.closeall()
+        self._last_used.clear()
+        self.prepared.clear()
+
+    def _discard(self, raw):
+        self._last_used.pop(raw, None)
+        self.prepared.pop(raw, None)
+        self._pool.putconn(raw, close=True)
+
+    def _is_healthy(self, raw):
+        """Validación barata: solo se consulta al servidor si la conexión estuvo inactiva"""
+        if raw.closed:
+            return False
+        last_used = self._last_used.get(raw)
+        if last_used is None:
+            # Conexión recién creada por el pool
+            self.stats["connections_created"] += 1
+            return True
+        idle = time.monotonic() - last_used
+        if self.max_idle and idle > self.max_idle:
+            return False
+        if idle < self.ping_after:
+            return True
+        self.stats["pings"] += 1
+        try:
+            with raw.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            raw.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+
+def db_connect_kwargs():
+    """Parámetros de conexión: DATABASE_URL o las variables DATABASE_* por separado"""
+    if DATABASE_URL:
+        return {"dsn": DATABASE_URL}
+    return {
+        "dbname": os.getenv("DATABASE_NAME"),
+        "user": os.getenv("DATABASE_USER"),
+        "password": os.getenv("DATABASE_PASSWORD"),
+        "host": os.getenv("DATABASE_HOST"),
+        "port": os.getenv("DATABASE_PORT"),
+    }
+
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+
+def get_db_pool():
+    """Crea el pool de forma perezosa la primera vez que se necesita"""
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = ConnectionPool(
+                    DB_POOL_MIN,
+                    DB_POOL_MAX,
+                    DB_POOL_TIMEOUT,
+                    ping_after=DB_POOL_PING_AFTER,
+                    max_idle=DB_POOL_MAX_IDLE,
+                    cursor_factory=InstrumentedCursor,
+                    **db_connect_kwargs()
+                )
+    return _db_pool
+
+
 def get_db_connection():
-    """Conecta a la base de datos PostgreSQL"""
+    """Obtiene una conexión del pool de PostgreSQL"""
     try:
-        connection = psycopg2.connect(
-            dbname=os.getenv("DATABASE_NAME"),
-            user=os.getenv("DATABASE_USER"),
-            password=os.getenv("DATABASE_PASSWORD"),
-            host=os.getenv("DATABASE_HOST"),
-            port=os.getenv("DATABASE_PORT"),
-            cursor_factory=RealDictCursor
-        )
-        return connection
+        connection = get_db_pool().getconn()
     except Exception as e:
         logging.error(f"Error al conectar con la base de datos: {e}")
         return None
+    # Se registra en el contexto de la petición para devolverla aunque el handler no la cierre
+    if has_app_context():
+        g.setdefault('db_connections', []).append(connection)
+    return connection
 
-def hash_password(password):
-    """Hashea la contraseña con SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
+
+@app.teardown_appcontext
+def release_db_connections(exception=None):
+    """Devuelve al pool las conexiones que quedaron prestadas al terminar la petición"""
+    for connection in g.pop('db_connections', []):
+        if not connection.released:
+            connection.close()
+
+
+# Vistas async (ASYNC_VIEWS=true): los endpoints de lectura con varias consultas
+# independientes las lanzan a la vez con asyncio.gather sobre un pool async de
+# psycopg 3. Flask crea un event loop por petición y un pool async queda atado a
+# su loop, así que el pool vive en un loop persistente en un hilo de fondo; la
+# vista (síncrona) le entrega la corrutina con run_coroutine_threadsafe y espera
+# el resultado. Todas las consultas async del proceso comparten ese loop y su E/S
+# no bloquea hilos. El pool async tiene los mismos DB_POOL_MIN/MAX que el de
+# psycopg2, y se abre aparte solo si se activa el modo. Compensa cuando cada
+# consulta espera al servidor (base remota) y el proceso tiene CPU libre; con
+# consultas locales de menos de 1 ms el paso por el loop cuesta más de lo que se
+# solapa (benchmarks/async_views.py --server-delay-ms).
+ASYNC_VIEWS = os.getenv("ASYNC_VIEWS", "false").lower() in ("1", "true", "yes")
+
+_async_loop = None
+_async_db_pool = None
+_async_db_pool_lock = threading.Lock()
+
+
+def get_async_db_pool():
+    """Arranca el loop de fondo y abre en él el pool async la primera vez que se necesita"""
+    global _async_loop, _async_db_pool
+    if _async_db_pool is None:
+        with _async_db_pool_lock:
+            if _async_db_pool is None:
+                from psycopg.conninfo import make_conninfo
+                from psycopg.rows import dict_row
+                from psycopg_pool import AsyncConnectionPool
+
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="async-db-loop", daemon=True).start()
+
+                connect_kwargs = db_connect_kwargs()
+                conninfo = make_conninfo(connect_kwargs.pop("dsn", ""), **connect_kwargs)
+
+                async def open_pool():
+                    pool = AsyncConnectionPool(
+                        conninfo,
+                        min_size=DB_POOL_MIN,
+                        max_size=DB_POOL_MAX,
+                        timeout=DB_POOL_TIMEOUT,
+                        # Solo lecturas de una sentencia: sin transacción que cerrar al devolverla.
+                        # Con PgBouncer en modo transacción no se preparan sentencias
+                        kwargs={
+                            "autocommit": True,
+                            "row_factory": dict_row,
+                            "prepare_threshold": None if DB_PGBOUNCER_TRANSACTION_MODE else 5,
+                        },
+                        open=False,
+                    )
+                    await pool.open()
+                    return pool
+
+                pool = asyncio.run_coroutine_threadsafe(open_pool(), loop).result()
+                # El loop se publica antes que el pool: quien vea el pool ya tiene su loop
+                _async_loop = loop
+                _async_db_pool = pool
+    return _async_db_pool
+
+
+def close_async_db_pool():
+    """Cierra el pool async y detiene su loop de fondo"""
+    global _async_loop, _async_db_pool
+    with _async_db_pool_lock:
+        if _async_db_pool is not None:
+            asyncio.run_coroutine_threadsafe(_async_db_pool.close(), _async_loop).result()
+            _async_loop.call_soon_threadsafe(_async_loop.stop)
+            _async_loop = _async_db_pool = None
+
+
+async def fetch_async(query, params=(), one=False):
+    """Ejecuta una consulta de solo lectura con una conexión del pool async"""
+    async with _async_db_pool.connection() as connection:
+        cursor = await connection.execute(query, params)
+        return await (cursor.fetchone() if one else cursor.fetchall())
+
+
+def gather_async(*queries):
+    """Lanza a la vez en el loop de fondo las consultas (query, params, one) y devuelve sus resultados en orden"""
+    get_async_db_pool()
+
+    async def gather():
+        return await asyncio.gather(*(fetch_async(*query) for query in queries))
+
+    return asyncio.run_coroutine_threadsafe(gather(), _async_loop).result()
+
+
+# Métricas de arranque en frío / en caliente de este proceso
+RUNTIME_METRICS = {
+    "cold_start": None,
+    "warm_requests": 0,
+    "warm_total_ms": 0.0,
+    "warm_max_ms": 0.0,
+}
+_runtime_metrics_lock = threading.Lock()
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started_at = time.perf_counter()
+    g.db_queries = 0
+    g.db_time = 0.0
+    g.in_flight = True
+    track_in_flight(1)
+
+
+@app.after_request
+def record_runtime_metrics(response):
+    started = g.get('request_started_at')
+    if started is None:
+        return response
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    with _runtime_metrics_lock:
+        if RUNTIME_METRICS["cold_start"] is None:
+            RUNTIME_METRICS["cold_start"] = {
+                "init_to_first_request_ms": round((started - PROCESS_STARTED_AT) * 1000, 2),
+                "first_request_ms": round(elapsed_ms, 2),
+                "endpoint": request.endpoint,
+            }
+        else:
+            RUNTIME_METRICS["warm_requests"] += 1
+            RUNTIME_METRICS["warm_total_ms"] += elapsed_ms
+            RUNTIME_METRICS["warm_max_ms"] = max(RUNTIME_METRICS["warm_max_ms"], elapsed_ms)
+    return response
+
+
+# Métricas por ruta expuestas en formato Prometheus en GET /metrics
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_DB_QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+ROUTE_METRICS = {}
+STATUS_METRICS = {}
+_route_metrics_lock = threading.Lock()
+_in_flight = {"requests": 0}
+
+
+class Histogram:
+    """Histograma acumulativo con buckets fijos, como los de Prometheus"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+def record_db_call(elapsed):
+    """Acumula una consulta en la petición en curso (fuera de una petición no se registra)"""
+    if has_app_context() and 'db_queries' in g:
+        g.db_queries += 1
+        g.db_time += elapsed
+
+
+def track_in_flight(delta):
+    with _route_metrics_lock:
+        _in_flight["requests"] += delta
+
+
+@app.teardown_request
+def finish_in_flight(exception=None):
+    if g.pop('in_flight', False):
+        track_in_flight(-1)
+
+
+@app.after_request
+def record_route_metrics(response):
+    started = g.get('request_started_at')
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    # Se agrupa por la plantilla de la ruta para no crear una serie por cada id
+    route = request.url_rule.rule if request.url_rule else "<unmatched>"
+    with _route_metrics_lock:
+        metrics = ROUTE_METRICS.get((route, request.method))
+        if metrics is None:
+            metrics = ROUTE_METRICS[(route, request.method)] = {
+                "latency": Histogram(METRICS_LATENCY_BUCKETS),
+                "db_queries": Histogram(METRICS_DB_QUERY_BUCKETS),
+                "db_time": Histogram(METRICS_LATENCY_BUCKETS),
+            }
+        metrics["latency"].observe(elapsed)
+        metrics["db_queries"].observe(g.get('db_queries', 0))
+        metrics["db_time"].observe(g.get('db_time', 0.0))
+        status_key = (route, request.method, response.status_code)
+        STATUS_METRICS[status_key] = STATUS_METRICS.get(status_key, 0) + 1
+    return response
+
+
+# Autenticación: cada token Bearer se verifica una sola vez y sus claims se
+# guardan en un LRU acotado (clave = digest del token) hasta su "exp".
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", 1024))
+_verified_tokens = OrderedDict()
+_verified_tokens_lock = threading.Lock()
+
+
+def verify_token(token):
+    """Devuelve los claims de un JWT; lanza jwt.InvalidTokenError si no es válido"""
+    digest = hashlib.sha256(token.encode()).digest()
+    now = time.time()
+    with _verified_tokens_lock:
+        entry = _verified_tokens.get(digest)
+        if entry is not None:
+            expires_at, claims = entry
+            if expires_at > now:
+                _verified_tokens.move_to_end(digest)
+                return claims
+            del _verified_tokens[digest]
+
+    claims = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+    # Sólo se cachean tokens con expiración; el resto se verifica siempre
+    if claims.get("exp"):
+        with _verified_tokens_lock:
+            _verified_tokens[digest] = (float(claims["exp"]), claims)
+            _verified_tokens.move_to_end(digest)
+            while len(_verified_tokens) > AUTH_CACHE_MAX_ENTRIES:
+                _verified_tokens.popitem(last=False)
+    return claims
+
+
+@app.before_request
+def load_current_user():
+    """Resuelve el usuario del header Authorization y lo deja en g"""
+    g.user_id = None
+    g.user_role = None
+    g.auth_error = None
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return
+    try:
+        claims = verify_token(auth_header.split(' ')[1])
+    except jwt.ExpiredSignatureError:
+        g.auth_error = "Token expirado"
+        return
+    except jwt.InvalidTokenError:
+        g.auth_error = "Token inválido"
+        return
+    g.user_id = claims.get('user_id')
+    g.user_role = claims.get('role_name')
+
+
+def require_auth(*roles, message=None):
+    """Exige un token válido y, si se indican, uno de los roles dados"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if g.get('auth_error'):
+                return jsonify({"message": g.auth_error}), 401
+            if not g.get('user_id'):
+                return jsonify({"message": "No se proporcionó token de autenticación"}), 401
+            if roles and g.user_role not in roles:
+                return jsonify({
+                    "message": message or f"No tienes permisos para esta acción. Rol requerido: {', '.join(roles)}"
+                }), 403
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Compatibilidad por una versión: las rutas de calificaciones identificaban al
+# usuario por el user_id del cuerpo o de ?user_id=, sin token. Si no llega token
+# se sigue aceptando (rol leído de la base, aviso en el log y header Deprecation);
+# con un token siempre manda el token. Se elimina en la próxima versión.
+CALIFICATION_LEGACY_USER_ID = os.getenv("CALIFICATION_LEGACY_USER_ID", "true").lower() in ("1", "true", "yes")
+
+
+def require_auth_or_legacy_user(view):
+    """require_auth() que, sin token, acepta el user_id heredado de las calificaciones"""
+    authenticated = require_auth()(view)
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not CALIFICATION_LEGACY_USER_ID or g.get('auth_error') or g.get('user_id'):
+            return authenticated(*args, **kwargs)
+        body = request.get_json(silent=True)
+        user_id = request.args.get('user_id') or (body.get('user_id') if isinstance(body, dict) else None)
+        if not user_id:
+            return authenticated(*args, **kwargs)
+        user_id = str(user_id)
+        try:
+            uuid.UUID(user_id)
+        except ValueError:
+            return jsonify({"error": "user_id inválido"}), 400
+        try:
+            with db_cursor() as cursor:
+                cursor.execute("""
+                    SELECT ur.role_name
+                    FROM users u
+                    JOIN user_roles ur ON u.role_id = ur.id
+                    WHERE u.id = %s
+                """, (user_id,))
+                role = cursor.fetchone()
+        except Exception as e:
+            logging.error(f"Error verificando el user_id heredado: {e}")
+            return jsonify({"error": "Error interno del servidor"}), 500
+        if not role:
+            return jsonify({"error": "Usuario no encontrado"}), 404
+        logging.warning(
+            f"{request.method} {request.path} sin token con user_id={user_id}: obsoleto, "
+            f"se eliminará en la próxima versión; enviar Authorization: Bearer"
+        )
+        g.user_id = user_id
+        g.user_role = role['role_name']
+        response = app.make_response(view(*args, **kwargs))
+        response.headers['Deprecation'] = 'true'
+        return response
+    return wrapper
+
+
+@contextmanager
+def db_cursor(commit=False):
+    """Presta una conexión del pool y entrega un cursor; hace commit o rollback al salir"""
+    connection = get_db_connection()
+    if not connection:
+        raise psycopg2.OperationalError("Database connection failed")
+    cursor = connection.cursor()
+    try:
+        yield cursor
+        if commit:
+            connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+        connection.close()
+
+# Registro central de consultas frecuentes. Cada una se prepara (PREPARE) en
+# la conexión del pool la primera vez que se usa; las siguientes llamadas
+# ejecutan el plan ya preparado (EXECUTE) sin volver a parsear ni planificar.
+QUERIES = {
+    "user_exists": "SELECT id FROM users WHERE id = %s",
+    "user_for_login": """
+        SELECT users.id, users.username, users.role_id, user_roles.role_name, users.password
+        FROM users
+        INNER JOIN user_roles ON users.role_id = user_roles.id
+        WHERE users.username = %s
+    """,
+    "trip_exists": "SELECT id FROM trips WHERE id = %s",
+    "trip_name": "SELECT id, trip_name FROM trips WHERE id = %s",
+    "trip_has_reservations": "SELECT id FROM reservations WHERE trip_id = %s LIMIT 1",
+    "trip_reservation_count": "SELECT COUNT(*) as count FROM reservations WHERE trip_id = %s",
+    "user_reservation_on_trip": "SELECT id FROM reservations WHERE user_id = %s AND trip_id = %s",
+    "resource_exists": "SELECT 1 FROM resources WHERE id = %s",
+    "calification_by_user_trip": "SELECT id, calification FROM ranger_califications WHERE user_id = %s AND trip_id = %s",
+    "calification_by_id": """
+        SELECT id, user_id, trip_id, calification, user_comment
+        FROM ranger_califications WHERE id = %s
+    """,
+    "delete_trip_activities": "DELETE FROM activity_trips WHERE trip_id = %s",
+    "delete_trip_resources": "DELETE FROM trip_resources WHERE trip_id = %s",
+    # Reclama un cupo y crea la reserva en una sola sentencia: el UPDATE toma el
+    # lock de la fila del viaje y reevalúa la condición, así que no hay sobreventa.
+    # max_participants_number <= 0 significa viaje sin límite de cupos.
+    "reservation_claim_seat": """
+        WITH seat AS (
+            UPDATE trips SET seats_taken = seats_taken + 1
+            WHERE id = %s
+              AND (max_participants_number <= 0 OR seats_taken < max_participants_number)
+            RETURNING id
+        )
+        INSERT INTO reservations (trip_id, user_id, status)
+        SELECT id, %s, %s FROM seat
+        RETURNING id
+    """,
+}
+
+# Baja de reservas que libera sus cupos en la misma sentencia; {condition}
+# filtra reservations y devuelve las filas eliminadas.
+RESERVATION_RELEASE_SQL = """
+    WITH deleted AS (
+        DELETE FROM reservations WHERE {condition}
+        RETURNING id, trip_id, user_id
+    ), released AS (
+        UPDATE trips SET seats_taken = GREATEST(trips.seats_taken - d.taken, 0)
+        FROM (SELECT trip_id, COUNT(*) AS taken FROM deleted GROUP BY trip_id) d
+        WHERE trips.id = d.trip_id
+    )
+    SELECT id, user_id FROM deleted
+"""
+
+# Ejecuciones y tiempos por consulta del registro
+QUERY_STATS = {}
+_query_stats_lock = threading.Lock()
+
+
+def _positional(sql):
+    """Convierte los %s de psycopg2 en $1, $2... para PREPARE"""
+    parts = sql.split("%s")
+    return "".join(part + (f"${i + 1}" if i < len(parts) - 1 else "") for i, part in enumerate(parts))
+
+
+def run_query(cursor, name, params=()):
+    """Ejecuta una consulta del registro con sentencias preparadas por conexión; devuelve el cursor"""
+    sql = QUERIES[name]
+    started = time.perf_counter()
+    prepared_now = False
+    if DB_PGBOUNCER_TRANSACTION_MODE:
+        # Con PgBouncer en modo transacción la sesión cambia entre transacciones
+        cursor.execute(sql, params)
+    else:
+        raw = cursor.connection
+        prepared = _db_pool.prepared.setdefault(raw, set()) if _db_pool is not None else None
+        if prepared is None or name not in prepared:
+            cursor.execute(f"PREPARE q_{name} AS {_positional(sql)}")
+            if prepared is not None:
+                prepared.add(name)
+            prepared_now = True
+        if params:
+            cursor.execute(f"EXECUTE q_{name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cursor.execute(f"EXECUTE q_{name}")
+        if prepared is None:
+            cursor.execute(f"DEALLOCATE q_{name}")
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    with _query_stats_lock:
+        stats = QUERY_STATS.setdefault(name, {"calls": 0, "prepares": 0, "total_ms": 0.0, "max_ms": 0.0})
+        stats["calls"] += 1
+        stats["prepares"] += prepared_now
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+    return cursor
+
+
+# Modo streaming NDJSON para listados grandes
+NDJSON_MIMETYPE = "application/x-ndjson"
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", 500))
+
+
+def wants_stream():
+    """True si el cliente pidió NDJSON (?stream=1 o Accept: application/x-ndjson)"""
+    if request.args.get('stream', '').lower() in ('1', 'true'):
+        return True
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def stream_rows(query, params=None):
+    """Respuesta NDJSON que lee la consulta con un cursor con nombre, por lotes.
+
+    El DECLARE se ejecuta antes de responder para que los errores de la consulta
+    devuelvan un 500 normal; las filas se envían a medida que se leen.
+    """
+    connection = get_db_connection()
+    if not connection:
+        return jsonify({"message": "Error de conexión con la base de datos"}), 500
+
+    cursor = connection.cursor(name=f"stream_{uuid.uuid4().hex}")
+    try:
+        cursor.execute(query, params)
+    except Exception as e:
+        logging.error(f"Error iniciando streaming: {e}")
+        cursor.close()
+        connection.rollback()
+        connection.close()
+        return jsonify({"message": "Error interno del servidor"}), 500
+
+    def generate():
+        options = app.json.options | orjson.OPT_APPEND_NEWLINE
+        try:
+            while True:
+                rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+                if not rows:
+                    break
+                yield b"".join(orjson.dumps(row, default=_json_default, option=options) for row in rows)
+        except Exception as e:
+            # Los encabezados ya se enviaron: se avisa con una última línea
+            logging.error(f"Error durante streaming: {e}")
+            yield orjson.dumps({"error": "stream_interrupted"}, option=orjson.OPT_APPEND_NEWLINE)
+        finally:
+            cursor.close()
+            connection.rollback()
+            connection.close()
+
+    return app.response_class(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+
+# Paginación por cursor (keyset)
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 500
+
+
+def encode_cursor(values):
+    """Codifica los valores de la última fila de la página en un token opaco"""
+    raw = json.dumps(values, default=str, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Decodifica un token generado por encode_cursor; lanza ValueError si es inválido"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Cursor inválido")
+    if not isinstance(values, list):
+        raise ValueError("Cursor inválido")
+    return values
+
+
+def get_page_args(default_limit=None):
+    """Lee ?limit= y ?after= de la petición.
+
+    Devuelve (limit, after). limit es None si el cliente no pidió paginación y
+    no hay límite por defecto; after es la lista de valores del cursor o None.
+    """
+    limit = request.args.get('limit')
+    after = request.args.get('after')
+    if limit is None and after is None and default_limit is None:
+        return None, None
+    try:
+        limit = int(limit) if limit is not None else (default_limit or DEFAULT_PAGE_LIMIT)
+    except ValueError:
+        raise ValueError("El parámetro limit debe ser un número entero")
+    if limit < 1:
+        raise ValueError("El parámetro limit debe ser mayor que 0")
+    limit = min(limit, MAX_PAGE_LIMIT)
+    return limit, decode_cursor(after) if after else None
+
+
+def uuid_cursor(after):
+    """Valida un cursor de listados paginados por id; devuelve el id o None y lanza ValueError si es inválido"""
+    if after is None:
+        return None
+    if len(after) != 1 or not isinstance(after[0], str):
+        raise ValueError("Cursor inválido")
+    try:
+        return str(uuid.UUID(after[0]))
+    except ValueError:
+        raise ValueError("Cursor inválido")
+
+
+def split_page(rows, limit, key):
+    """Recorta las filas (se consultan limit + 1) y genera el cursor de la siguiente página"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(key(rows[-1]))
+
+
+def estimate_row_count(cursor, table, conditions=None, params=None):
+    """Estima filas sin recorrer la tabla.
+
+    Sin filtros usa pg_class.reltuples; con filtros usa la estimación de EXPLAIN.
+    `table` y `conditions` deben venir del código, nunca de la petición.
+    """
+    if not conditions:
+        cursor.execute("SELECT reltuples::bigint AS estimate FROM pg_class WHERE oid = %s::regclass", (table,))
+        row = cursor.fetchone()
+        if not row:
+            return 0
+        # reltuples es -1 si la tabla nunca fue analizada
+        return max(int(row['estimate'] if isinstance(row, dict) else row[0]), 0)
+    query = f"EXPLAIN (FORMAT JSON) SELECT 1 FROM {table} WHERE " + " AND ".join(conditions)
+    cursor.execute(query, params or [])
+    row = cursor.fetchone()
+    plan = row['QUERY PLAN'] if isinstance(row, dict) else row[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class CacheBackend:
+    """Interfaz de almacenamiento para las respuestas cacheadas (valores en bytes)"""
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix):
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Caché LRU en memoria del proceso con expiración por entrada"""
+
+    def __init__(self, maxsize=256, on_evict=None):
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        evicted = []
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                evicted.append(self._data.popitem(last=False)[0])
+        if self.on_evict:
+            for evicted_key in evicted:
+                self.on_evict(evicted_key)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [key for key in self._data if key.startswith(prefix)]:
+                del self._data[key]
+
+
+class RedisError(Exception):
+    """Respuesta de error de un servidor con protocolo Redis"""
+
+
+class RedisProtocolError(RedisError):
+    """Respuesta ilegible: la conexión queda desincronizada y hay que cerrarla"""
+
+
+class RedisCacheBackend(CacheBackend):
+    """Caché compartida entre instancias sobre el protocolo Redis (RESP).
+
+    Cliente mínimo sin dependencias: solo usa GET, SET EX, SCAN y DEL, por lo
+    que funciona contra Redis, Valkey o un servidor falso local.
+    """
+
+    def __init__(self, url, timeout=0.5):
+        parsed = urllib.parse.urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self._sock = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._command('GET', key)
+
+    def set(self, key, value, ttl):
+        self._command('SET', key, value, 'EX', max(int(ttl), 1))
+
+    def delete_prefix(self, prefix):
+        cursor = '0'
+        while True:
+            cursor, keys = self._command('SCAN', cursor, 'MATCH', prefix + '*', 'COUNT', 500)
+            if keys:
+                self._command('DEL', *keys)
+            cursor = cursor.decode() if isinstance(cursor, bytes) else str(cursor)
+            if cursor == '0':
+                break
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._reader = self._sock.makefile('rb')
+        try:
+            if self.password:
+                self._send_and_read('AUTH', self.password)
+            if self.db:
+                self._send_and_read('SELECT', self.db)
+        except RedisError:
+            # No se reutiliza una conexión sin autenticar o en otra base
+            self._close()
+            raise
+
+    def _close(self):
+        for resource in (self._reader, self._sock):
+            try:
+                if resource:
+                    resource.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._reader = None
+
+    def _command(self, *args):
+        with self._lock:
+            # Un reintento: la conexión pudo cerrarse entre invocaciones
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._send_and_read(*args)
+                except RedisProtocolError:
+                    self._close()
+                    raise
+                except OSError:
+                    self._close()
+                    if attempt:
+                        raise
+
+    def _send_and_read(self, *args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        self._sock.sendall(b''.join(parts))
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self._reader.readline()
+        if not line.endswith(b'\r\n'):
+            # Fin de archivo, también a mitad de línea
+            raise ConnectionError("El servidor de caché cerró la conexión")
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b'+':
+            return payload.decode()
+        if prefix == b'-':
+            # Error del comando (-ERR, -WRONGTYPE...): la respuesta se leyó entera y
+            # la conexión sigue sincronizada, así que se conserva y no se reintenta
+            raise RedisError(payload.decode())
+        if prefix not in (b':', b'$', b'*'):
+            raise RedisProtocolError(f"Respuesta desconocida: {line!r}")
+        try:
+            number = int(payload)
+        except ValueError:
+            raise RedisProtocolError(f"Respuesta desconocida: {line!r}") from None
+        if prefix == b':':
+            return number
+        if number == -1:
+            return None
+        if prefix == b'$':
+            data = self._reader.read(number + 2)
+            if len(data) < number + 2:
+                raise ConnectionError("El servidor de caché cerró la conexión")
+            return data[:-2]
+        return [self._read_reply() for _ in range(number)]
+
+
+# Contadores de la caché por namespace (endpoint)
+CACHE_STATS = {}
+_cache_stats_lock = threading.Lock()
+
+
+def record_cache_event(namespace, event):
+    with _cache_stats_lock:
+        stats = CACHE_STATS.setdefault(namespace, {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "errors": 0})
+        stats[event] += 1
+
+
+def create_cache_backend():
+    """Elige el backend según CACHE_BACKEND (memory | redis)"""
+    backend = os.getenv("CACHE_BACKEND", "memory").lower()
+    if backend == "redis":
+        return RedisCacheBackend(os.getenv("CACHE_URL", "redis://localhost:6379/0"))
+    return MemoryCacheBackend(
+        maxsize=int(os.getenv("CACHE_MAX_ENTRIES", 256)),
+        on_evict=lambda key: record_cache_event(key.split(':', 1)[0], "evictions")
+    )
+
+
+CACHE_BACKEND = create_cache_backend()
+CACHE_DEFAULT_TTL = float(os.getenv("CACHE_TTL", 300))
+
+
+def cached_response(namespace, ttl=None):
+    """Cachea la respuesta 200 de un endpoint de solo lectura y responde 304 si el cliente ya la tiene.
+
+    En un acierto no se toca la base de datos. Las escrituras deben llamar a
+    invalidate_cache(namespace) o invalidate_cache(namespace, ruta).
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = f"{namespace}:{request.full_path}"
+            entry = None
+            try:
+                cached = CACHE_BACKEND.get(key)
+                entry = json.loads(cached) if cached else None
+            except Exception as e:
+                logging.warning(f"Error leyendo la caché {namespace}: {e}")
+                record_cache_event(namespace, "errors")
+
+            if entry is None:
+                record_cache_event(namespace, "misses")
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                entry = {
+                    "body": body.decode('utf-8'),
+                    "mimetype": response.mimetype,
+                    "etag": hashlib.sha1(body).hexdigest(),
+                    "last_modified": int(time.time()),
+                }
+                try:
+                    CACHE_BACKEND.set(key, json.dumps(entry).encode(), ttl or CACHE_DEFAULT_TTL)
+                except Exception as e:
+                    logging.warning(f"Error escribiendo la caché {namespace}: {e}")
+                    record_cache_event(namespace, "errors")
+            else:
+                record_cache_event(namespace, "hits")
+                response = app.response_class(entry["body"], status=200, mimetype=entry["mimetype"])
+            response.set_etag(entry["etag"])
+            response.last_modified = datetime.datetime.fromtimestamp(entry["last_modified"], datetime.timezone.utc)
+            response.headers["Cache-Control"] = "no-cache"
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+
+def invalidate_cache(namespace, path=''):
+    """Descarta las respuestas cacheadas de un namespace (o solo las que empiezan por `path`)"""
+    record_cache_event(namespace, "invalidations")
+    try:
+        CACHE_BACKEND.delete_prefix(f"{namespace}:{path}")
+    except Exception as e:
+        logging.error(f"Error invalidando la caché {namespace}: {e}")
+        record_cache_event(namespace, "errors")
+
+
+def invalidate_explorer_dashboard(*user_ids):
+    """Descarta el dashboard cacheado de cada explorer afectado por una escritura"""
+    for user_id in {str(u) for u in user_ids if u}:
+        invalidate_cache('explorer_dashboard', f"/dashboard/explorer/{user_id}")
+
+
+# Hash de contraseñas: PBKDF2-SHA256 con costo configurable, ejecutado en un
+# pool acotado para que una ráfaga de logins no acapare los hilos de petición.
+PASSWORD_HASH_SCHEME = "pbkdf2_sha256"
+PASSWORD_HASH_ITERATIONS = int(os.getenv("PASSWORD_HASH_ITERATIONS", 120000))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 16))
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", 5))
+
+_password_hash_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
+_password_hash_slots = threading.BoundedSemaphore(PASSWORD_HASH_MAX_PENDING)
+
+
+class PasswordHashBusyError(Exception):
+    """El pool de hashing está saturado"""
+
+
+def _run_password_job(fn, *args):
+    """Ejecuta fn en el pool de hashing, limitando los trabajos pendientes"""
+    if not _password_hash_slots.acquire(timeout=PASSWORD_HASH_TIMEOUT):
+        raise PasswordHashBusyError(f"Sin capacidad de hashing tras {PASSWORD_HASH_TIMEOUT}s")
+    try:
+        return _password_hash_executor.submit(fn, *args).result()
+    finally:
+        _password_hash_slots.release()
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+
+
+def _encode_password_hash(password, iterations):
+    salt = os.urandom(16)
+    digest = _pbkdf2(password, salt, iterations)
+    return "$".join([
+        PASSWORD_HASH_SCHEME,
+        str(iterations),
+        base64.b64encode(salt).decode(),
+        base64.b64encode(digest).decode(),
+    ])
+
+
+def _check_password_hash(password, stored, iterations):
+    if not stored:
+        return False, False
+    if "$" not in stored:
+        # Hash SHA-256 heredado: válido, pero debe re-hashearse
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, stored), True
+    try:
+        scheme, rounds, salt, digest = stored.split("$")
+        rounds = int(rounds)
+        salt = base64.b64decode(salt)
+        digest = base64.b64decode(digest)
+    except ValueError:
+        return False, False
+    if scheme != PASSWORD_HASH_SCHEME:
+        return False, False
+    ok = hmac.compare_digest(_pbkdf2(password, salt, rounds), digest)
+    return ok, rounds != iterations
+
+
+# Hash con el que se verifica cuando el usuario no existe (o no tiene contraseña),
+# para que todo intento de login pague el mismo costo de PBKDF2 y el tiempo de
+# respuesta no revele qué usuarios existen. Salt y digest aleatorios: ninguna
+# contraseña lo satisface y generarlo no cuesta nada al importar.
+_DUMMY_PASSWORD_HASH = "$".join([
+    PASSWORD_HASH_SCHEME,
+    str(PASSWORD_HASH_ITERATIONS),
+    base64.b64encode(os.urandom(16)).decode(),
+    base64.b64encode(os.urandom(32)).decode(),
+])
+
+
+def hash_password(password, iterations=None):
+    """Hashea la contraseña con PBKDF2-SHA256 en el pool de hashing"""
+    return _run_password_job(
+        _encode_password_hash, password, iterations or PASSWORD_HASH_ITERATIONS
+    )
+
+
+def verify_password(password, stored, iterations=None):
+    """Verifica la contraseña; devuelve (válida, requiere_rehash)"""
+    return _run_password_job(
+        _check_password_hash, password, stored, iterations or PASSWORD_HASH_ITERATIONS
+    )
 
 
 
@@ -168,6 +1468,7 @@ def update_user_profile(username):
             query = f"UPDATE users SET {', '.join(update_fields)} WHERE username = %s RETURNING id"
             cursor.execute(query, update_values)
             connection.commit()
+            invalidate_cache('rangers')
             
             # Imprimir información de depuración
             print(f"Usuario actualizado: {username}")
@@ -392,6 +1693,7 @@ def upload_profile_picture():
         
       
 @app.route('/api/certifications', methods=['GET'])
+@cached_response('certifications')
 def get_certifications():
     connection = get_db_connection()
     if not connection:
@@ -414,11 +1716,6 @@ def get_certifications():
         
         certifications = cursor.fetchall()
         
-        # Formatear IDs para JSON
-        for cert in certifications:
-            cert['id'] = str(cert['id'])
-            cert['created_at'] = cert['created_at'].isoformat() if cert['created_at'] else None
-        
         return jsonify({"certifications": certifications}), 200
 
     except Exception as e:
@@ -455,6 +1752,9 @@ def register():
         
         connection.commit()
         return jsonify({"message": "Usuario creado correctamente"}), 201
+    except PasswordHashBusyError as e:
+        logging.error(f"Error en el registro: {e}")
+        return jsonify({"message": "Servidor ocupado, intenta nuevamente"}), 503
     except Exception as e:
         logging.error(f"Error en el registro: {e}")
         return jsonify({"message": "Error al crear usuario"}), 500
@@ -464,6 +1764,7 @@ def register():
 
      
 @app.route('/roles')
+@cached_response('roles')
 def get_roles():
     """Obtiene todos los roles de usuario"""
     connection = get_db_connection()
@@ -503,20 +1804,26 @@ def login():
             logging.warning("Missing username or password")
             return jsonify({"message": "Debe ingresar usuario y contraseña"}), 400
        
-        hashed_password = hash_password(password)  # Hashear la contraseña ingresada
         logging.info(f"Attempting login for user: {username}")
 
-        cursor.execute(
-            """SELECT users.id, users.username, users.role_id, user_roles.role_name, users.password FROM users 
-               inner join 
-               user_roles
-               on users.role_id = user_roles.id WHERE users.username = %s     
-            """
-        ,(username,))
+        run_query(cursor, "user_for_login", (username,))
        
         user = cursor.fetchone()
-        
-        if user and user["password"] == hashed_password:
+        if user and user["password"]:
+            valid, needs_rehash = verify_password(password, user["password"])
+        else:
+            verify_password(password, _DUMMY_PASSWORD_HASH)
+            valid, needs_rehash = False, False
+        
+        if valid:
+            if needs_rehash:
+                # Migra hashes heredados (o con otro costo) al esquema actual
+                cursor.execute(
+                    "UPDATE users SET password = %s WHERE id = %s AND password = %s",
+                    (hash_password(password), user["id"], user["password"])
+                )
+                connection.commit()
+
             token = jwt.encode({
                 "user_id": user["id"],
                 "username": user["username"],
@@ -545,6 +1852,9 @@ def login():
             logging.warning(f"Invalid credentials for user: {username}")
             return jsonify({"message": "Credenciales incorrectas"}), 401
 
+    except PasswordHashBusyError as e:
+        logging.error(f"Error en el login: {e}")
+        return jsonify({"message": "Servidor ocupado, intenta nuevamente"}), 503
     except Exception as e:
         logging.error(f"Error en el login: {e}")
         return jsonify({"message": "Error en el login"}), 500
@@ -591,8 +1901,8 @@ def change_password():
             return jsonify({"error": "Usuario no encontrado"}), 404
         
         # Verificar la contraseña actual
-        hashed_current_password = hash_password(current_password)
-        if user['password'] != hashed_current_password:
+        valid, _ = verify_password(current_password, user['password'])
+        if not valid:
             return jsonify({"error": "La contraseña actual es incorrecta"}), 401
         
         # Hashear la nueva contraseña
@@ -608,6 +1918,8 @@ def change_password():
         
         return jsonify({"message": "Contraseña actualizada correctamente"}), 200
 
+    except PasswordHashBusyError:
+        return jsonify({"error": "Servidor ocupado, intenta nuevamente"}), 503
     except Exception as e:
         if connection:
             connection.rollback()
@@ -684,13 +1996,26 @@ def get_all_activities():
 
     cursor = connection.cursor(cursor_factory=RealDictCursor)
     try:
-        cursor.execute("SELECT * FROM activities")
-        activities = cursor.fetchall()
-
-        # Convertir UUID a strings
-        activities_converted = [dict(activity, id=str(activity['id'])) for activity in activities]
+        try:
+            limit, after = get_page_args()
+            after = uuid_cursor(after)
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+
+        if limit is None:
+            cursor.execute("SELECT * FROM activities")
+            activities = cursor.fetchall()
+            next_cursor = None
+        else:
+            if after:
+                cursor.execute("SELECT * FROM activities WHERE id > %s ORDER BY id LIMIT %s", (after, limit + 1))
+            else:
+                cursor.execute("SELECT * FROM activities ORDER BY id LIMIT %s", (limit + 1,))
+            activities, next_cursor = split_page(cursor.fetchall(), limit, lambda row: [row['id']])
 
-        return jsonify({"activities": activities_converted}), 200
+        if limit is None:
+            return jsonify({"activities": activities}), 200
+        return jsonify({"activities": activities, "next_cursor": next_cursor}), 200
     except Exception as e:
         logging.error(f"Error al obtener actividades: {e}")
         return jsonify({"message": "Error interno del servidor"}), 500
@@ -756,6 +2081,7 @@ def update_activity(activity_id):
                 return jsonify({"message": "Actividad no encontrada"}), 404
                 
             connection.commit()
+            invalidate_cache('trip_activities')
             
             # Convertir el resultado a un diccionario
             if isinstance(updated_activity, dict):
@@ -828,6 +2154,7 @@ def delete_activity(activity_id):
             return jsonify({"message": "Actividad no encontrada"}), 404
             
         connection.commit()
+        invalidate_cache('trip_activities')
         return jsonify({"message": "Actividad eliminada correctamente"}), 200
     
     except Exception as e:
@@ -837,6 +2164,93 @@ def delete_activity(activity_id):
         cursor.close()
         connection.close()
             
+# Tablas de asociación de viajes: tabla, columna del elemento y tabla del elemento
+TRIP_ASSOCIATIONS = {
+    'activities': ('activity_trips', 'activity_id', 'activities'),
+    'resources': ('trip_resources', 'resource_id', 'resources'),
+}
+MAX_BULK_ASSOCIATIONS = 500
+
+
+def attach_to_trip(cursor, kind, trip_id, item_ids):
+    """Asocia elementos a un viaje en una sola sentencia (INSERT ... ON CONFLICT DO NOTHING).
+
+    Devuelve una fila por id solicitado con association_id (None si ya existía
+    o si el elemento no existe) e item_exists. Si el viaje no existe la
+    inserción lanza psycopg2.errors.ForeignKeyViolation.
+    """
+    table, column, item_table = TRIP_ASSOCIATIONS[kind]
+    cursor.execute(f"""
+        WITH requested AS (
+            SELECT DISTINCT unnest(%(item_ids)s::uuid[]) AS id
+        ),
+        inserted AS (
+            INSERT INTO {table} ({column}, trip_id)
+            SELECT r.id, %(trip_id)s::uuid
+            FROM requested r
+            JOIN {item_table} i ON i.id = r.id
+            ON CONFLICT ({column}, trip_id) DO NOTHING
+            RETURNING id, {column} AS item_id
+        )
+        SELECT
+            r.id AS item_id,
+            ins.id AS association_id,
+            EXISTS (SELECT 1 FROM {item_table} i WHERE i.id = r.id) AS item_exists
+        FROM requested r
+        LEFT JOIN inserted ins ON ins.item_id = r.id
+    """, {"item_ids": [str(item_id) for item_id in item_ids], "trip_id": str(trip_id)})
+    return cursor.fetchall()
+
+
+def bulk_attach_to_trip(kind, ids_field):
+    """Lógica común de POST /activity-trips/bulk y POST /trips-resources/bulk"""
+    body = request.get_json(silent=True)
+    if not body or 'trip_id' not in body or not isinstance(body.get(ids_field), list):
+        return jsonify({"message": f"Faltan campos requeridos: trip_id y {ids_field} (lista)"}), 400
+    if not body[ids_field]:
+        return jsonify({"message": f"{ids_field} no puede estar vacío"}), 400
+    if len(body[ids_field]) > MAX_BULK_ASSOCIATIONS:
+        return jsonify({"message": f"Máximo {MAX_BULK_ASSOCIATIONS} elementos por petición"}), 400
+
+    try:
+        trip_id = uuid.UUID(str(body["trip_id"]))
+        item_ids = [uuid.UUID(str(item_id)) for item_id in body[ids_field]]
+    except ValueError:
+        return jsonify({"message": "Formato de UUID inválido"}), 400
+
+    connection = get_db_connection()
+    if not connection:
+        return jsonify({"message": "Error de conexión con la base de datos"}), 500
+
+    cursor = connection.cursor()
+    try:
+        rows = attach_to_trip(cursor, kind, trip_id, item_ids)
+        connection.commit()
+        if kind == 'activities':
+            invalidate_cache('trip_activities', f"/trips/{trip_id}/")
+
+        attached = [str(row['item_id']) for row in rows if row['association_id']]
+        already_attached = [str(row['item_id']) for row in rows if not row['association_id'] and row['item_exists']]
+        not_found = [str(row['item_id']) for row in rows if not row['item_exists']]
+        return jsonify({
+            "trip_id": str(trip_id),
+            "attached": attached,
+            "already_attached": already_attached,
+            "not_found": not_found
+        }), 201 if attached else 200
+
+    except psycopg2.errors.ForeignKeyViolation:
+        connection.rollback()
+        return jsonify({"message": "El viaje no existe"}), 404
+    except Exception as e:
+        connection.rollback()
+        logging.error(f"Error en asociación masiva de {kind}: {str(e)}")
+        return jsonify({"message": "Error del servidor"}), 500
+    finally:
+        cursor.close()
+        connection.close()
+
+
 @app.route('/activity-trips', methods=['POST'])
 def associate_activity_trip():
     try:
@@ -860,39 +2274,30 @@ def associate_activity_trip():
             
         cursor = connection.cursor()
         
-        try:
-            # Verificar existencia de los IDs en sus tablas
-            cursor.execute("SELECT 1 FROM activities WHERE id = %s", (str(activity_id),))
-            if not cursor.fetchone():
-                return jsonify({"message": "La actividad no existe"}), 404
-                
-            cursor.execute("SELECT 1 FROM trips WHERE id = %s", (str(trip_id),))
-            if not cursor.fetchone():
-                return jsonify({"message": "El viaje no existe"}), 404
-            
-            # Verificar relación existente
-            cursor.execute("""
-                SELECT 1 FROM activity_trips 
-                WHERE activity_id = %s AND trip_id = %s
-            """, (str(activity_id), str(trip_id)))
-            
-            if cursor.fetchone():
+        try:
+            # Una sola sentencia: valida la actividad, respeta la relación existente
+            # y deja que la FK de trips detecte el viaje inexistente
+            row = attach_to_trip(cursor, 'activities', trip_id, [activity_id])[0]
+            if not row['item_exists']:
+                return jsonify({"message": "La actividad no existe"}), 404
+            if not row['association_id']:
                 return jsonify({"message": "La relación ya existe"}), 409
-                
-            # Insertar nueva relación
-            cursor.execute("""
-                INSERT INTO activity_trips (activity_id, trip_id)
-                VALUES (%s, %s)
-            """, (str(activity_id), str(trip_id)))
             
             connection.commit()
+            invalidate_cache('trip_activities', f"/trips/{trip_id}/")
             return jsonify({"message": "Relación creada exitosamente"}), 201
             
+        except psycopg2.errors.ForeignKeyViolation:
+            connection.rollback()
+            return jsonify({"message": "El viaje no existe"}), 404
+            
         except psycopg2.IntegrityError as e:
+            connection.rollback()
             logging.error(f"Error de integridad: {str(e)}")
             return jsonify({"message": "Error en relaciones de base de datos"}), 400
             
         except Exception as e:
+            connection.rollback()
             logging.error(f"Error interno: {str(e)}")
             return jsonify({"message": "Error del servidor"}), 500
             
@@ -904,6 +2309,11 @@ def associate_activity_trip():
         logging.error(f"Error general: {str(e)}")
         return jsonify({"message": "Error procesando la solicitud"}), 500
 
+@app.route('/activity-trips/bulk', methods=['POST'])
+def associate_activities_trip_bulk():
+    """Asocia varias actividades a un viaje en una sola petición"""
+    return bulk_attach_to_trip('activities', 'activity_ids')
+
 @app.route('/trips/<trip_id>/status', methods=['GET'])
 def get_trip_status(trip_id):
     connection = None
@@ -950,6 +2360,7 @@ def get_trip_status(trip_id):
             connection.close()
 
 @app.route('/trips/<trip_id>/activities', methods=['GET'])
+@cached_response('trip_activities', ttl=60)
 def get_trip_activities(trip_id):
     connection = get_db_connection()
     if not connection:
@@ -1048,6 +2459,7 @@ def update_reservation_status(trip_id, user_id):
             return jsonify({"message": "Reserva no encontrada"}), 404
 
         connection.commit()
+        invalidate_explorer_dashboard(user_id)
         return jsonify({"message": "Estado de la reserva actualizado exitosamente"}), 200
 
     except Exception as e:
@@ -1059,6 +2471,7 @@ def update_reservation_status(trip_id, user_id):
         connection.close()
 
 @app.route('/activitycategory', methods=['GET'])  
+@cached_response('activity_categories')
 def get_activity_categories():  
     """Obtiene todas las categorías de actividades"""  
     connection = get_db_connection()  
@@ -1081,6 +2494,8 @@ def get_activity_categories():
         cursor.close()
         connection.close()
 
+LOCATION_SORT_COLUMNS = ('id', 'place_name', 'place_type', 'country', 'province', 'nearest_city')
+
 @app.route('/locations', methods=['GET'])
 def get_locations():
     connection = get_db_connection()
@@ -1095,13 +2510,21 @@ def get_locations():
         province = request.args.get('province', '').lower()
         place_name = request.args.get('place_name', '').lower()
         
-        # Parámetros de paginación
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 10))
+        # Parámetros de paginación: ?limit=&after= (keyset); ?page= se mantiene por compatibilidad
+        try:
+            per_page = int(request.args.get('limit', request.args.get('per_page', 10)))
+            page = int(request.args.get('page', 1))
+            after = decode_cursor(request.args['after']) if request.args.get('after') else None
+        except ValueError as e:
+            return jsonify({"message": f"Parámetros de paginación inválidos: {str(e)}"}), 400
+        per_page = max(1, min(per_page, MAX_PAGE_LIMIT))
+        use_offset = after is None and page > 1
         offset = (page - 1) * per_page
         
-        # Parámetros de ordenamiento
+        # Parámetros de ordenamiento (solo columnas conocidas; id desempata el keyset)
         sort_by = request.args.get('sort_by', 'id')
+        if sort_by not in LOCATION_SORT_COLUMNS:
+            sort_by = 'id'
         order = request.args.get('order', 'asc').upper()
         if order not in ['ASC', 'DESC']:
             order = 'ASC'
@@ -1133,35 +2556,86 @@ def get_locations():
             conditions.append("LOWER(place_name) LIKE %s")
             params.append(f"%{place_name}%")
 
+        filter_conditions = list(conditions)
+        filter_params = list(params)
+
+        # Keyset: continuar después de la última fila de la página anterior
+        comparator = '>' if order == 'ASC' else '<'
+        if after and len(after) != (1 if sort_by == 'id' else 2):
+            return jsonify({"message": "El cursor no corresponde al ordenamiento solicitado"}), 400
+        if after:
+            if sort_by == 'id':
+                conditions.append(f"id {comparator} %s")
+                params.append(after[0])
+            else:
+                conditions.append(f"({sort_by}, id) {comparator} (%s, %s)")
+                params.extend(after)
+
+        # Modo de conteo: exact (COUNT(*) OVER() en la misma consulta),
+        # estimate (estadísticas del planificador, por defecto) o none
+        count_mode = request.args.get('count', 'estimate').lower()
+        if count_mode not in ('exact', 'estimate', 'none'):
+            return jsonify({"message": "El parámetro count debe ser exact, estimate o none"}), 400
+
         # Ensamblar consulta
-        if conditions:
+        if count_mode == 'exact':
+            # El total se calcula sobre los filtros, antes de aplicar el cursor
+            base_query = "SELECT *, COUNT(*) OVER() AS total_count FROM locations"
+            if filter_conditions:
+                base_query += " WHERE " + " AND ".join(filter_conditions)
+            base_query = f"SELECT * FROM ({base_query}) AS filtered"
+            keyset_conditions = conditions[len(filter_conditions):]
+            if keyset_conditions:
+                base_query += " WHERE " + " AND ".join(keyset_conditions)
+        elif conditions:
             base_query += " WHERE " + " AND ".join(conditions)
             
         # Ordenamiento
-        base_query += f" ORDER BY {sort_by} {order}"
+        if sort_by == 'id':
+            base_query += f" ORDER BY id {order}"
+        else:
+            base_query += f" ORDER BY {sort_by} {order}, id {order}"
         
         # Paginación
-        base_query += " LIMIT %s OFFSET %s"
-        params.extend([per_page, offset])
+        base_query += " LIMIT %s"
+        params.append(per_page + 1)
+        if use_offset:
+            base_query += " OFFSET %s"
+            params.append(offset)
 
         # Ejecutar consulta
         cursor.execute(base_query, params)
-        locations = cursor.fetchall()
+        if sort_by == 'id':
+            page_key = lambda row: [row['id']]
+        else:
+            page_key = lambda row: [row[sort_by], row['id']]
+        locations, next_cursor = split_page(cursor.fetchall(), per_page, page_key)
+        locations = [dict(row) for row in locations]
         
         # Obtener total para paginación
-        count_query = "SELECT COUNT(*) FROM locations"
-        if conditions:
-            count_query += " WHERE " + " AND ".join(conditions)
-        cursor.execute(count_query, params[:-2])  # Excluir LIMIT y OFFSET
-        total = cursor.fetchone()[0]
+        total = None
+        if count_mode == 'exact':
+            for row in locations:
+                total = row.pop('total_count')
+            if total is None:
+                # Página vacía (cursor al final): no hay filas de donde leer el total
+                count_query = "SELECT COUNT(*) FROM locations"
+                if filter_conditions:
+                    count_query += " WHERE " + " AND ".join(filter_conditions)
+                cursor.execute(count_query, filter_params)
+                total = cursor.fetchone()[0]
+        elif count_mode == 'estimate':
+            total = estimate_row_count(cursor, 'locations', filter_conditions, filter_params)
 
         return jsonify({
-            "locations": [dict(row) for row in locations],
+            "locations": locations,
             "pagination": {
                 "total": total,
+                "total_is_estimate": count_mode == 'estimate',
                 "page": page,
                 "per_page": per_page,
-                "total_pages": (total + per_page - 1) // per_page
+                "total_pages": (total + per_page - 1) // per_page if total is not None else None,
+                "next_cursor": next_cursor
             }
         }), 200
 
@@ -1172,6 +2646,211 @@ def get_locations():
         cursor.close()
         connection.close()
         
+# Las expresiones deben coincidir con los índices de migrations/0001_search_indexes.sql
+SEARCH_QUERY = """
+    WITH q AS (
+        SELECT plainto_tsquery('simple', %(term)s) AS loc_tsq,
+               plainto_tsquery('spanish', %(term)s) AS act_tsq,
+               lower(%(term)s) AS term
+    )
+    SELECT * FROM (
+        SELECT
+            'location' AS type,
+            l.id,
+            l.place_name AS title,
+            l.province || ', ' || l.country AS subtitle,
+            l.location_image_url AS image_url,
+            (ts_rank(to_tsvector('simple', l.place_name || ' ' || l.country || ' ' || l.province || ' ' || l.nearest_city), q.loc_tsq)
+             + similarity(lower(l.place_name), q.term))::float8 AS score
+        FROM locations l, q
+        WHERE to_tsvector('simple', l.place_name || ' ' || l.country || ' ' || l.province || ' ' || l.nearest_city) @@ q.loc_tsq
+           OR lower(l.place_name) %% q.term
+        UNION ALL
+        SELECT
+            'activity' AS type,
+            a.id,
+            a.name AS title,
+            a.description AS subtitle,
+            a.activity_image_url AS image_url,
+            (ts_rank(to_tsvector('spanish', a.name || ' ' || a.description), q.act_tsq)
+             + similarity(lower(a.name), q.term))::float8 AS score
+        FROM activities a, q
+        WHERE to_tsvector('spanish', a.name || ' ' || a.description) @@ q.act_tsq
+           OR lower(a.name) %% q.term
+    ) AS hits
+"""
+
+@app.route('/search', methods=['GET'])
+def search():
+    """Búsqueda ordenada por relevancia sobre ubicaciones y actividades"""
+    term = request.args.get('q', '').strip()
+    if not term:
+        return jsonify({"message": "El parámetro q es requerido"}), 400
+
+    types = request.args.get('type')
+    if types and types not in ('location', 'activity'):
+        return jsonify({"message": "El parámetro type debe ser location o activity"}), 400
+
+    try:
+        limit, after = get_page_args(default_limit=20)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    if after:
+        try:
+            after[0] = float(after[0])
+        except (TypeError, ValueError, IndexError):
+            return jsonify({"message": "Cursor inválido"}), 400
+        if len(after) != 3:
+            return jsonify({"message": "Cursor inválido"}), 400
+
+    connection = get_db_connection()
+    if not connection:
+        return jsonify({"message": "Error de conexión con la base de datos"}), 500
+
+    cursor = connection.cursor()
+    try:
+        query = SEARCH_QUERY
+        params = {"term": term, "limit": limit + 1}
+        conditions = []
+        if types:
+            conditions.append("type = %(type)s")
+            params["type"] = types
+        if after:
+            # Keyset descendente sobre (score, type, id)
+            conditions.append("(score, type, id) < (%(after_score)s, %(after_type)s, %(after_id)s)")
+            params.update(after_score=after[0], after_type=after[1], after_id=after[2])
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY score DESC, type DESC, id DESC LIMIT %(limit)s"
+
+        cursor.execute(query, params)
+        hits, next_cursor = split_page(
+            cursor.fetchall(), limit, lambda row: [row['score'], row['type'], row['id']]
+        )
+
+        return jsonify({
+            "query": term,
+            "results": [dict(hit, id=str(hit['id'])) for hit in hits],
+            "next_cursor": next_cursor
+        }), 200
+    except Exception as e:
+        logging.error(f"Error en la búsqueda: {e}")
+        return jsonify({"message": "Error al realizar la búsqueda"}), 500
+    finally:
+        cursor.close()
+        connection.close()
+
+# Radio medio de la Tierra y kilómetros por grado de latitud
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.045
+# Candidatos k-NN por resultado: <-> mide en grados, no en km, así que se toman
+# más candidatos de los pedidos y se reordenan por distancia real
+NEARBY_CANDIDATE_FACTOR = 4
+
+NEARBY_QUERY = """
+    SELECT
+        c.id,
+        c.place_name,
+        c.place_type,
+        c.country,
+        c.province,
+        c.nearest_city,
+        c.location_image_url,
+        c.coordinates[0] AS lat,
+        c.coordinates[1] AS lng,
+        c.distance_km,
+        COALESCE(acts.activities, '[]'::json) AS activities
+    FROM (
+        SELECT l.*,
+            %(earth_radius)s * 2 * asin(sqrt(
+                power(sin(radians(l.coordinates[0] - %(lat)s) / 2), 2)
+                + cos(radians(%(lat)s)) * cos(radians(l.coordinates[0]))
+                * power(sin(radians(l.coordinates[1] - %(lng)s) / 2), 2)
+            )) AS distance_km
+        FROM (
+            SELECT * FROM locations
+            WHERE coordinates <@ box(point(%(min_lat)s, %(min_lng)s), point(%(max_lat)s, %(max_lng)s))
+            ORDER BY coordinates <-> point(%(lat)s, %(lng)s)
+            LIMIT %(candidates)s
+        ) AS l
+    ) AS c
+    LEFT JOIN LATERAL (
+        SELECT json_agg(json_build_object(
+            'id', a.id,
+            'name', a.name,
+            'difficulty', a.difficulty,
+            'duration', a.duration,
+            'cost', a.cost,
+            'is_available', a.is_available,
+            'activity_image_url', a.activity_image_url
+        ) ORDER BY a.name) AS activities
+        FROM activities a
+        WHERE a.location_id = c.id AND a.is_public
+    ) AS acts ON TRUE
+    WHERE c.distance_km <= %(radius_km)s
+    ORDER BY c.distance_km
+    LIMIT %(limit)s
+"""
+
+@app.route('/locations/nearby', methods=['GET'])
+def get_nearby_locations():
+    """Ubicaciones más cercanas a un punto, con sus actividades"""
+    try:
+        lat = float(request.args['lat'])
+        lng = float(request.args['lng'])
+        radius_km = float(request.args.get('radius_km', 50))
+        limit = int(request.args.get('limit', 20))
+    except KeyError:
+        return jsonify({"message": "Los parámetros lat y lng son requeridos"}), 400
+    except ValueError:
+        return jsonify({"message": "lat, lng, radius_km y limit deben ser numéricos"}), 400
+
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return jsonify({"message": "Coordenadas fuera de rango"}), 400
+    if radius_km <= 0 or limit < 1:
+        return jsonify({"message": "radius_km y limit deben ser mayores que 0"}), 400
+    radius_km = min(radius_km, 1000)
+    limit = min(limit, 100)
+
+    # Caja que contiene el círculo de búsqueda; la filtra el índice GiST
+    delta_lat = radius_km / KM_PER_DEGREE
+    delta_lng = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+
+    connection = get_db_connection()
+    if not connection:
+        return jsonify({"message": "Error de conexión con la base de datos"}), 500
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute(NEARBY_QUERY, {
+            "lat": lat,
+            "lng": lng,
+            "min_lat": lat - delta_lat,
+            "max_lat": lat + delta_lat,
+            "min_lng": lng - delta_lng,
+            "max_lng": lng + delta_lng,
+            "radius_km": radius_km,
+            "earth_radius": EARTH_RADIUS_KM,
+            "candidates": limit * NEARBY_CANDIDATE_FACTOR,
+            "limit": limit,
+        })
+        locations = cursor.fetchall()
+
+        return jsonify({
+            "center": {"lat": lat, "lng": lng},
+            "radius_km": radius_km,
+            "locations": [
+                dict(location, id=str(location['id']), distance_km=round(location['distance_km'], 2))
+                for location in locations
+            ]
+        }), 200
+    except Exception as e:
+        logging.error(f"Error al obtener ubicaciones cercanas: {e}")
+        return jsonify({"message": "Error al obtener ubicaciones cercanas"}), 500
+    finally:
+        cursor.close()
+        connection.close()
+
 # Endpoint para obtener las ubicaciones de un viaje específico
 @app.route('/trips/<uuid:trip_id>/locations', methods=['GET'])
 def get_trip_locations(trip_id):
@@ -1196,6 +2875,104 @@ def get_trip_locations(trip_id):
         cursor.close()
         connection.close()
 
+# Secciones de GET /trips/<id>/full; cada una es una subconsulta correlacionada
+# sobre el viaje `t`, así que el documento completo sale de una sola sentencia.
+TRIP_FULL_SECTIONS = {
+    'activities': """
+        SELECT COALESCE(jsonb_agg(
+                   to_jsonb(a) || jsonb_build_object('location', to_jsonb(lo))
+                   ORDER BY a.name), '[]'::jsonb)
+        FROM activity_trips at
+        JOIN activities a ON a.id = at.activity_id
+        JOIN locations lo ON lo.id = a.location_id
+        WHERE at.trip_id = t.id
+    """,
+    'resources': """
+        SELECT COALESCE(jsonb_agg(
+                   to_jsonb(r) || jsonb_build_object('association_id', tr.id)
+                   ORDER BY r.name), '[]'::jsonb)
+        FROM trip_resources tr
+        JOIN resources r ON r.id = tr.resource_id
+        WHERE tr.trip_id = t.id
+    """,
+    'roster': """
+        SELECT COALESCE(jsonb_agg(jsonb_build_object(
+                   'id', u.id,
+                   'name', CONCAT(u.first_name, ' ', u.last_name),
+                   'email', u.email,
+                   'phone', u.phone_number,
+                   'reservation_id', res.id,
+                   'reservation_status', res.status,
+                   'payment_status', p.payment_status,
+                   'payment_amount', p.payment_amount,
+                   'payment_date', p.payment_date
+               ) ORDER BY u.last_name, u.first_name), '[]'::jsonb)
+        FROM reservations res
+        JOIN users u ON u.id = res.user_id
+        LEFT JOIN LATERAL (
+            SELECT payment_status, payment_amount, payment_date
+            FROM payments
+            WHERE payments.trip_id = res.trip_id AND payments.user_id = res.user_id
+            ORDER BY payment_date DESC NULLS LAST
+            LIMIT 1
+        ) p ON true
+        WHERE res.trip_id = t.id
+    """,
+    'rating': """
+        -- MAX() sobre la fila por clave primaria: siempre devuelve una fila, aunque no haya agregados
+        SELECT jsonb_build_object(
+                   'average_rating', COALESCE(ROUND(MAX(trs.rating_sum) / NULLIF(MAX(trs.rating_count), 0), 1), 0),
+                   'rating_count', COALESCE(MAX(trs.rating_count), 0))
+        FROM trip_rating_stats trs
+        WHERE trs.trip_id = t.id
+    """,
+}
+
+
+def trip_full_query(sections):
+    """Arma la consulta de /trips/<id>/full solo con las secciones pedidas"""
+    columns = ["to_jsonb(t) AS trip"]
+    columns += [f"({TRIP_FULL_SECTIONS[name]}) AS {name}" for name in sections]
+    return f"SELECT {', '.join(columns)} FROM trips t WHERE t.id = %s"
+
+
+@app.route('/trips/<uuid:trip_id>/full', methods=['GET'])
+def get_trip_full(trip_id):
+    """Viaje con actividades (y su ubicación), recursos, participantes con estado de pago y calificación.
+
+    ?include=activities,roster limita la respuesta a esas secciones.
+    """
+    include = request.args.get('include')
+    if include:
+        sections = [name.strip() for name in include.split(',') if name.strip()]
+        unknown = [name for name in sections if name not in TRIP_FULL_SECTIONS]
+        if unknown:
+            return jsonify({
+                "message": f"Secciones no válidas: {', '.join(unknown)}. "
+                           f"Opciones: {', '.join(TRIP_FULL_SECTIONS)}"
+            }), 400
+        sections = list(dict.fromkeys(sections))
+    else:
+        sections = list(TRIP_FULL_SECTIONS)
+
+    connection = get_db_connection()
+    if not connection:
+        return jsonify({"message": "Error de conexión con la base de datos"}), 500
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute(trip_full_query(sections), (str(trip_id),))
+        trip = cursor.fetchone()
+        if not trip:
+            return jsonify({"message": "Viaje no encontrado"}), 404
+        return jsonify(trip), 200
+    except Exception as e:
+        logging.error(f"Error al obtener el detalle completo del viaje {trip_id}: {str(e)}")
+        return jsonify({"message": "Error al obtener el viaje"}), 500
+    finally:
+        cursor.close()
+        connection.close()
+
 # Endpoint para obtener el próximo viaje según el rol del usuario
 @app.route('/next-trip/<uuid:user_id>/<string:role>', methods=['GET'])
 def get_next_trip(user_id, role):
@@ -1237,6 +3014,141 @@ def get_next_trip(user_id, role):
         cursor.close()
         connection.close()
 
+# Modelo de lectura ranger_stats (migrations/0004_ranger_stats.sql)
+RANGER_STATS_REFRESH_SQL = """
+    INSERT INTO ranger_stats (
+        ranger_id, trips_led, review_count, rating_sum, rating_count, last_trip_date, updated_at
+    )
+    SELECT r.id,
+           COUNT(DISTINCT t.id),
+           COUNT(rc.id) FILTER (WHERE NULLIF(btrim(rc.user_comment), '') IS NOT NULL),
+           COALESCE(SUM(rc.calification), 0),
+           COUNT(rc.id),
+           MAX(t.start_date),
+           CURRENT_TIMESTAMP
+    FROM {rangers} AS r(id)
+    LEFT JOIN trips t ON t.lead_ranger = r.id
+    LEFT JOIN ranger_califications rc ON rc.trip_id = t.id
+    GROUP BY r.id
+    ON CONFLICT (ranger_id) DO UPDATE SET
+        trips_led = EXCLUDED.trips_led,
+        review_count = EXCLUDED.review_count,
+        rating_sum = EXCLUDED.rating_sum,
+        rating_count = EXCLUDED.rating_count,
+        last_trip_date = EXCLUDED.last_trip_date,
+        updated_at = EXCLUDED.updated_at
+"""
+
+
+def has_review(comment):
+    """Una calificación cuenta como reseña si trae comentario"""
+    return bool(comment and str(comment).strip())
+
+
+def record_trip_led(cursor, ranger_id, start_date):
+    """Suma un viaje recién creado a las estadísticas de su ranger"""
+    if not ranger_id:
+        return
+    cursor.execute("""
+        INSERT INTO ranger_stats (ranger_id, trips_led, last_trip_date)
+        VALUES (%s, 1, %s)
+        ON CONFLICT (ranger_id) DO UPDATE SET
+            trips_led = ranger_stats.trips_led + 1,
+            last_trip_date = GREATEST(ranger_stats.last_trip_date, EXCLUDED.last_trip_date),
+            updated_at = CURRENT_TIMESTAMP
+    """, (ranger_id, start_date))
+
+
+def refresh_ranger_stats(cursor, *ranger_ids):
+    """Recalcula las estadísticas de los rangers indicados (tras editar o borrar viajes)"""
+    ranger_ids = sorted({str(ranger_id) for ranger_id in ranger_ids if ranger_id})
+    if ranger_ids:
+        cursor.execute(
+            RANGER_STATS_REFRESH_SQL.format(rangers="unnest(%s::uuid[])"),
+            (ranger_ids,)
+        )
+
+
+def apply_rating_delta(cursor, trip_id, rating_delta, count_delta, review_delta):
+    """Aplica el cambio de una calificación al viaje y al ranger que lo lidera, en una sola sentencia"""
+    cursor.execute("""
+        WITH trip_totals AS (
+            INSERT INTO trip_rating_stats (trip_id, rating_sum, rating_count)
+            VALUES (%(trip_id)s, %(rating_delta)s, %(count_delta)s)
+            ON CONFLICT (trip_id) DO UPDATE SET
+                rating_sum = trip_rating_stats.rating_sum + EXCLUDED.rating_sum,
+                rating_count = trip_rating_stats.rating_count + EXCLUDED.rating_count,
+                updated_at = CURRENT_TIMESTAMP
+        )
+        INSERT INTO ranger_stats (ranger_id, rating_sum, rating_count, review_count)
+        SELECT lead_ranger, %(rating_delta)s, %(count_delta)s, %(review_delta)s FROM trips
+        WHERE id = %(trip_id)s AND lead_ranger IS NOT NULL
+        ON CONFLICT (ranger_id) DO UPDATE SET
+            rating_sum = ranger_stats.rating_sum + EXCLUDED.rating_sum,
+            rating_count = ranger_stats.rating_count + EXCLUDED.rating_count,
+            review_count = ranger_stats.review_count + EXCLUDED.review_count,
+            updated_at = CURRENT_TIMESTAMP
+    """, {
+        "trip_id": str(trip_id),
+        "rating_delta": rating_delta,
+        "count_delta": count_delta,
+        "review_delta": review_delta,
+    })
+
+
+# Agregados esperados (recálculo completo) frente a los guardados
+RATING_DRIFT_SQL = """
+    SELECT 'trip' AS scope,
+           COALESCE(a.id, s.trip_id) AS id,
+           COALESCE(a.rating_sum, 0) AS expected_sum,
+           COALESCE(a.rating_count, 0) AS expected_count,
+           COALESCE(s.rating_sum, 0) AS stored_sum,
+           COALESCE(s.rating_count, 0) AS stored_count
+    FROM (
+        SELECT trip_id AS id, SUM(calification) AS rating_sum, COUNT(*) AS rating_count
+        FROM ranger_califications
+        GROUP BY trip_id
+    ) a
+    FULL JOIN trip_rating_stats s ON s.trip_id = a.id
+    WHERE COALESCE(a.rating_sum, 0) <> COALESCE(s.rating_sum, 0)
+       OR COALESCE(a.rating_count, 0) <> COALESCE(s.rating_count, 0)
+    UNION ALL
+    SELECT 'ranger',
+           COALESCE(a.id, s.ranger_id),
+           COALESCE(a.rating_sum, 0),
+           COALESCE(a.rating_count, 0),
+           COALESCE(s.rating_sum, 0),
+           COALESCE(s.rating_count, 0)
+    FROM (
+        SELECT t.lead_ranger AS id, SUM(rc.calification) AS rating_sum, COUNT(*) AS rating_count
+        FROM ranger_califications rc
+        JOIN trips t ON t.id = rc.trip_id
+        WHERE t.lead_ranger IS NOT NULL
+        GROUP BY t.lead_ranger
+    ) a
+    FULL JOIN ranger_stats s ON s.ranger_id = a.id
+    WHERE COALESCE(a.rating_sum, 0) <> COALESCE(s.rating_sum, 0)
+       OR COALESCE(a.rating_count, 0) <> COALESCE(s.rating_count, 0)
+"""
+
+
+def refresh_trip_rating_stats(cursor, trip_ids):
+    """Recalcula desde cero los agregados de calificación de los viajes indicados"""
+    if trip_ids:
+        cursor.execute("""
+            INSERT INTO trip_rating_stats (trip_id, rating_sum, rating_count, updated_at)
+            SELECT t.id, COALESCE(SUM(rc.calification), 0), COUNT(rc.id), CURRENT_TIMESTAMP
+            FROM trips t
+            LEFT JOIN ranger_califications rc ON rc.trip_id = t.id
+            WHERE t.id = ANY(%s::uuid[])
+            GROUP BY t.id
+            ON CONFLICT (trip_id) DO UPDATE SET
+                rating_sum = EXCLUDED.rating_sum,
+                rating_count = EXCLUDED.rating_count,
+                updated_at = EXCLUDED.updated_at
+        """, (sorted(str(trip_id) for trip_id in trip_ids),))
+
+
 @app.route('/trips', methods=['POST'])
 def create_or_update_trip():
     connection = get_db_connection()
@@ -1318,8 +3230,9 @@ def create_or_update_trip():
                     total_cost = %s,
                     trip_image_url = %s,
                     lead_ranger = %s
-                WHERE id = %s
-                RETURNING id
+                FROM (SELECT id, lead_ranger FROM trips WHERE id = %s FOR UPDATE) AS previous
+                WHERE trips.id = previous.id
+                RETURNING trips.id, trips.lead_ranger, previous.lead_ranger AS previous_ranger
             """, (
                 body.get("trip_name"),
                 body.get("start_date"),
@@ -1340,8 +3253,10 @@ def create_or_update_trip():
                     "message": f"No se encontró un viaje con ID {trip_id}",
                     "error": "trip_not_found"
                 }), 404
+            refresh_ranger_stats(cursor, result["lead_ranger"], result["previous_ranger"])
                 
             connection.commit()
+            invalidate_cache('rangers')
             
             return jsonify({
                 "message": "Viaje actualizado exitosamente",
@@ -1372,7 +3287,9 @@ def create_or_update_trip():
 
             trip_row = cursor.fetchone()
             new_trip_id = trip_row["id"]
+            record_trip_led(cursor, body.get("lead_ranger"), body.get("start_date"))
             connection.commit()
+            invalidate_cache('rangers')
             
             return jsonify({
                 "message": "Viaje creado exitosamente",
@@ -1398,13 +3315,181 @@ def create_or_update_trip():
         if connection:
             connection.close()
         
+# Campos de trips que se pueden crear/actualizar desde la API
+TRIP_FIELDS = [
+    'trip_name', 'start_date', 'end_date', 'max_participants_number',
+    'trip_status', 'estimated_weather_forecast', 'description',
+    'total_cost', 'trip_image_url', 'lead_ranger'
+]
+
+# Mensajes 404 para las FK que puede violar el armado de un itinerario
+ITINERARY_FK_MESSAGES = {
+    'activity_id': "Alguna de las actividades no existe",
+    'resource_id': "Alguno de los recursos no existe",
+    'lead_ranger': "El ranger indicado no existe",
+}
+
+
+@app.route('/trips/bulk', methods=['POST'])
+def save_trip_itinerary():
+    """Crea o actualiza un viaje junto con sus actividades y recursos en una sola transacción"""
+    body = request.get_json(silent=True)
+    if not body:
+        return jsonify({"message": "No se proporcionaron datos"}), 400
+
+    trip_id = body.get('id')
+    activity_ids = body.get('activity_ids', [])
+    resource_ids = body.get('resource_ids', [])
+    # replace=true deja el viaje exactamente con las listas enviadas
+    replace = bool(body.get('replace', False))
+
+    if not isinstance(activity_ids, list) or not isinstance(resource_ids, list):
+        return jsonify({"message": "activity_ids y resource_ids deben ser listas"}), 400
+    if len(activity_ids) + len(resource_ids) > MAX_BULK_ASSOCIATIONS:
+        return jsonify({"message": f"Máximo {MAX_BULK_ASSOCIATIONS} asociaciones por petición"}), 400
+    try:
+        trip_id = str(uuid.UUID(str(trip_id))) if trip_id else None
+        activity_ids = list(dict.fromkeys(str(uuid.UUID(str(a))) for a in activity_ids))
+        resource_ids = list(dict.fromkeys(str(uuid.UUID(str(r))) for r in resource_ids))
+    except ValueError:
+        return jsonify({"message": "Formato de UUID inválido"}), 400
+
+    if not trip_id:
+        for field in ['trip_name', 'lead_ranger', 'start_date', 'end_date']:
+            if field not in body:
+                return jsonify({
+                    "message": f"Campo requerido faltante: {field}",
+                    "missing_field": field
+                }), 400
+
+    connection = get_db_connection()
+    if not connection:
+        return jsonify({"message": "Error de conexión con la base de datos"}), 500
+
+    cursor = connection.cursor()
+    try:
+        # 1. Viaje
+        if trip_id:
+            fields = [field for field in TRIP_FIELDS if field in body]
+            assignments = [f"{field} = %s" for field in fields] + ["updated_at = CURRENT_TIMESTAMP"]
+            cursor.execute(f"""
+                UPDATE trips SET {', '.join(assignments)}
+                FROM (SELECT id, lead_ranger FROM trips WHERE id = %s FOR UPDATE) AS previous
+                WHERE trips.id = previous.id
+                RETURNING trips.id, trips.lead_ranger, previous.lead_ranger AS previous_ranger
+            """, [body[field] for field in fields] + [trip_id])
+            updated = cursor.fetchone()
+            if not updated:
+                return jsonify({
+                    "message": f"No se encontró un viaje con ID {trip_id}",
+                    "error": "trip_not_found"
+                }), 404
+            if 'lead_ranger' in fields or 'start_date' in fields:
+                refresh_ranger_stats(cursor, updated["lead_ranger"], updated["previous_ranger"])
+            created = False
+        else:
+            cursor.execute("""
+                INSERT INTO trips (
+                    trip_name, start_date, end_date, max_participants_number,
+                    trip_status, estimated_weather_forecast, description,
+                    total_cost, trip_image_url, lead_ranger
+                )
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING id
+            """, (
+                body.get("trip_name"),
+                body.get("start_date"),
+                body.get("end_date"),
+                body.get("max_participants_number", 0),
+                body.get("trip_status", "pending"),
+                body.get("estimated_weather_forecast", ""),
+                body.get("description", ""),
+                body.get("total_cost", 0),
+                body.get("trip_image_url", ""),
+                body.get("lead_ranger")
+            ))
+            trip_id = str(cursor.fetchone()["id"])
+            record_trip_led(cursor, body.get("lead_ranger"), body.get("start_date"))
+            created = True
+
+        # 2. Quitar asociaciones que ya no forman parte del itinerario
+        removed = {"activities": 0, "resources": 0}
+        if replace and not created:
+            cursor.execute(
+                "DELETE FROM activity_trips WHERE trip_id = %s AND activity_id <> ALL(%s::uuid[])",
+                (trip_id, activity_ids)
+            )
+            removed["activities"] = cursor.rowcount
+            cursor.execute(
+                "DELETE FROM trip_resources WHERE trip_id = %s AND resource_id <> ALL(%s::uuid[])",
+                (trip_id, resource_ids)
+            )
+            removed["resources"] = cursor.rowcount
+
+        # 3. Inserciones por lotes; las existentes se ignoran
+        attached = {"activities": [], "resources": []}
+        if activity_ids:
+            rows = execute_values(cursor, """
+                INSERT INTO activity_trips (activity_id, trip_id) VALUES %s
+                ON CONFLICT (activity_id, trip_id) DO NOTHING
+                RETURNING activity_id
+            """, [(activity_id, trip_id) for activity_id in activity_ids],
+                template="(%s::uuid, %s::uuid)", page_size=len(activity_ids), fetch=True)
+            attached["activities"] = [str(row["activity_id"]) for row in rows]
+        if resource_ids:
+            rows = execute_values(cursor, """
+                INSERT INTO trip_resources (resource_id, trip_id) VALUES %s
+                ON CONFLICT (trip_id, resource_id) DO NOTHING
+                RETURNING resource_id
+            """, [(resource_id, trip_id) for resource_id in resource_ids],
+                template="(%s::uuid, %s::uuid)", page_size=len(resource_ids), fetch=True)
+            attached["resources"] = [str(row["resource_id"]) for row in rows]
+
+        # 4. Un único commit para todo el itinerario
+        connection.commit()
+        invalidate_cache('trip_activities', f"/trips/{trip_id}/")
+        invalidate_cache('rangers')
+
+        return jsonify({
+            "message": "Viaje creado exitosamente" if created else "Viaje actualizado exitosamente",
+            "id": trip_id,
+            "attached": attached,
+            "removed": removed
+        }), 201 if created else 200
+
+    except psycopg2.errors.ForeignKeyViolation as e:
+        connection.rollback()
+        constraint = e.diag.constraint_name or ''
+        message = next(
+            (text for column, text in ITINERARY_FK_MESSAGES.items() if column in constraint),
+            "Referencia inválida en el itinerario"
+        )
+        return jsonify({"message": message, "details": e.diag.message_detail}), 404
+    except Exception as e:
+        connection.rollback()
+        logging.error(f"Error guardando itinerario: {str(e)}", exc_info=True)
+        return jsonify({
+            "message": "Error interno del servidor",
+            "error_details": str(e)
+        }), 500
+    finally:
+        cursor.close()
+        connection.close()
+
 @app.route('/rangers', methods=['GET'])
+@cached_response('rangers', ttl=60)
 def get_rangers():
     connection = get_db_connection()
     if not connection:
         return jsonify({"error": "Database connection failed"}), 500
 
     try:
+        try:
+            limit, after = get_page_args()
+            after = uuid_cursor(after)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
         cursor = connection.cursor(cursor_factory=RealDictCursor)
         
         # 1. Obtener ID del rol Ranger
@@ -1414,7 +3499,16 @@ def get_rangers():
         if not role or 'id' not in role:
             return jsonify({"error": "Rol Ranger no configurado"}), 404
 
-        # 2. Query mejorada con más información
+        # 2. Query mejorada con más información (paginada por u.id si se pide)
+        page_clause = ""
+        params = [role['id']]
+        if after:
+            page_clause += " AND u.id > %s"
+            params.append(after)
+        if limit is not None:
+            page_clause += " ORDER BY u.id LIMIT %s"
+            params.append(limit + 1)
+
         cursor.execute("""
             SELECT 
                 u.id, 
@@ -1431,15 +3525,17 @@ def get_rangers():
                 u.availability_end_date,
                 u.user_status,
                 u.biography_extend,
-                u.calification,
-                COUNT(rc.id) as trips
+                CASE WHEN rs.rating_count > 0 THEN rs.rating_sum / rs.rating_count
+                     ELSE u.calification END AS calification,
+                COALESCE(rs.trips_led, 0) as trips
             FROM users u
-            LEFT JOIN ranger_califications rc ON u.id = rc.user_id
-            WHERE u.role_id = %s
-            GROUP BY u.id
-        """, (role['id'],))
+            LEFT JOIN ranger_stats rs ON rs.ranger_id = u.id
+            WHERE u.role_id = %s""" + page_clause, params)
 
         rangers = cursor.fetchall()
+        next_cursor = None
+        if limit is not None:
+            rangers, next_cursor = split_page(rangers, limit, lambda row: [row['id']])
         formatted_rangers = []
         
         for r in rangers:
@@ -1478,7 +3574,9 @@ def get_rangers():
             
             formatted_rangers.append(ranger_info)
         
-        return jsonify({"rangers": formatted_rangers}), 200
+        if limit is None:
+            return jsonify({"rangers": formatted_rangers}), 200
+        return jsonify({"rangers": formatted_rangers, "next_cursor": next_cursor}), 200
 
     except Exception as e:
         import traceback
@@ -1491,19 +3589,36 @@ def get_rangers():
         
 @app.route('/trips', methods=['GET'])  
 def get_trips():
+    if wants_stream():
+        return stream_rows("SELECT * FROM trips")
+
     connection = get_db_connection()  
     if not connection:  
         return jsonify({"message": "Error de conexión con la base de datos"}), 500  
 
     cursor = connection.cursor()
     try:  
-        cursor.execute("SELECT * FROM trips")  
-        trips = cursor.fetchall()  
-
-        if not trips:  
-            return jsonify({"message": "No hay viajes disponibles"}), 404  
-
-        return jsonify({"trips": trips}), 200  
+        try:
+            limit, after = get_page_args()
+            after = uuid_cursor(after)
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+
+        if limit is None:
+            cursor.execute("SELECT * FROM trips")  
+            trips = cursor.fetchall()  
+            # Sin paginar se mantiene el 404 de la respuesta original
+            if not trips:  
+                return jsonify({"message": "No hay viajes disponibles"}), 404  
+            return jsonify({"trips": trips}), 200  
+
+        # Paginado, una página vacía (la primera o la siguiente a la última) es un 200 con lista vacía
+        if after:
+            cursor.execute("SELECT * FROM trips WHERE id > %s ORDER BY id LIMIT %s", (after, limit + 1))
+        else:
+            cursor.execute("SELECT * FROM trips ORDER BY id LIMIT %s", (limit + 1,))
+        trips, next_cursor = split_page(cursor.fetchall(), limit, lambda row: [row['id']])
+        return jsonify({"trips": trips, "next_cursor": next_cursor}), 200
     except Exception as e:  
         logging.error(f"Error al obtener viajes: {e}")  
         return jsonify({"message": "Error al obtener los viajes"}), 500  
@@ -1512,6 +3627,7 @@ def get_trips():
         connection.close()
         
 @app.route('/resources', methods=['GET']) 
+@cached_response('resources')
 def get_resources():  
     connection = get_db_connection()  
     if not connection:  
@@ -1519,13 +3635,29 @@ def get_resources():
 
     cursor = connection.cursor(cursor_factory=RealDictCursor)
     try:  
-        cursor.execute("SELECT * FROM resources")  
-        resources = cursor.fetchall()  
+        try:
+            limit, after = get_page_args()
+            after = uuid_cursor(after)
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+
+        if limit is None:
+            cursor.execute("SELECT * FROM resources")  
+            resources = cursor.fetchall()  
+            next_cursor = None
+        else:
+            if after:
+                cursor.execute("SELECT * FROM resources WHERE id > %s ORDER BY id LIMIT %s", (after, limit + 1))
+            else:
+                cursor.execute("SELECT * FROM resources ORDER BY id LIMIT %s", (limit + 1,))
+            resources, next_cursor = split_page(cursor.fetchall(), limit, lambda row: [row['id']])
 
         # Convertir UUID a strings
         resources_converted = [dict(resource, id=str(resource['id'])) for resource in resources]
 
-        return jsonify({"resources": resources_converted}), 200  
+        if limit is None:
+            return jsonify({"resources": resources_converted}), 200  
+        return jsonify({"resources": resources_converted, "next_cursor": next_cursor}), 200
     except Exception as e:  
         logging.error(f"Error al obtener recursos: {e}")  
         return jsonify({"message": "Error al obtener los recursos"}), 500  
@@ -1549,29 +3681,33 @@ def create_reservation():
             if field not in body:
                 return jsonify({"message": f"Campo requerido faltante: {field}"}), 400
 
-        # Insertar con todos los campos correctos
-        cursor.execute("""
-            INSERT INTO reservations (
-                trip_id, user_id, status
-            ) 
-            VALUES (%s, %s, %s)
-            RETURNING id
-        """, (
+        # Reclamar cupo e insertar la reserva atómicamente
+        run_query(cursor, "reservation_claim_seat", (
             body.get("trip_id"),
             body.get("user_id"),
             body.get("status")
         ))
 
         reservation_row = cursor.fetchone()
+        if not reservation_row:
+            connection.rollback()
+            if not run_query(cursor, "trip_exists", (body.get("trip_id"),)).fetchone():
+                return jsonify({"message": "El viaje no existe"}), 404
+            return jsonify({"message": "El viaje no tiene cupos disponibles"}), 409
         reservation_id = reservation_row["id"]
         connection.commit()
+        invalidate_explorer_dashboard(body.get("user_id"))
         
         return jsonify({
             "message": "Reserva creada exitosamente",
             "id": str(reservation_id)
         }), 201
 
+    except psycopg2.errors.ForeignKeyViolation:
+        connection.rollback()
+        return jsonify({"message": "El usuario no existe"}), 404
     except Exception as e:
+        connection.rollback()
         logging.error(f"Error en creación de reserva: {str(e)}")
         return jsonify({"message": "Error interno del servidor"}), 500
     finally:
@@ -1603,23 +3739,12 @@ def get_explorer_trips(user_id):
     try:
         cursor = connection.cursor()
         
-        # Paso 1: Obtener reservas del usuario
+        # Viajes reservados por el usuario (comparando uuid para usar la llave primaria)
         cursor.execute("""
-            SELECT trip_id FROM reservations 
-            WHERE user_id = %s::uuid
+            SELECT * FROM trips 
+            WHERE id IN (SELECT trip_id FROM reservations WHERE user_id = %s::uuid)
         """, (str(user_id),))
-        reservations = cursor.fetchall()
-        trip_ids = [str(r['trip_id']) for r in reservations]
-
-        # Paso 2: Obtener viajes relacionados
-        if trip_ids:
-            cursor.execute("""
-                SELECT * FROM trips 
-                WHERE id::text = ANY(%s)
-            """, (trip_ids,))
-            trips = cursor.fetchall()
-        else:
-            trips = []
+        trips = cursor.fetchall()
 
         return jsonify({"trips": trips}), 200
     except Exception as e:
@@ -1628,21 +3753,93 @@ def get_explorer_trips(user_id):
         cursor.close()
         connection.close()
 
-@app.route('/reservations/explorer/<uuid:user_id>', methods=['GET'])
-def get_reservations_explorer(user_id):
-
+# Todo lo que muestra la pantalla de inicio del explorer en una sola sentencia:
+# la CTE se materializa una vez y se reutiliza en las tres agregaciones.
+DASHBOARD_EXPLORER_QUERY = """
+    WITH reserved AS (
+        SELECT t.id, t.trip_name, t.start_date, t.end_date, t.trip_status,
+               t.trip_image_url, t.total_cost, t.lead_ranger,
+               r.id AS reservation_id, r.status AS reservation_status,
+               p.id AS payment_id, p.payment_status, p.payment_amount, p.payment_date,
+               EXISTS (
+                   SELECT 1 FROM ranger_califications rc
+                   WHERE rc.user_id = r.user_id AND rc.trip_id = r.trip_id
+               ) AS rated
+        FROM reservations r
+        JOIN trips t ON t.id = r.trip_id
+        LEFT JOIN LATERAL (
+            SELECT id, payment_status, payment_amount, payment_date
+            FROM payments
+            WHERE payments.trip_id = r.trip_id AND payments.user_id = r.user_id
+            ORDER BY payment_date DESC NULLS LAST
+            LIMIT 1
+        ) p ON true
+        WHERE r.user_id = %s::uuid
+    )
+    SELECT
+        (SELECT json_build_object(
+                    'id', id, 'trip_name', trip_name, 'start_date', start_date,
+                    'trip_status', trip_status)
+         FROM reserved
+         WHERE start_date >= CURRENT_DATE
+         ORDER BY start_date ASC
+         LIMIT 1) AS next_trip,
+        (SELECT COALESCE(json_agg(json_build_object(
+                    'id', id, 'trip_name', trip_name, 'start_date', start_date,
+                    'end_date', end_date, 'trip_status', trip_status,
+                    'trip_image_url', trip_image_url, 'total_cost', total_cost,
+                    'reservation_id', reservation_id, 'reservation_status', reservation_status,
+                    'payment_id', payment_id, 'payment_status', payment_status,
+                    'payment_amount', payment_amount, 'payment_date', payment_date
+                ) ORDER BY start_date DESC), '[]'::json)
+         FROM reserved) AS trips,
+        (SELECT COALESCE(json_agg(json_build_object(
+                    'trip_id', id, 'trip_name', trip_name, 'end_date', end_date,
+                    'lead_ranger', lead_ranger
+                ) ORDER BY end_date DESC), '[]'::json)
+         FROM reserved
+         WHERE end_date < CURRENT_TIMESTAMP AND NOT rated) AS pending_ratings
+"""
+
+
+@app.route('/dashboard/explorer/<uuid:user_id>', methods=['GET'])
+@cached_response('explorer_dashboard', ttl=60)
+def get_explorer_dashboard(user_id):
+    """Próximo viaje, viajes reservados con estado de reserva y pago, y calificaciones pendientes"""
     connection = get_db_connection()
     if not connection:
         return jsonify({"message": "Error de conexión con la base de datos"}), 500
 
     cursor = connection.cursor()
     try:
-        cursor.execute(""" 
+        cursor.execute(DASHBOARD_EXPLORER_QUERY, (str(user_id),))
+        dashboard = cursor.fetchone()
+        return jsonify(dashboard), 200
+    except Exception as e:
+        logging.error(f"Error al obtener el dashboard del explorer {user_id}: {str(e)}")
+        return jsonify({"message": "Error al obtener el dashboard"}), 500
+    finally:
+        cursor.close()
+        connection.close()
+
+@app.route('/reservations/explorer/<uuid:user_id>', methods=['GET'])
+def get_reservations_explorer(user_id):
+    query = """ 
             SELECT * FROM reservations inner join
             trips 
             on reservations.trip_id = trips.id
             where reservations.user_id = %s
-        """, (str(user_id),))
+        """
+    if wants_stream():
+        return stream_rows(query, (str(user_id),))
+
+    connection = get_db_connection()
+    if not connection:
+        return jsonify({"message": "Error de conexión con la base de datos"}), 500
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute(query, (str(user_id),))
         trips = cursor.fetchall()
 
         if not trips:
@@ -1719,7 +3916,7 @@ def delete_reservation(reservation_id):
     
     cursor = connection.cursor()
     try:
-        cursor.execute("DELETE FROM reservations WHERE id = %s RETURNING id", (reservation_id,))
+        cursor.execute(RESERVATION_RELEASE_SQL.format(condition="id = %s"), (reservation_id,))
         deleted = cursor.fetchone()
         
         if not deleted:
@@ -1727,6 +3924,7 @@ def delete_reservation(reservation_id):
             return jsonify({"message": "Reserva no encontrada"}), 404
             
         connection.commit()
+        invalidate_explorer_dashboard(deleted["user_id"])
         logging.info(f"Successfully deleted reservation: {reservation_id}")
         return jsonify({"message": "Reserva eliminada correctamente"}), 200
     
@@ -1748,14 +3946,15 @@ def delete_reservation_by_trip(trip_id):
     cursor = connection.cursor()
     try:
         # Try to find and delete by trip_id
-        cursor.execute("DELETE FROM reservations WHERE trip_id = %s RETURNING id", (trip_id,))
-        deleted = cursor.fetchone()
+        cursor.execute(RESERVATION_RELEASE_SQL.format(condition="trip_id = %s"), (trip_id,))
+        deleted = cursor.fetchall()
         
         if not deleted:
             logging.warning(f"No reservation found for trip: {trip_id}")
             return jsonify({"message": "Reserva no encontrada"}), 404
             
         connection.commit()
+        invalidate_explorer_dashboard(*(row["user_id"] for row in deleted))
         logging.info(f"Successfully deleted reservation for trip: {trip_id}")
         return jsonify({"message": "Reserva eliminada correctamente"}), 200
     
@@ -1780,17 +3979,18 @@ def delete_reservation_by_trip_user(trip_id, user_id):
     try:
         # Try to find and delete by both trip_id and user_id
         cursor.execute(
-            "DELETE FROM reservations WHERE trip_id = %s AND user_id = %s RETURNING id", 
+            RESERVATION_RELEASE_SQL.format(condition="trip_id = %s AND user_id = %s"),
             (trip_id, user_id)
         )
         
-        deleted = cursor.fetchone()
+        deleted = cursor.fetchall()
         
         if not deleted:
             logging.warning(f"No reservation found for trip: {trip_id} and user: {user_id}")
             return jsonify({"message": "Reserva no encontrada"}), 404
             
         connection.commit()
+        invalidate_explorer_dashboard(user_id)
         logging.info(f"Successfully deleted reservation for trip: {trip_id} and user: {user_id}")
         return jsonify({"message": "Reserva eliminada correctamente"}), 200
     
@@ -1804,9 +4004,25 @@ def delete_reservation_by_trip_user(trip_id, user_id):
     
 
     
+EXPLORERS_BY_TRIP_QUERY = """
+    SELECT 
+        users.id, 
+        CONCAT(users.first_name, ' ', users.last_name) AS name, 
+        users.email, 
+        users.phone_number AS phone, 
+        reservations.status
+    FROM reservations
+    JOIN users ON reservations.user_id = users.id
+    WHERE reservations.trip_id = %s
+"""
+
+
 @app.route('/reservations/trip/<trip_id>/explorers', methods=['GET'])
 def get_explorers_by_trip(trip_id):
     """Obtiene la lista de exploradores registrados en un viaje específico"""
+    if wants_stream():
+        return stream_rows(EXPLORERS_BY_TRIP_QUERY, (trip_id,))
+
     connection = get_db_connection()
     if not connection:
         logging.error("No se pudo conectar a la base de datos")
@@ -1817,41 +4033,8 @@ def get_explorers_by_trip(trip_id):
         with connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
          
             
-            query = """
-                SELECT 
-                    users.id, 
-                    CONCAT(users.first_name, ' ', users.last_name) AS name, 
-                    users.email, 
-                    users.phone_number AS phone, 
-                    reservations.status
-                FROM reservations
-                JOIN users ON reservations.user_id = users.id
-                WHERE reservations.trip_id = %s;
-            """
-            cursor.execute(query, (trip_id,))
-            explorers_data = cursor.fetchall()
-            
-            # Convertir a lista de diccionarios planos para asegurar serialización JSON correcta
-            explorers = []
-            for explorer in explorers_data:
-                # Si ya es un diccionario (con RealDictCursor/DictCursor)
-                if hasattr(explorer, 'items'):
-                    explorer_dict = dict(explorer)
-                else:
-                    # Si es una tupla (con cursor estándar)
-                    explorer_dict = {
-                        "id": explorer[0],
-                        "name": explorer[1],
-                        "email": explorer[2],
-                        "phone": explorer[3],
-                        "status": explorer[4]
-                    }
-                
-                # Convertir UUID a string si es necesario
-                if isinstance(explorer_dict.get('id'), (uuid.UUID)):
-                    explorer_dict['id'] = str(explorer_dict['id'])
-                
-                explorers.append(explorer_dict)
+            cursor.execute(EXPLORERS_BY_TRIP_QUERY, (trip_id,))
+            explorers = cursor.fetchall()
 
             # Agregar log para depuración
             logging.info(f"Datos de exploradores obtenidos: {explorers}")
@@ -1922,6 +4105,7 @@ def create_resource():
         
         created = cursor.fetchone()
         connection.commit()
+        invalidate_cache('resources')
         
         logging.info(f"Successfully created resource: {created['name']}")
         return jsonify({
@@ -1963,7 +4147,7 @@ def delete_resource(resource_id):
             return jsonify({"message": "Formato de UUID inválido"}), 400
             
         # Check if resource exists
-        cursor.execute("SELECT 1 FROM resources WHERE id = %s", (str(resource_uuid),))
+        run_query(cursor, "resource_exists", (str(resource_uuid),))
         if not cursor.fetchone():
             return jsonify({"message": "Recurso no encontrado"}), 404
         
@@ -2005,6 +4189,7 @@ def delete_resource(resource_id):
             
         # Commit changes
         connection.commit()
+        invalidate_cache('resources')
         
         logging.info(f"Successfully deleted resource: {resource_id}")
         return jsonify({
@@ -2056,7 +4241,7 @@ def update_resource(resource_id):
             return jsonify({"message": "El costo debe ser un valor numérico"}), 400
             
         # Check if resource exists
-        cursor.execute("SELECT 1 FROM resources WHERE id = %s", (str(resource_uuid),))
+        run_query(cursor, "resource_exists", (str(resource_uuid),))
         if not cursor.fetchone():
             return jsonify({"message": "Recurso no encontrado"}), 404
             
@@ -2096,6 +4281,7 @@ def update_resource(resource_id):
         
         updated = cursor.fetchone()
         connection.commit()
+        invalidate_cache('resources')
         
         logging.info(f"Successfully updated resource: {resource_id}")
         return jsonify({
@@ -2147,36 +4333,14 @@ def create_trip_resource_association():
         except ValueError:
             return jsonify({"message": "Formato de UUID inválido"}), 400
             
-        # Check if trip exists
-        cursor.execute("SELECT 1 FROM trips WHERE id = %s", (str(trip_id),))
-        if not cursor.fetchone():
-            return jsonify({"message": "El viaje especificado no existe"}), 404
-            
-        # Check if resource exists
-        cursor.execute("SELECT 1 FROM resources WHERE id = %s", (str(resource_id),))
-        if not cursor.fetchone():
+        # Create the association in one statement; the trips FK reports a missing trip
+        row = attach_to_trip(cursor, 'resources', trip_id, [resource_id])[0]
+        if not row['item_exists']:
             return jsonify({"message": "El recurso especificado no existe"}), 404
-        
-        # Check if association already exists
-        cursor.execute("""
-            SELECT 1 FROM trip_resources 
-            WHERE trip_id = %s AND resource_id = %s
-        """, (str(trip_id), str(resource_id)))
-        
-        if cursor.fetchone():
+        if not row['association_id']:
             return jsonify({"message": "Esta asociación ya existe"}), 409
-            
-        # Create the association
-        cursor.execute("""
-            INSERT INTO trip_resources (trip_id, resource_id)
-            VALUES (%s, %s)
-            RETURNING id
-        """, (
-            str(trip_id),
-            str(resource_id)
-        ))
         
-        association_id = cursor.fetchone()["id"]
+        association_id = row["association_id"]
         connection.commit()
         
         logging.info(f"Successfully created trip-resource association with ID: {association_id}")
@@ -2185,6 +4349,10 @@ def create_trip_resource_association():
             "id": str(association_id)
         }), 201
         
+    except psycopg2.errors.ForeignKeyViolation:
+        connection.rollback()
+        return jsonify({"message": "El viaje especificado no existe"}), 404
+        
     except psycopg2.IntegrityError as e:
         logging.error(f"Integrity error: {str(e)}")
         connection.rollback()
@@ -2198,6 +4366,11 @@ def create_trip_resource_association():
         cursor.close()
         connection.close()
         
+@app.route('/trips-resources/bulk', methods=['POST'])
+def create_trip_resource_associations_bulk():
+    """Asocia varios recursos a un viaje en una sola petición"""
+    return bulk_attach_to_trip('resources', 'resource_ids')
+
 @app.route('/trips/<string:trip_id>/resources', methods=['GET'])
 def get_trip_resources(trip_id):
     """Obtiene todos los recursos asociados a un viaje específico"""
@@ -2215,7 +4388,7 @@ def get_trip_resources(trip_id):
             return jsonify({"message": "Formato de UUID inválido"}), 400
             
         # First check if trip exists
-        cursor.execute("SELECT trip_name FROM trips WHERE id = %s", (str(trip_uuid),))
+        run_query(cursor, "trip_name", (str(trip_uuid),))
         trip = cursor.fetchone()
         if not trip:
             return jsonify({"message": "El viaje no existe"}), 404
@@ -2279,6 +4452,7 @@ def delete_activity_trip(trip_id, activity_id):
         
         # Forzar commit explícitamente
         conn.commit()
+        invalidate_cache('trip_activities', f"/trips/{trip_id}/")
         
         # Verificar después de la eliminación
         cur.execute(
@@ -2363,6 +4537,7 @@ def create_payment():
             payment_id = payment_result['id']
 
             connection.commit()
+            invalidate_explorer_dashboard(user_id)
 
             return jsonify({
                 "message": "Pago iniciado correctamente",
@@ -2438,6 +4613,7 @@ def update_payment_status(trip_id, user_id):
                 return jsonify({"error": "No se pudo actualizar el estado del pago"}), 500
             
             connection.commit()
+            invalidate_explorer_dashboard(user_id)
             
             return jsonify({
                 "message": "Estado de pago actualizado correctamente",
@@ -2466,6 +4642,7 @@ def update_payment_status(trip_id, user_id):
                 return jsonify({"error": "No se pudo crear el registro de pago"}), 500
             
             connection.commit()
+            invalidate_explorer_dashboard(user_id)
             
             return jsonify({
                 "message": "Registro de pago creado correctamente",
@@ -2557,15 +4734,8 @@ def get_payment_info(user_id, trip_id):
             connection.close()
 @app.route('/payments/trip/<trip_id>', methods=['GET'])
 def get_trip_payments(trip_id):
-    connection = None
-    cursor = None
-
-    try:
-        connection = get_db_connection()
-        cursor = connection.cursor()
-
-        # Obtener todos los pagos asociados a este viaje
-        cursor.execute("""
+    # Obtener todos los pagos asociados a este viaje
+    query = """
             SELECT 
                 id, 
                 user_id, 
@@ -2577,29 +4747,22 @@ def get_trip_payments(trip_id):
                 payment_status
             FROM payments 
             WHERE trip_id = %s
-        """, (trip_id,))
+        """
+    if wants_stream():
+        return stream_rows(query, (trip_id,))
+
+    connection = None
+    cursor = None
+
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+
+        cursor.execute(query, (trip_id,))
         
         payments = cursor.fetchall()
         
-        if not payments:
-            return jsonify([]), 200
-        
-        # Convertir los resultados a un array de diccionarios
-        payment_list = []
-        for payment in payments:
-            payment_data = {
-                "id": str(payment['id']),
-                "user_id": str(payment['user_id']),
-                "trip_id": str(payment['trip_id']),
-                "payment_amount": float(payment['payment_amount']) if payment['payment_amount'] else None,
-                "payment_method": payment['payment_method'],
-                "payment_date": payment['payment_date'].isoformat() if payment['payment_date'] else None,
-                "payment_voucher_url": payment['payment_voucher_url'],
-                "payment_status": payment['payment_status']
-            }
-            payment_list.append(payment_data)
-        
-        return jsonify(payment_list), 200
+        return jsonify(payments), 200
 
     except psycopg2.Error as db_error:
         app.logger.error(f"Error de base de datos: {db_error}")
@@ -2621,30 +4784,12 @@ def get_trip_payments(trip_id):
             connection.close()
 
 @app.route('/trips/action', methods=['POST'])
+@require_auth('Ranger', message="No tienes permisos para esta acción. Rol requerido: Ranger")
 def trip_action():
     """
     Endpoint para realizar acciones sobre viajes (eliminar/verificar) usando POST en lugar de DELETE
-    """
-    logging.info("Trip action endpoint called")
-    
-    # Verificar la autenticación y el rol del usuario
-    auth_header = request.headers.get('Authorization')
-    if not auth_header or not auth_header.startswith('Bearer '):
-        return jsonify({"message": "No se proporcionó token de autenticación"}), 401
-        
-    token = auth_header.split(' ')[1]
-    try:
-        # Decodificar el token JWT
-        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-        user_role = payload.get('role_name')
-        
-        # Verificar si el usuario es un Ranger
-        if user_role != 'Ranger':
-            return jsonify({"message": "No tienes permisos para esta acción. Rol requerido: Ranger"}), 403
-    except jwt.ExpiredSignatureError:
-        return jsonify({"message": "Token expirado"}), 401
-    except jwt.InvalidTokenError:
-        return jsonify({"message": "Token inválido"}), 401
+    """
+    logging.info("Trip action endpoint called")
     
     # Obtener datos del cuerpo de la solicitud
     body = request.get_json()
@@ -2672,7 +4817,7 @@ def trip_action():
     
     try:
         # Verificar si el viaje existe
-        cursor.execute("SELECT id, trip_name FROM trips WHERE id = %s", (str(trip_uuid),))
+        run_query(cursor, "trip_name", (str(trip_uuid),))
         trip = cursor.fetchone()
         if not trip:
             return jsonify({"message": "Viaje no encontrado"}), 404
@@ -2680,7 +4825,7 @@ def trip_action():
         # ACCIÓN: VERIFICAR RESERVACIONES
         if action.lower() == 'check':
             # Verificar si el viaje tiene reservaciones
-            cursor.execute("SELECT COUNT(*) as count FROM reservations WHERE trip_id = %s", (str(trip_uuid),))
+            run_query(cursor, "trip_reservation_count", (str(trip_uuid),))
             result = cursor.fetchone()
             reservation_count = result["count"] if "count" in result else 0
             has_reservations = reservation_count > 0
@@ -2694,7 +4839,7 @@ def trip_action():
         # ACCIÓN: ELIMINAR VIAJE
         elif action.lower() == 'delete':
             # Verificar si el viaje tiene reservaciones
-            cursor.execute("SELECT id FROM reservations WHERE trip_id = %s LIMIT 1", (str(trip_uuid),))
+            run_query(cursor, "trip_has_reservations", (str(trip_uuid),))
             has_reservations = cursor.fetchone() is not None
             
             if has_reservations:
@@ -2704,13 +4849,13 @@ def trip_action():
                 
             # Si no tiene reservaciones, proceder con la eliminación
             # Paso 1: Eliminar las actividades asociadas al viaje
-            cursor.execute("DELETE FROM activity_trips WHERE trip_id = %s", (str(trip_uuid),))
+            run_query(cursor, "delete_trip_activities", (str(trip_uuid),))
             activity_count = cursor.rowcount
             logging.info(f"Deleted {activity_count} activities associated with trip {trip_id}")
             
             # Paso 2: Eliminar recursos asociados al viaje (si existen)
             try:
-                cursor.execute("DELETE FROM trip_resources WHERE trip_id = %s", (str(trip_uuid),))
+                run_query(cursor, "delete_trip_resources", (str(trip_uuid),))
                 resource_count = cursor.rowcount
                 logging.info(f"Deleted {resource_count} resources associated with trip {trip_id}")
             except Exception as e:
@@ -2718,15 +4863,20 @@ def trip_action():
                 # Continuamos con la eliminación del viaje incluso si hay error con los recursos
             
             # Paso 3: Eliminar el viaje
-            cursor.execute("DELETE FROM trips WHERE id = %s", (str(trip_uuid),))
+            cursor.execute("DELETE FROM trips WHERE id = %s RETURNING lead_ranger", (str(trip_uuid),))
+            deleted = cursor.fetchone()
             
-            if cursor.rowcount == 0:
+            if not deleted:
                 # Si llegamos aquí, es extraño porque verificamos que existía antes
                 connection.rollback()
                 return jsonify({"message": "Error al eliminar el viaje"}), 500
+            refresh_ranger_stats(cursor, deleted["lead_ranger"])
                 
             # Confirmar todos los cambios en la base de datos
             connection.commit()
+            invalidate_cache('trip_activities', f"/trips/{trip_id}/")
+            invalidate_cache('rangers')
+            invalidate_cache('explorer_dashboard')
             
             trip_name = trip["trip_name"] if "trip_name" in trip else "Desconocido"
             return jsonify({
@@ -2744,102 +4894,9 @@ def trip_action():
     finally:
         cursor.close()
         connection.close()
-    """
-    Endpoint para eliminar un viaje si no tiene reservaciones existentes.
-    También elimina todas las actividades asociadas al viaje de la tabla activity_trips.
-    Solo usuarios con rol Ranger pueden acceder a esta funcionalidad.
-    """
-    logging.info(f"Attempting to delete trip with ID: {trip_id}")
-    
-    # Verificar la autenticación y el rol del usuario
-    auth_header = request.headers.get('Authorization')
-    if not auth_header or not auth_header.startswith('Bearer '):
-        return jsonify({"message": "No se proporcionó token de autenticación"}), 401
-        
-    token = auth_header.split(' ')[1]
-    try:
-        # Decodificar el token JWT
-        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-        user_role = payload.get('role_name')
-        
-        # Verificar si el usuario es un Ranger
-        if user_role != 'Ranger':
-            return jsonify({"message": "No tienes permisos para eliminar viajes. Rol requerido: Ranger"}), 403
-    except jwt.ExpiredSignatureError:
-        return jsonify({"message": "Token expirado"}), 401
-    except jwt.InvalidTokenError:
-        return jsonify({"message": "Token inválido"}), 401
-    
-    # Obtener conexión a la base de datos
-    connection = get_db_connection()
-    if not connection:
-        return jsonify({"message": "Error de conexión con la base de datos"}), 500
-        
-    cursor = connection.cursor()
-    
-    try:
-        # Validar ID del viaje
-        try:
-            trip_uuid = uuid.UUID(trip_id)
-        except ValueError:
-            return jsonify({"message": "Formato de ID de viaje inválido"}), 400
-            
-        # Verificar si el viaje existe
-        cursor.execute("SELECT id, trip_name FROM trips WHERE id = %s", (str(trip_uuid),))
-        trip = cursor.fetchone()
-        if not trip:
-            return jsonify({"message": "Viaje no encontrado"}), 404
-            
-        # Verificar si el viaje tiene reservaciones
-        cursor.execute("SELECT id FROM reservations WHERE trip_id = %s LIMIT 1", (str(trip_uuid),))
-        has_reservations = cursor.fetchone() is not None
-        
-        if has_reservations:
-            return jsonify({
-                "message": "No se puede eliminar el viaje porque tiene reservaciones existentes"
-            }), 400
-            
-        # Si no tiene reservaciones, proceder con la eliminación
-        # Paso 1: Eliminar las actividades asociadas al viaje
-        cursor.execute("DELETE FROM activity_trips WHERE trip_id = %s", (str(trip_uuid),))
-        activity_count = cursor.rowcount
-        logging.info(f"Deleted {activity_count} activities associated with trip {trip_id}")
-        
-        # Paso 2: Eliminar recursos asociados al viaje (si existen)
-        try:
-            cursor.execute("DELETE FROM trip_resources WHERE trip_id = %s", (str(trip_uuid),))
-            resource_count = cursor.rowcount
-            logging.info(f"Deleted {resource_count} resources associated with trip {trip_id}")
-        except Exception as e:
-            logging.warning(f"Error deleting trip_resources: {str(e)}")
-            # Continuamos con la eliminación del viaje incluso si hay error con los recursos
-        
-        # Paso 3: Eliminar el viaje
-        cursor.execute("DELETE FROM trips WHERE id = %s", (str(trip_uuid),))
-        
-        if cursor.rowcount == 0:
-            # Si llegamos aquí, es extraño porque verificamos que existía antes
-            connection.rollback()
-            return jsonify({"message": "Error al eliminar el viaje"}), 500
-            
-        # Confirmar todos los cambios en la base de datos
-        connection.commit()
-        
-        trip_name = trip["trip_name"] if "trip_name" in trip else "Desconocido"
-        return jsonify({
-            "message": f"Viaje '{trip_name}' eliminado exitosamente",
-            "activities_removed": activity_count
-        }), 200
-        
-    except Exception as e:
-        connection.rollback()
-        logging.error(f"Error deleting trip: {str(e)}")
-        return jsonify({"message": f"Error al eliminar el viaje: {str(e)}"}), 500
-    finally:
-        cursor.close()
-        connection.close()
 
 @app.route('/trips/<trip_id>/check', methods=['GET'])
+@require_auth('Ranger', message="No tienes permisos para verificar este viaje. Rol requerido: Ranger")
 def check_trip_reservations(trip_id):
     """
     Endpoint para verificar si un viaje tiene reservaciones.
@@ -2847,25 +4904,6 @@ def check_trip_reservations(trip_id):
     """
     logging.info(f"Checking reservations for trip ID: {trip_id}")
     
-    # Verificar la autenticación y el rol del usuario
-    auth_header = request.headers.get('Authorization')
-    if not auth_header or not auth_header.startswith('Bearer '):
-        return jsonify({"message": "No se proporcionó token de autenticación"}), 401
-        
-    token = auth_header.split(' ')[1]
-    try:
-        # Decodificar el token JWT
-        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-        user_role = payload.get('role_name')
-        
-        # Verificar si el usuario es un Ranger
-        if user_role != 'Ranger':
-            return jsonify({"message": "No tienes permisos para verificar este viaje. Rol requerido: Ranger"}), 403
-    except jwt.ExpiredSignatureError:
-        return jsonify({"message": "Token expirado"}), 401
-    except jwt.InvalidTokenError:
-        return jsonify({"message": "Token inválido"}), 401
-    
     # Obtener conexión a la base de datos
     connection = get_db_connection()
     if not connection:
@@ -2881,13 +4919,13 @@ def check_trip_reservations(trip_id):
             return jsonify({"message": "Formato de ID de viaje inválido"}), 400
             
         # Verificar si el viaje existe
-        cursor.execute("SELECT id, trip_name FROM trips WHERE id = %s", (str(trip_uuid),))
+        run_query(cursor, "trip_name", (str(trip_uuid),))
         trip = cursor.fetchone()
         if not trip:
             return jsonify({"message": "Viaje no encontrado"}), 404
             
         # Verificar si el viaje tiene reservaciones
-        cursor.execute("SELECT COUNT(*) as count FROM reservations WHERE trip_id = %s", (str(trip_uuid),))
+        run_query(cursor, "trip_reservation_count", (str(trip_uuid),))
         result = cursor.fetchone()
         reservation_count = result["count"] if "count" in result else 0
         has_reservations = reservation_count > 0
@@ -2927,6 +4965,7 @@ def check_trip_reservations(trip_id):
         connection.close()
         
 @app.route('/trips/<trip_id>', methods=['PUT'])
+@require_auth('Ranger', message="No tienes permisos para editar viajes. Rol requerido: Ranger")
 def edit_trip(trip_id):
     """
     Endpoint para editar un viaje si no tiene reservaciones existentes.
@@ -2934,25 +4973,6 @@ def edit_trip(trip_id):
     """
     logging.info(f"Attempting to edit trip with ID: {trip_id}")
     
-    # Verificar la autenticación y el rol del usuario
-    auth_header = request.headers.get('Authorization')
-    if not auth_header or not auth_header.startswith('Bearer '):
-        return jsonify({"message": "No se proporcionó token de autenticación"}), 401
-        
-    token = auth_header.split(' ')[1]
-    try:
-        # Decodificar el token JWT
-        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-        user_role = payload.get('role_name')
-        
-        # Verificar si el usuario es un Ranger
-        if user_role != 'Ranger':
-            return jsonify({"message": "No tienes permisos para editar viajes. Rol requerido: Ranger"}), 403
-    except jwt.ExpiredSignatureError:
-        return jsonify({"message": "Token expirado"}), 401
-    except jwt.InvalidTokenError:
-        return jsonify({"message": "Token inválido"}), 401
-    
     # Obtener conexión a la base de datos
     connection = get_db_connection()
     if not connection:
@@ -2974,7 +4994,7 @@ def edit_trip(trip_id):
             return jsonify({"message": "Viaje no encontrado"}), 404
             
         # Verificar si el viaje tiene reservaciones
-        cursor.execute("SELECT id FROM reservations WHERE trip_id = %s LIMIT 1", (str(trip_uuid),))
+        run_query(cursor, "trip_has_reservations", (str(trip_uuid),))
         has_reservations = cursor.fetchone() is not None
         
         if has_reservations:
@@ -3023,9 +5043,12 @@ def edit_trip(trip_id):
         if not updated_trip:
             connection.rollback()
             return jsonify({"message": "Error al actualizar el viaje"}), 500
+        if 'lead_ranger' in body or 'start_date' in body:
+            refresh_ranger_stats(cursor, trip['lead_ranger'], body.get('lead_ranger', trip['lead_ranger']))
             
         # Confirmar todos los cambios en la base de datos
         connection.commit()
+        invalidate_cache('rangers')
         
         return jsonify({
             "message": f"Viaje '{updated_trip['trip_name']}' actualizado exitosamente",
@@ -3043,7 +5066,76 @@ def edit_trip(trip_id):
 # MODIFICACIÓN A LA RUTA EXISTENTE
 # Actualiza tu ruta existente para incluir el conteo de viajes
 
+RANGER_DETAILS_QUERY = """
+    SELECT 
+        u.id, 
+        u.first_name, 
+        u.last_name, 
+        u.username,
+        u.email,
+        u.phone_number,
+        u.nationality,
+        u.biography,
+        u.profile_picture_url,
+        u.availability_start_date,
+        u.availability_end_date,
+        u.user_status,
+        u.country,
+        u.biography_extend,
+        CASE WHEN rs.rating_count > 0 THEN rs.rating_sum / rs.rating_count
+             ELSE u.calification END AS calification,
+        COALESCE(rs.trips_led, 0) as trips_count
+    FROM users u
+    LEFT JOIN ranger_stats rs ON rs.ranger_id = u.id
+    WHERE u.id = %s
+"""
+
+RANGER_IS_RANGER_QUERY = """
+    SELECT u.id FROM users u
+    JOIN user_roles ur ON u.role_id = ur.id
+    WHERE u.id = %s AND ur.role_name = 'Ranger'
+"""
+
+RANGER_CERTIFICATIONS_QUERY = """
+    SELECT 
+        c.id,
+        c.title,
+        c.issued_by,
+        c.issued_date,
+        c.valid_until,
+        c.certification_number,
+        c.document_url
+    FROM certifications c
+    JOIN ranger_certifications rc ON c.id = rc.certification_id
+    WHERE rc.user_id = %s
+    ORDER BY c.valid_until DESC
+"""
+
+
+def format_ranger_details(ranger, certifications):
+    """Arma la ficha pública del ranger a partir de su fila y sus certificaciones"""
+    bio_extend = ranger['biography_extend'] or {}
+    return {
+        "id": str(ranger['id']),
+        "name": f"{ranger['first_name']} {ranger['last_name']}",
+        "username": ranger['username'],
+        "title": bio_extend.get('title', "Guía Profesional"),
+        "photo": ranger['profile_picture_url'] or "https://via.placeholder.com/150?text=Ranger",
+        "email": ranger['email'],
+        "phone": ranger['phone_number'] or "No indicado",
+        "location": ranger['country'] or "No indicado",
+        "isAvailable": ranger['user_status'] == 'activo',
+        "bio": ranger['biography'] or "Guía profesional",
+        "rating": float(ranger['calification']) if ranger['calification'] else 0.0,
+        "trips": int(ranger['trips_count']),
+        "specialties": bio_extend.get('specialties', []),
+        "languages": bio_extend.get('languages', []),
+        "certifications": certifications
+    }
+
+
 @app.route('/rangers/<string:ranger_id>', methods=['GET'])
+@cached_response('rangers', ttl=60)
 def get_ranger_details(ranger_id):
     connection = get_db_connection()
     if not connection:
@@ -3052,62 +5144,16 @@ def get_ranger_details(ranger_id):
     try:
         cursor = connection.cursor(cursor_factory=RealDictCursor)
         
-        # Obtener detalles del ranger por ID (igual que antes)
-        cursor.execute("""
-            SELECT 
-                u.id, 
-                u.first_name, 
-                u.last_name, 
-                u.username,
-                u.email,
-                u.phone_number,
-                u.nationality,
-                u.biography,
-                u.profile_picture_url,
-                u.availability_start_date,
-                u.availability_end_date,
-                u.user_status,
-                u.biography_extend,
-                u.calification,
-                (SELECT COUNT(*) FROM trips WHERE lead_ranger = u.id) as trips_count  # AÑADIR ESTO
-            FROM users u
-            WHERE u.id = %s
-        """, (ranger_id,))
-        
+        cursor.execute(RANGER_DETAILS_QUERY, (ranger_id,))
         ranger = cursor.fetchone()
         
         if not ranger:
             return jsonify({"error": "Ranger no encontrado"}), 404
         
-        # Extraer datos del campo JSONB biography_extend (igual que antes)
-        specialties = []
-        languages = []
-        
-        if ranger['biography_extend']:
-            bio_extend = ranger['biography_extend']
-            specialties = bio_extend.get('specialties', [])
-            languages = bio_extend.get('languages', [])
-        
-        # Formatear la respuesta (como antes pero con trips_count)
-        formatted_ranger = {
-            "id": str(ranger['id']),
-            "name": f"{ranger['first_name']} {ranger['last_name']}",
-            "username": ranger['username'],
-            "title": ranger['biography_extend'].get('title', "Guía Profesional") if ranger['biography_extend'] else "Guía Profesional",
-            "photo": ranger['profile_picture_url'] or "https://via.placeholder.com/150?text=Ranger",
-            "email": ranger['email'],
-            "phone": ranger['phone_number'] or "No indicado",
-            "location": ranger['country'] or "No indicado",
-            "isAvailable": ranger['user_status'] == 'activo',
-            "bio": ranger['biography'] or "Guía profesional",
-            "rating": float(ranger['calification']) if ranger['calification'] else 0.0,
-            "trips": int(ranger['trips_count']),  # USAR EL VALOR CALCULADO
-            "specialties": specialties,
-            "languages": languages,
-            "certifications": []  # Podrías cargar esto aquí o en una petición separada
-        }
+        cursor.execute(RANGER_CERTIFICATIONS_QUERY, (ranger_id,))
+        certifications = cursor.fetchall()
         
-        return jsonify(formatted_ranger), 200
+        return jsonify(format_ranger_details(ranger, certifications)), 200
 
     except Exception as e:
         logging.error(f"Error en /rangers/{ranger_id}: {str(e)}")
@@ -3117,6 +5163,22 @@ def get_ranger_details(ranger_id):
         if connection: connection.close()
 
 
+def get_ranger_details_async(ranger_id):
+    """get_ranger_details en modo async: ficha y certificaciones a la vez"""
+    try:
+        ranger, certifications = gather_async(
+            (RANGER_DETAILS_QUERY, (ranger_id,), True),
+            (RANGER_CERTIFICATIONS_QUERY, (ranger_id,), False)
+        )
+    except Exception as e:
+        logging.error(f"Error en /rangers/{ranger_id}: {str(e)}")
+        return jsonify({"error": "Error interno al obtener detalles del ranger"}), 500
+
+    if not ranger:
+        return jsonify({"error": "Ranger no encontrado"}), 404
+    return jsonify(format_ranger_details(ranger, certifications)), 200
+
+
 # ENDPOINT ADICIONAL SOLO PARA CONTEO DE VIAJES
 # Este endpoint solo devuelve el conteo de viajes para un ranger
 
@@ -3130,19 +5192,17 @@ def get_ranger_trips_count(ranger_id):
     try:
         cursor = connection.cursor(cursor_factory=RealDictCursor)
         
-        # Verificar que el Ranger existe
-        cursor.execute("SELECT id FROM users WHERE id = %s", (ranger_id,))
-        if not cursor.fetchone():
-            return jsonify({"error": "Ranger no encontrado"}), 404
-        
-        # Contar el número de viajes donde este usuario es el lead_ranger
+        # Viajes liderados según ranger_stats (también verifica que el Ranger existe)
         cursor.execute("""
-            SELECT COUNT(*) as trips_count
-            FROM trips
-            WHERE lead_ranger = %s
+            SELECT COALESCE(rs.trips_led, 0) as trips_count
+            FROM users u
+            LEFT JOIN ranger_stats rs ON rs.ranger_id = u.id
+            WHERE u.id = %s
         """, (ranger_id,))
         
         result = cursor.fetchone()
+        if not result:
+            return jsonify({"error": "Ranger no encontrado"}), 404
         
         return jsonify({
             "ranger_id": ranger_id,
@@ -3163,10 +5223,9 @@ def get_ranger_trips_count(ranger_id):
 # Este endpoint puede ser útil para actualizar manualmente todos los conteos
 
 @app.route('/admin/update-all-rangers-trip-counts', methods=['POST'])
+@require_auth('Admin')
 def update_all_rangers_trip_counts():
-    """Actualiza el conteo de viajes para todos los Rangers (solo admin)"""
-    # Verificar autenticación y permisos de administrador aquí
-    
+    """Reconstruye ranger_stats para todos los Rangers en una sola sentencia (solo admin)"""
     connection = get_db_connection()
     if not connection:
         return jsonify({"error": "Database connection failed"}), 500
@@ -3174,35 +5233,17 @@ def update_all_rangers_trip_counts():
     try:
         cursor = connection.cursor(cursor_factory=RealDictCursor)
         
-        # Obtener todos los IDs de Ranger que han liderado viajes
-        cursor.execute("""
-            SELECT DISTINCT lead_ranger as ranger_id
-            FROM trips
-            WHERE lead_ranger IS NOT NULL
-        """)
-        
-        rangers = cursor.fetchall()
-        updated_count = 0
-        
-        for ranger in rangers:
-            ranger_id = ranger['ranger_id']
-            
-            # Contar viajes para este Ranger
-            cursor.execute("""
-                SELECT COUNT(*) as trips_count
-                FROM trips
-                WHERE lead_ranger = %s
-            """, (ranger_id,))
-            
-            count_result = cursor.fetchone()
-            trips_count = count_result['trips_count']
-            
-            # Guardar el conteo en algún lugar si es necesario
-            # Esta parte depende de tu estructura de datos
-            # Por ejemplo, podrías guardar esto en un campo 'trips_count' en la tabla users
-            # O simplemente calcularlo cada vez
-            
-            updated_count += 1
+        # Rangers por rol más cualquier usuario que lidere viajes
+        cursor.execute(RANGER_STATS_REFRESH_SQL.format(rangers="""(
+            SELECT u.id FROM users u
+            JOIN user_roles ur ON ur.id = u.role_id
+            WHERE ur.role_name = 'Ranger'
+            UNION
+            SELECT lead_ranger FROM trips WHERE lead_ranger IS NOT NULL
+        )"""))
+        updated_count = cursor.rowcount
+        connection.commit()
+        invalidate_cache('rangers')
         
         return jsonify({
             "message": f"Conteos actualizados para {updated_count} Rangers",
@@ -3228,39 +5269,16 @@ def get_ranger_certifications(ranger_id):
         cursor = connection.cursor(cursor_factory=RealDictCursor)
         
         # Verificar que el ranger existe y tiene rol de ranger
-        cursor.execute("""
-            SELECT u.id FROM users u
-            JOIN user_roles ur ON u.role_id = ur.id
-            WHERE u.id = %s AND ur.role_name = 'Ranger'
-        """, (ranger_id,))
+        cursor.execute(RANGER_IS_RANGER_QUERY, (ranger_id,))
         
         if not cursor.fetchone():
             return jsonify({"error": "Ranger no encontrado"}), 404
         
         # Obtener certificaciones del ranger
-        cursor.execute("""
-            SELECT 
-                c.id,
-                c.title,
-                c.issued_by,
-                c.issued_date,
-                c.valid_until,
-                c.certification_number,
-                c.document_url
-            FROM certifications c
-            JOIN ranger_certifications rc ON c.id = rc.certification_id
-            WHERE rc.user_id = %s
-            ORDER BY c.valid_until DESC
-        """, (ranger_id,))
+        cursor.execute(RANGER_CERTIFICATIONS_QUERY, (ranger_id,))
         
         certifications = cursor.fetchall()
         
-        # Formatear fechas para JSON
-        for cert in certifications:
-            cert['issued_date'] = cert['issued_date'].isoformat() if cert['issued_date'] else None
-            cert['valid_until'] = cert['valid_until'].isoformat() if cert['valid_until'] else None
-            cert['id'] = str(cert['id'])
-        
         return jsonify({"certifications": certifications}), 200
 
     except Exception as e:
@@ -3270,6 +5288,22 @@ def get_ranger_certifications(ranger_id):
         if 'cursor' in locals(): cursor.close()
         if connection: connection.close()
 
+
+def get_ranger_certifications_async(ranger_id):
+    """get_ranger_certifications en modo async: verificación de rol y listado a la vez"""
+    try:
+        is_ranger, certifications = gather_async(
+            (RANGER_IS_RANGER_QUERY, (ranger_id,), True),
+            (RANGER_CERTIFICATIONS_QUERY, (ranger_id,), False)
+        )
+    except Exception as e:
+        logging.error(f"Error en /rangers/{ranger_id}/certifications: {str(e)}")
+        return jsonify({"error": "Error interno al obtener certificaciones"}), 500
+
+    if not is_ranger:
+        return jsonify({"error": "Ranger no encontrado"}), 404
+    return jsonify({"certifications": certifications}), 200
+
 # 2. Ruta para actualizar la disponibilidad de un ranger
 @app.route('/rangers/<string:ranger_id>/availability', methods=['PUT'])
 def update_ranger_availability(ranger_id):
@@ -3289,7 +5323,7 @@ def update_ranger_availability(ranger_id):
         cursor = connection.cursor()
         
         # Verificar que el ranger existe
-        cursor.execute("SELECT id FROM users WHERE id = %s", (ranger_id,))
+        run_query(cursor, "user_exists", (ranger_id,))
         if not cursor.fetchone():
             return jsonify({"error": "Ranger no encontrado"}), 404
         
@@ -3303,6 +5337,7 @@ def update_ranger_availability(ranger_id):
         """, (start_date, end_date, ranger_id))
         
         connection.commit()
+        invalidate_cache('rangers')
         
         return jsonify({
             "message": "Disponibilidad actualizada correctamente",
@@ -3367,6 +5402,7 @@ def update_ranger_profile(ranger_id):
         """, (Json(current_bio_extend), ranger_id))
         
         connection.commit()
+        invalidate_cache('rangers')
         
         return jsonify({
             "message": "Perfil actualizado correctamente",
@@ -3393,7 +5429,7 @@ def get_ranger_trips_list(ranger_id):
         cursor = connection.cursor(cursor_factory=RealDictCursor)
         
         # Verificar que el ranger existe
-        cursor.execute("SELECT id FROM users WHERE id = %s", (ranger_id,))
+        run_query(cursor, "user_exists", (ranger_id,))
         if not cursor.fetchone():
             return jsonify({"error": "Ranger no encontrado"}), 404
         
@@ -3406,7 +5442,7 @@ def get_ranger_trips_list(ranger_id):
                 t.start_date,
                 t.end_date,
                 t.status,
-                AVG(rc.calification) as avg_rating,
+                COALESCE(AVG(rc.calification), 0)::float8 as avg_rating,
                 COUNT(rc.id) as review_count
             FROM trips t
             LEFT JOIN ranger_califications rc ON t.id = rc.trip_id
@@ -3417,13 +5453,6 @@ def get_ranger_trips_list(ranger_id):
         
         trips = cursor.fetchall()
         
-        # Formatear fechas para JSON y convertir UUID a string
-        for trip in trips:
-            trip['start_date'] = trip['start_date'].isoformat() if trip['start_date'] else None
-            trip['end_date'] = trip['end_date'].isoformat() if trip['end_date'] else None
-            trip['id'] = str(trip['id'])
-            trip['avg_rating'] = float(trip['avg_rating']) if trip['avg_rating'] else 0.0
-        
         return jsonify({"trips": trips}), 200
         
     except Exception as e:
@@ -3454,7 +5483,7 @@ def add_ranger_certification(ranger_id):
         cursor = connection.cursor(cursor_factory=RealDictCursor)
         
         # Verificar que el ranger existe
-        cursor.execute("SELECT id FROM users WHERE id = %s", (ranger_id,))
+        run_query(cursor, "user_exists", (ranger_id,))
         if not cursor.fetchone():
             return jsonify({"error": "Ranger no encontrado"}), 404
         
@@ -3490,6 +5519,9 @@ def add_ranger_certification(ranger_id):
         """, (certification_id, ranger_id))
         
         connection.commit()
+        invalidate_cache('certifications')
+        # La ficha del ranger incluye sus certificaciones
+        invalidate_cache('rangers', f"/rangers/{ranger_id}")
         
         return jsonify({
             "message": "Certificación añadida correctamente",
@@ -3525,7 +5557,7 @@ def update_ranger_rating(ranger_id):
         cursor = connection.cursor()
         
         # Verificar que el ranger existe
-        cursor.execute("SELECT id FROM users WHERE id = %s", (ranger_id,))
+        run_query(cursor, "user_exists", (ranger_id,))
         if not cursor.fetchone():
             return jsonify({"error": "Ranger no encontrado"}), 404
         
@@ -3537,6 +5569,7 @@ def update_ranger_rating(ranger_id):
         """, (rating, ranger_id))
         
         connection.commit()
+        invalidate_cache('rangers')
         
         return jsonify({
             "message": "Calificación actualizada correctamente",
@@ -3588,21 +5621,26 @@ def rate_ranger_trip(ranger_id, trip_id):
         if not cursor.fetchone():
             return jsonify({"error": "Ranger o viaje no encontrado"}), 404
         
-        # Verificar si ya existe una calificación para este usuario, ranger y viaje
+        # Actualizar la calificación existente; el valor anterior sale de la fila
+        # bloqueada por el propio UPDATE, así que dos peticiones simultáneas no
+        # calculan su delta desde el mismo valor viejo
         cursor.execute("""
-            SELECT id FROM ranger_califications
-            WHERE user_id = %s AND trip_id = %s
-        """, (user_id, trip_id))
-        
-        existing_rating = cursor.fetchone()
-        
-        if existing_rating:
-            # Actualizar calificación existente
-            cursor.execute("""
-                UPDATE ranger_califications
-                SET calification = %s
+            UPDATE ranger_califications rc
+            SET calification = %s
+            FROM (
+                SELECT id, calification FROM ranger_califications
                 WHERE user_id = %s AND trip_id = %s
-            """, (rating, user_id, trip_id))
+                FOR UPDATE
+            ) old
+            WHERE rc.id = old.id
+            RETURNING old.calification
+        """, (rating, user_id, trip_id))
+        previous = cursor.fetchall()
+        
+        if previous:
+            apply_rating_delta(
+                cursor, trip_id, sum(Decimal(str(rating)) - row['calification'] for row in previous), 0, 0
+            )
             message = "Calificación actualizada correctamente"
         else:
             # Crear nueva calificación
@@ -3610,20 +5648,20 @@ def rate_ranger_trip(ranger_id, trip_id):
                 INSERT INTO ranger_califications (user_id, trip_id, calification)
                 VALUES (%s, %s, %s)
             """, (user_id, trip_id, rating))
+            apply_rating_delta(cursor, trip_id, rating, 1, 0)
             message = "Calificación registrada correctamente"
         
-        # Actualizar el promedio de calificación del ranger
+        # Actualizar el promedio de calificación del ranger desde sus agregados
         cursor.execute("""
             UPDATE users
-            SET calification = (
-                SELECT AVG(calification)
-                FROM ranger_califications
-                WHERE trip_id IN (SELECT id FROM trips WHERE ranger_id = %s)
-            )
-            WHERE id = %s
-        """, (ranger_id, ranger_id))
+            SET calification = ROUND(rs.rating_sum / rs.rating_count, 1)
+            FROM ranger_stats rs
+            WHERE users.id = %s AND rs.ranger_id = users.id AND rs.rating_count > 0
+        """, (ranger_id,))
         
         connection.commit()
+        invalidate_cache('rangers')
+        invalidate_explorer_dashboard(user_id)
         
         return jsonify({
             "message": message,
@@ -3648,7 +5686,7 @@ def fetch_guide_certifications(guide_id):
         cursor = connection.cursor(cursor_factory=RealDictCursor)
         
         # Verificar que el ranger/guía existe
-        cursor.execute("SELECT id FROM users WHERE id = %s", (guide_id,))
+        run_query(cursor, "user_exists", (guide_id,))
         if not cursor.fetchone():
             return jsonify({"error": "Guía no encontrado"}), 404
         
@@ -3670,18 +5708,7 @@ def fetch_guide_certifications(guide_id):
         
         certifications = cursor.fetchall()
         
-        # Formatear fechas para JSON
-        formatted_certifications = []
-        for cert in certifications:
-            formatted_cert = dict(cert)
-            if formatted_cert['issued_date']:
-                formatted_cert['issued_date'] = formatted_cert['issued_date'].isoformat()
-            if formatted_cert['valid_until']:
-                formatted_cert['valid_until'] = formatted_cert['valid_until'].isoformat()
-            formatted_cert['id'] = str(formatted_cert['id'])
-            formatted_certifications.append(formatted_cert)
-        
-        return jsonify({"certifications": formatted_certifications}), 200
+        return jsonify({"certifications": certifications}), 200
 
     except Exception as e:
         # Manejo de errores
@@ -3696,6 +5723,7 @@ def fetch_guide_certifications(guide_id):
 
         
 @app.route('/api/califications', methods=['POST'])
+@require_auth_or_legacy_user
 def create_calification():
     """Crea una nueva calificación para un viaje"""
     connection = get_db_connection()
@@ -3722,44 +5750,32 @@ def create_calification():
         except (ValueError, TypeError):
             return jsonify({"error": "La calificación debe ser un número"}), 400
         
-        cursor = connection.cursor(cursor_factory=RealDictCursor)
-        
-        # Verificar que el usuario tiene rol Explorer
-        cursor.execute("""
-            SELECT ur.role_name
-            FROM users u
-            JOIN user_roles ur ON u.role_id = ur.id
-            WHERE u.id = %s
-        """, (data['user_id'],))
-        
-        user_role = cursor.fetchone()
-        if not user_role or user_role['role_name'] != 'Explorer':
+        # El rol y la identidad vienen del token verificado
+        if g.user_role != 'Explorer':
             return jsonify({"error": "Solo los explorers pueden calificar viajes"}), 403
+        if str(data['user_id']) != str(g.user_id):
+            return jsonify({"error": "No puedes calificar en nombre de otro usuario"}), 403
+        
+        cursor = connection.cursor(cursor_factory=RealDictCursor)
         
         # Verificar que el explorer tiene una reservación en este viaje
-        cursor.execute("""
-            SELECT id FROM reservations 
-            WHERE user_id = %s AND trip_id = %s
-        """, (data['user_id'], data['trip_id']))
+        run_query(cursor, "user_reservation_on_trip", (data['user_id'], data['trip_id']))
         
         if not cursor.fetchone():
             return jsonify({"error": "Solo puedes calificar viajes en los que has participado"}), 403
         
         # Verificar que el viaje existe
-        cursor.execute("SELECT id FROM trips WHERE id = %s", (data['trip_id'],))
+        run_query(cursor, "trip_exists", (data['trip_id'],))
         if not cursor.fetchone():
             return jsonify({"error": "Viaje no encontrado"}), 404
         
         # Verificar que el usuario existe
-        cursor.execute("SELECT id FROM users WHERE id = %s", (data['user_id'],))
+        run_query(cursor, "user_exists", (data['user_id'],))
         if not cursor.fetchone():
             return jsonify({"error": "Usuario no encontrado"}), 404
         
         # Verificar si el usuario ya ha calificado este viaje
-        cursor.execute("""
-            SELECT id FROM ranger_califications 
-            WHERE user_id = %s AND trip_id = %s
-        """, (data['user_id'], data['trip_id']))
+        run_query(cursor, "calification_by_user_trip", (data['user_id'], data['trip_id']))
         
         existing = cursor.fetchone()
         
@@ -3786,7 +5802,10 @@ def create_calification():
         ))
         
         result = cursor.fetchone()
+        apply_rating_delta(cursor, data['trip_id'], calification, 1, int(has_review(data.get('user_comment'))))
         connection.commit()
+        invalidate_cache('rangers')
+        invalidate_explorer_dashboard(data['user_id'])
         
         return jsonify({
             "message": "Calificación registrada correctamente",
@@ -3808,6 +5827,7 @@ def create_calification():
 # Rutas para la API de calificaciones de Rangers siguiendo el mismo patrón que las rutas existentes
 
 @app.route('/api/ranger-califications', methods=['POST'])
+@require_auth_or_legacy_user
 def create_ranger_calification():
     """Crea una nueva calificación para un Ranger en un viaje"""
     connection = get_db_connection()
@@ -3834,44 +5854,32 @@ def create_ranger_calification():
         except (ValueError, TypeError):
             return jsonify({"error": "La calificación debe ser un número"}), 400
         
-        cursor = connection.cursor(cursor_factory=RealDictCursor)
-        
-        # Verificar que el usuario tiene rol Explorer
-        cursor.execute("""
-            SELECT ur.role_name
-            FROM users u
-            JOIN user_roles ur ON u.role_id = ur.id
-            WHERE u.id = %s
-        """, (data['user_id'],))
-        
-        user_role = cursor.fetchone()
-        if not user_role or user_role['role_name'] != 'Explorer':
+        # El rol y la identidad vienen del token verificado
+        if g.user_role != 'Explorer':
             return jsonify({"error": "Solo los explorers pueden calificar a los Rangers"}), 403
+        if str(data['user_id']) != str(g.user_id):
+            return jsonify({"error": "No puedes calificar en nombre de otro usuario"}), 403
+        
+        cursor = connection.cursor(cursor_factory=RealDictCursor)
         
         # Verificar que el explorer tiene una reservación en este viaje
-        cursor.execute("""
-            SELECT id FROM reservations 
-            WHERE user_id = %s AND trip_id = %s
-        """, (data['user_id'], data['trip_id']))
+        run_query(cursor, "user_reservation_on_trip", (data['user_id'], data['trip_id']))
         
         if not cursor.fetchone():
             return jsonify({"error": "Solo puedes calificar viajes en los que has participado"}), 403
         
         # Verificar que el viaje existe
-        cursor.execute("SELECT id FROM trips WHERE id = %s", (data['trip_id'],))
+        run_query(cursor, "trip_exists", (data['trip_id'],))
         if not cursor.fetchone():
             return jsonify({"error": "Viaje no encontrado"}), 404
         
         # Verificar que el usuario existe
-        cursor.execute("SELECT id FROM users WHERE id = %s", (data['user_id'],))
+        run_query(cursor, "user_exists", (data['user_id'],))
         if not cursor.fetchone():
             return jsonify({"error": "Usuario no encontrado"}), 404
         
         # Verificar si el usuario ya ha calificado al Ranger de este viaje
-        cursor.execute("""
-            SELECT id FROM ranger_califications 
-            WHERE user_id = %s AND trip_id = %s
-        """, (data['user_id'], data['trip_id']))
+        run_query(cursor, "calification_by_user_trip", (data['user_id'], data['trip_id']))
         
         existing = cursor.fetchone()
         
@@ -3898,7 +5906,10 @@ def create_ranger_calification():
         ))
         
         result = cursor.fetchone()
+        apply_rating_delta(cursor, data['trip_id'], calification, 1, int(has_review(data.get('user_comment'))))
         connection.commit()
+        invalidate_cache('rangers')
+        invalidate_explorer_dashboard(data['user_id'])
         
         return jsonify({
             "message": "Calificación del Ranger registrada correctamente",
@@ -3918,6 +5929,7 @@ def create_ranger_calification():
         if connection: connection.close()
 
 @app.route('/api/ranger-califications/<calification_id>', methods=['PUT'])
+@require_auth_or_legacy_user
 def update_ranger_calification(calification_id):
     """Actualiza una calificación de Ranger existente"""
     connection = get_db_connection()
@@ -3941,7 +5953,7 @@ def update_ranger_calification(calification_id):
         cursor = connection.cursor(cursor_factory=RealDictCursor)
         
         # Verificar que la calificación existe
-        cursor.execute("SELECT id, user_id FROM ranger_califications WHERE id = %s", (calification_id,))
+        run_query(cursor, "calification_by_id", (calification_id,))
         existing = cursor.fetchone()
         
         if not existing:
@@ -3952,20 +5964,12 @@ def update_ranger_calification(calification_id):
         if not user_id:
             return jsonify({"error": "Se requiere el ID de usuario para actualizar una calificación"}), 400
         
-        # Verificar que el usuario es un Explorer
-        cursor.execute("""
-            SELECT ur.role_name
-            FROM users u
-            JOIN user_roles ur ON u.role_id = ur.id
-            WHERE u.id = %s
-        """, (user_id,))
-        
-        user_role = cursor.fetchone()
-        if not user_role or user_role['role_name'] != 'Explorer':
+        # Verificar que el usuario es un Explorer (rol del token)
+        if g.user_role != 'Explorer':
             return jsonify({"error": "Solo los explorers pueden modificar calificaciones"}), 403
         
         # Verificar que el usuario es el propietario de la calificación
-        if str(existing['user_id']) != str(user_id):
+        if str(existing['user_id']) != str(user_id) or str(user_id) != str(g.user_id):
             return jsonify({"error": "No tienes permiso para modificar esta calificación"}), 403
         
         # Construir la consulta de actualización dinámicamente
@@ -3986,17 +5990,35 @@ def update_ranger_calification(calification_id):
         # Añadir el ID al final de los parámetros
         params.append(calification_id)
         
-        # Ejecutar la actualización
+        # Ejecutar la actualización; los valores anteriores salen de la fila bloqueada
+        # (FOR UPDATE) y no de la lectura previa, que otra petición pudo cambiar
         query = f"""
-            UPDATE ranger_califications 
+            UPDATE ranger_califications rc
             SET {', '.join(update_fields)}
-            WHERE id = %s
-            RETURNING id, calification, user_comment, created_at
+            FROM (
+                SELECT id, trip_id, calification, user_comment FROM ranger_califications
+                WHERE id = %s
+                FOR UPDATE
+            ) old
+            WHERE rc.id = old.id
+            RETURNING rc.id, rc.calification, rc.user_comment, rc.created_at,
+                      old.trip_id, old.calification AS old_calification, old.user_comment AS old_user_comment
         """
         
         cursor.execute(query, params)
         updated = cursor.fetchone()
+        if not updated:
+            connection.rollback()
+            return jsonify({"error": "Calificación no encontrada"}), 404
+        apply_rating_delta(
+            cursor,
+            updated.pop('trip_id'),
+            updated['calification'] - updated.pop('old_calification'),
+            0,
+            int(has_review(updated['user_comment'])) - int(has_review(updated.pop('old_user_comment')))
+        )
         connection.commit()
+        invalidate_cache('rangers')
         
         # Formatear para JSON
         updated['id'] = str(updated['id'])
@@ -4019,6 +6041,7 @@ def update_ranger_calification(calification_id):
         if connection: connection.close()
 
 @app.route('/api/ranger-califications/<calification_id>', methods=['DELETE'])
+@require_auth_or_legacy_user
 def delete_ranger_calification(calification_id):
     """Elimina una calificación de Ranger existente"""
     connection = get_db_connection()
@@ -4026,43 +6049,41 @@ def delete_ranger_calification(calification_id):
         return jsonify({"error": "Database connection failed"}), 500
 
     try:
-        # Obtener parámetros de la petición
-        user_id = request.args.get('user_id')
-        
-        if not user_id:
-            return jsonify({"error": "Se requiere el ID de usuario para eliminar una calificación"}), 400
+        # El usuario que elimina es el del token
+        user_id = g.user_id
         
         cursor = connection.cursor(cursor_factory=RealDictCursor)
         
         # Verificar que la calificación existe
-        cursor.execute("SELECT id, user_id FROM ranger_califications WHERE id = %s", (calification_id,))
+        run_query(cursor, "calification_by_id", (calification_id,))
         existing = cursor.fetchone()
         
         if not existing:
             return jsonify({"error": "Calificación no encontrada"}), 404
         
-        # Verificar el rol del usuario
-        cursor.execute("""
-            SELECT ur.role_name
-            FROM users u
-            JOIN user_roles ur ON u.role_id = ur.id
-            WHERE u.id = %s
-        """, (user_id,))
-        
-        user_role = cursor.fetchone()
-        if not user_role:
-            return jsonify({"error": "Usuario no encontrado"}), 404
-        
         # Verificar permisos: solo el creador o un administrador pueden eliminar
-        is_admin = user_role['role_name'] == 'Admin'
+        is_admin = g.user_role == 'Admin'
         is_owner = str(existing['user_id']) == str(user_id)
         
         if not (is_admin or is_owner):
             return jsonify({"error": "No tienes permiso para eliminar esta calificación"}), 403
         
-        # Eliminar la calificación
-        cursor.execute("DELETE FROM ranger_califications WHERE id = %s", (calification_id,))
+        # Eliminar la calificación; el delta sale de la fila que borró esta sentencia,
+        # así que un borrado simultáneo de la misma calificación no la descuenta dos veces
+        cursor.execute("""
+            DELETE FROM ranger_califications WHERE id = %s
+            RETURNING trip_id, calification, user_comment
+        """, (calification_id,))
+        deleted = cursor.fetchone()
+        if not deleted:
+            connection.rollback()
+            return jsonify({"error": "Calificación no encontrada"}), 404
+        apply_rating_delta(
+            cursor, deleted['trip_id'], -deleted['calification'], -1, -int(has_review(deleted['user_comment']))
+        )
         connection.commit()
+        invalidate_cache('rangers')
+        invalidate_explorer_dashboard(existing['user_id'])
         
         return jsonify({
             "message": "Calificación eliminada correctamente"
@@ -4090,7 +6111,7 @@ def get_trip_ranger_califications(trip_id):
         cursor = connection.cursor(cursor_factory=RealDictCursor)
         
         # Verificar que el viaje existe
-        cursor.execute("SELECT id FROM trips WHERE id = %s", (trip_id,))
+        run_query(cursor, "trip_exists", (trip_id,))
         if not cursor.fetchone():
             return jsonify({"error": "Viaje no encontrado"}), 404
         
@@ -4113,13 +6134,6 @@ def get_trip_ranger_califications(trip_id):
         
         califications = cursor.fetchall()
         
-        # Formatear IDs y fechas para JSON
-        for cal in califications:
-            cal['id'] = str(cal['id'])
-            cal['trip_id'] = str(cal['trip_id'])
-            cal['user_id'] = str(cal['user_id'])
-            cal['created_at'] = cal['created_at'].isoformat() if cal['created_at'] else None
-        
         return jsonify(califications), 200
 
     except Exception as e:
@@ -4141,22 +6155,21 @@ def get_trip_ranger_rating(trip_id):
     try:
         cursor = connection.cursor(cursor_factory=RealDictCursor)
         
-        # Verificar que el viaje existe
-        cursor.execute("SELECT id FROM trips WHERE id = %s", (trip_id,))
-        if not cursor.fetchone():
-            return jsonify({"error": "Viaje no encontrado"}), 404
-        
-        # Obtener el promedio y conteo de calificaciones
+        # Agregados del viaje (búsqueda por clave primaria)
         cursor.execute("""
             SELECT 
-                AVG(calification) as average,
-                COUNT(id) as count
-            FROM ranger_califications
-            WHERE trip_id = %s
+                t.id,
+                COALESCE(trs.rating_sum, 0) as rating_sum,
+                COALESCE(trs.rating_count, 0) as count
+            FROM trips t
+            LEFT JOIN trip_rating_stats trs ON trs.trip_id = t.id
+            WHERE t.id = %s
         """, (trip_id,))
         
         result = cursor.fetchone()
-        average = float(result['average']) if result['average'] else 0
+        if not result:
+            return jsonify({"error": "Viaje no encontrado"}), 404
+        average = float(result['rating_sum'] / result['count']) if result['count'] else 0
         
         return jsonify({
             "trip_id": trip_id,
@@ -4193,20 +6206,23 @@ def get_rangers_list():
                 u.first_name,
                 u.last_name,
                 u.profile_picture_url,
-                u.calification,
+                CASE WHEN rs.rating_count > 0 THEN rs.rating_sum / rs.rating_count
+                     ELSE u.calification END AS calification,
                 u.is_active,
                 r.title,
-                (SELECT COUNT(*) FROM trips t WHERE t.lead_ranger = u.id) as trips_count
+                COALESCE(rs.trips_led, 0) as trips_count
             FROM 
                 users u
             JOIN 
                 user_roles ur ON u.role_id = ur.id
             LEFT JOIN 
                 ranger_details r ON u.id = r.user_id
+            LEFT JOIN 
+                ranger_stats rs ON rs.ranger_id = u.id
             WHERE 
                 ur.role_name = 'Ranger'
             ORDER BY
-                u.calification DESC NULLS LAST
+                calification DESC NULLS LAST
         """)
         
         rangers = cursor.fetchall()
@@ -4234,5 +6250,201 @@ def get_rangers_list():
     finally:
         if 'cursor' in locals(): cursor.close()
         if connection: connection.close()             
+@app.route('/admin/rating-drift', methods=['GET', 'POST'])
+@require_auth('Admin')
+def check_rating_drift():
+    """Compara los agregados de calificación con un recálculo completo; POST corrige las diferencias"""
+    connection = get_db_connection()
+    if not connection:
+        return jsonify({"error": "Database connection failed"}), 500
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute(RATING_DRIFT_SQL)
+        drift = cursor.fetchall()
+
+        repaired = False
+        if request.method == 'POST' and drift:
+            refresh_trip_rating_stats(cursor, [row['id'] for row in drift if row['scope'] == 'trip'])
+            refresh_ranger_stats(cursor, *[row['id'] for row in drift if row['scope'] == 'ranger'])
+            connection.commit()
+            invalidate_cache('rangers')
+            repaired = True
+
+        return jsonify({
+            "drift_count": len(drift),
+            "drift": drift,
+            "repaired": repaired
+        }), 200
+    except Exception as e:
+        connection.rollback()
+        logging.error(f"Error verificando agregados de calificación: {e}")
+        return jsonify({"error": "Error interno al verificar agregados", "details": str(e)}), 500
+    finally:
+        cursor.close()
+        connection.close()
+
+@app.route('/admin/slow-queries', methods=['GET'])
+@require_auth('Admin')
+def get_slow_queries():
+    """Últimas consultas lentas con sus parámetros ocultos y, si se muestrearon, su EXPLAIN ANALYZE"""
+    with _slow_queries_lock:
+        entries = list(SLOW_QUERIES)
+    if request.args.get('route'):
+        entries = [entry for entry in entries if entry["route"] == request.args['route']]
+    return jsonify({
+        "threshold_ms": SLOW_QUERY_MS,
+        "explain_sample": SLOW_QUERY_EXPLAIN_SAMPLE,
+        "buffer_size": SLOW_QUERY_BUFFER_SIZE,
+        "queries": entries[::-1]
+    }), 200
+
+@app.route('/admin/query-stats', methods=['GET'])
+@require_auth('Admin')
+def get_query_stats():
+    """Ejecuciones, preparaciones y tiempos de las consultas del registro"""
+    with _query_stats_lock:
+        stats = {name: dict(counters) for name, counters in QUERY_STATS.items()}
+    for counters in stats.values():
+        counters["avg_ms"] = round(counters["total_ms"] / counters["calls"], 3) if counters["calls"] else None
+        counters["total_ms"] = round(counters["total_ms"], 3)
+        counters["max_ms"] = round(counters["max_ms"], 3)
+    return jsonify({
+        "prepared_statements": not DB_PGBOUNCER_TRANSACTION_MODE,
+        "queries": stats
+    }), 200
+
+@app.route('/admin/cache-stats', methods=['GET'])
+@require_auth('Admin')
+def get_cache_stats():
+    """Aciertos, fallos, desalojos e invalidaciones de la caché por endpoint"""
+    with _cache_stats_lock:
+        stats = {namespace: dict(counters) for namespace, counters in CACHE_STATS.items()}
+    for counters in stats.values():
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_ratio"] = round(counters["hits"] / lookups, 3) if lookups else None
+    return jsonify({
+        "backend": type(CACHE_BACKEND).__name__,
+        "endpoints": stats
+    }), 200
+
+@app.route('/admin/runtime-metrics', methods=['GET'])
+@require_auth('Admin')
+def get_runtime_metrics():
+    """Métricas de arranque en frío/caliente y del pool de conexiones de este proceso"""
+    with _runtime_metrics_lock:
+        warm_requests = RUNTIME_METRICS["warm_requests"]
+        metrics = {
+            "uptime_seconds": round(time.perf_counter() - PROCESS_STARTED_AT, 2),
+            "cold_start": RUNTIME_METRICS["cold_start"],
+            "warm": {
+                "requests": warm_requests,
+                "avg_ms": round(RUNTIME_METRICS["warm_total_ms"] / warm_requests, 2) if warm_requests else None,
+                "max_ms": round(RUNTIME_METRICS["warm_max_ms"], 2),
+            },
+        }
+    metrics["async_views"] = ASYNC_VIEWS
+    metrics["db_pool"] = {
+        "initialized": _db_pool is not None,
+        "pgbouncer_transaction_mode": DB_PGBOUNCER_TRANSACTION_MODE,
+        "min": DB_POOL_MIN,
+        "max": DB_POOL_MAX,
+        **(_db_pool.stats if _db_pool is not None else {}),
+    }
+    if _async_db_pool is not None:
+        metrics["async_db_pool"] = _async_db_pool.get_stats()
+    return jsonify(metrics), 200
+
+def _metric_labels(**labels):
+    escaped = (
+        f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _render_histogram(lines, name, histogram, **labels):
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        lines.append(f"{name}_bucket{_metric_labels(**labels, le=bound)} {count}")
+    lines.append(f"{name}_bucket{_metric_labels(**labels, le='+Inf')} {histogram.count}")
+    lines.append(f"{name}_sum{_metric_labels(**labels)} {histogram.sum}")
+    lines.append(f"{name}_count{_metric_labels(**labels)} {histogram.count}")
+
+
+@app.route('/metrics', methods=['GET'])
+def get_prometheus_metrics():
+    """Latencia, códigos de estado y tiempo de base de datos por ruta, en formato de texto de Prometheus"""
+    lines = []
+
+    def header(name, kind, description):
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    with _route_metrics_lock:
+        header("rangerhub_http_requests_in_flight", "gauge", "Peticiones en curso")
+        lines.append(f"rangerhub_http_requests_in_flight {_in_flight['requests']}")
+
+        header("rangerhub_http_requests_total", "counter", "Peticiones por ruta, método y código de estado")
+        for (route, method, status), count in sorted(STATUS_METRICS.items()):
+            lines.append(f"rangerhub_http_requests_total{_metric_labels(route=route, method=method, status=status)} {count}")
+
+        sections = [
+            ("latency", "rangerhub_http_request_duration_seconds", "Latencia de la petición"),
+            ("db_queries", "rangerhub_db_queries_per_request", "Consultas SQL ejecutadas por petición"),
+            ("db_time", "rangerhub_db_time_per_request_seconds", "Tiempo esperando a PostgreSQL por petición"),
+        ]
+        for key, name, description in sections:
+            header(name, "histogram", description)
+            for (route, method), metrics in sorted(ROUTE_METRICS.items()):
+                _render_histogram(lines, name, metrics[key], route=route, method=method)
+
+    with _query_stats_lock:
+        query_stats = {name: dict(counters) for name, counters in QUERY_STATS.items()}
+    header("rangerhub_named_query_calls_total", "counter", "Ejecuciones de cada consulta del registro")
+    for name, counters in sorted(query_stats.items()):
+        lines.append(f"rangerhub_named_query_calls_total{_metric_labels(query=name)} {counters['calls']}")
+    header("rangerhub_named_query_prepares_total", "counter", "PREPARE emitidos por cada consulta del registro")
+    for name, counters in sorted(query_stats.items()):
+        lines.append(f"rangerhub_named_query_prepares_total{_metric_labels(query=name)} {counters['prepares']}")
+    header("rangerhub_named_query_duration_seconds_total", "counter", "Tiempo acumulado de cada consulta del registro")
+    for name, counters in sorted(query_stats.items()):
+        lines.append(f"rangerhub_named_query_duration_seconds_total{_metric_labels(query=name)} {counters['total_ms'] / 1000}")
+
+    with _cache_stats_lock:
+        cache_stats = {namespace: dict(counters) for namespace, counters in CACHE_STATS.items()}
+    header("rangerhub_cache_events_total", "counter", "Eventos de la caché de respuestas por namespace")
+    for namespace, counters in sorted(cache_stats.items()):
+        for event, count in sorted(counters.items()):
+            lines.append(f"rangerhub_cache_events_total{_metric_labels(namespace=namespace, event=event)} {count}")
+
+    with _runtime_metrics_lock:
+        cold_start = RUNTIME_METRICS["cold_start"]
+    header("rangerhub_uptime_seconds", "gauge", "Segundos desde que se cargó el proceso")
+    lines.append(f"rangerhub_uptime_seconds {time.perf_counter() - PROCESS_STARTED_AT}")
+    if cold_start:
+        header("rangerhub_cold_start_seconds", "gauge", "Arranque en frío: carga hasta la primera petición y duración de esta")
+        lines.append(f"rangerhub_cold_start_seconds{_metric_labels(phase='init_to_first_request')} "
+                     f"{cold_start['init_to_first_request_ms'] / 1000}")
+        lines.append(f"rangerhub_cold_start_seconds{_metric_labels(phase='first_request')} "
+                     f"{cold_start['first_request_ms'] / 1000}")
+
+    header("rangerhub_db_pool_max_connections", "gauge", "Tamaño máximo del pool de conexiones")
+    lines.append(f"rangerhub_db_pool_max_connections {DB_POOL_MAX}")
+    if _db_pool is not None:
+        for stat, value in sorted(_db_pool.stats.items()):
+            header(f"rangerhub_db_pool_{stat}_total", "counter", f"Pool de conexiones: {stat}")
+            lines.append(f"rangerhub_db_pool_{stat}_total {value}")
+
+    return app.response_class("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+# Vistas async que reemplazan a las secuenciales con ASYNC_VIEWS=true (mismo endpoint y caché)
+ASYNC_VIEW_FUNCTIONS = {
+    'get_ranger_details': cached_response('rangers', ttl=60)(get_ranger_details_async),
+    'get_ranger_certifications': get_ranger_certifications_async,
+}
+
+if ASYNC_VIEWS:
+    app.view_functions.update(ASYNC_VIEW_FUNCTIONS)
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,117 @@
+"""Compara peticiones/s por proceso entre las vistas secuenciales y las async (ASYNC_VIEWS) con el mismo tamaño de pool.
+
+Reemplaza en la app las vistas de GET /rangers/<id> (sin caché) y
+GET /rangers/<id>/certifications por su versión secuencial (pool de psycopg2)
+o async (pool async de psycopg 3 en el loop de fondo) y las ejercita con el
+cliente de pruebas de Flask desde varios hilos. Ambos pools usan DB_POOL_MAX.
+
+Con una base local las consultas tardan menos de 1 ms y el costo de pasar por
+el loop de fondo pesa más que solaparlas. --server-delay-ms añade esa espera a
+cada consulta del ranger en el servidor (pg_sleep) para simular una base remota.
+
+    DATABASE_URL=postgresql://... DB_POOL_MAX=10 python benchmarks/async_views.py --requests 2000 --clients 20
+    DATABASE_URL=postgresql://... python benchmarks/async_views.py --clients 2 --server-delay-ms 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "api"))
+
+import index  # noqa: E402
+
+MODES = {
+    # La ficha del ranger se mide sin la caché para que cada petición llegue a la base
+    "secuencial": {
+        "get_ranger_details": index.get_ranger_details.__wrapped__,
+        "get_ranger_certifications": index.get_ranger_certifications,
+    },
+    "async": {
+        "get_ranger_details": index.get_ranger_details_async,
+        "get_ranger_certifications": index.get_ranger_certifications_async,
+    },
+}
+
+RANGER_QUERIES = ("RANGER_DETAILS_QUERY", "RANGER_IS_RANGER_QUERY", "RANGER_CERTIFICATIONS_QUERY")
+
+
+def add_server_delay(delay_ms):
+    """Hace que cada consulta del ranger espere delay_ms en el servidor antes de responder"""
+    for name in RANGER_QUERIES:
+        query = getattr(index, name).replace("WHERE", "WHERE (SELECT 1 FROM delay) = 1 AND", 1)
+        setattr(index, name, f"WITH delay AS MATERIALIZED (SELECT pg_sleep({delay_ms / 1000})) {query}")
+
+
+def pick_ranger():
+    connection = index.get_db_connection()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT u.id FROM users u
+                JOIN user_roles ur ON u.role_id = ur.id
+                WHERE ur.role_name = 'Ranger'
+                LIMIT 1
+            """)
+            row = cursor.fetchone()
+    finally:
+        connection.close()
+    if not row:
+        sys.exit("No hay usuarios con rol Ranger")
+    return str(row["id"])
+
+
+def run(mode, path, total, clients):
+    index.app.view_functions.update(MODES[mode])
+    client = index.app.test_client()
+    latencies = []
+
+    def one(_):
+        started = time.perf_counter()
+        response = client.get(path)
+        latencies.append((time.perf_counter() - started) * 1000)
+        return response.status_code
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(one, range(min(clients, total))))  # calentamiento
+        latencies.clear()
+        started = time.perf_counter()
+        statuses = list(pool.map(one, range(total)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "req_per_s": total / elapsed,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+        "errors": sum(status != 200 for status in statuses),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ranger-id", help="por defecto, el primer ranger de la base")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=20, help="peticiones concurrentes")
+    parser.add_argument("--server-delay-ms", type=float, default=0, help="espera por consulta en el servidor")
+    args = parser.parse_args()
+
+    ranger_id = args.ranger_id or pick_ranger()
+    paths = [f"/rangers/{ranger_id}", f"/rangers/{ranger_id}/certifications"]
+    if args.server_delay_ms:
+        add_server_delay(args.server_delay_ms)
+    print(f"pool={index.DB_POOL_MAX} clients={args.clients} requests={args.requests} "
+          f"server_delay_ms={args.server_delay_ms:g}")
+    print(f"{'ruta':<64} {'modo':>10} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'errores':>8}")
+    for path in paths:
+        for mode in MODES:
+            result = run(mode, path, args.requests, args.clients)
+            print(f"{path:<64} {mode:>10} {result['req_per_s']:>9.1f} {result['p50_ms']:>8.2f} "
+                  f"{result['p95_ms']:>8.2f} {result['errors']:>8}")
+    index.close_async_db_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+"""Micro-benchmarks por endpoint contra un PostgreSQL local desechable con datos generados.
+
+Levanta un clúster temporal con initdb/pg_ctl (de PG_BIN o del PATH), carga
+rangerhub_schema.sql, genera datos, aplica migrations/ (que rellenan los
+modelos de lectura) y mide cada ruta con el cliente de pruebas de Flask.
+Escribe percentiles, throughput y consultas por petición en JSON para comparar
+resultados entre commits. La caché de respuestas se desactiva salvo --with-cache.
+
+    python benchmarks/endpoint_suite.py
+    python benchmarks/endpoint_suite.py --requests 500 --output antes.json
+    python benchmarks/endpoint_suite.py --compare antes.json
+"""
+import argparse
+import datetime
+import glob
+import json
+import logging
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "api"))
+sys.path.insert(0, os.path.join(ROOT, "migrations"))
+
+import migrate  # noqa: E402
+
+BENCH_USER = "bench"
+BENCH_PASSWORD = "bench-password"
+
+# Tamaño por defecto de los datos generados (se sobrescribe con --rangers, --trips...)
+SEED_DEFAULTS = {
+    "rangers": 200,
+    "explorers": 2000,
+    "locations": 500,
+    "trips": 2000,
+    "activities_per_trip": 5,
+    "reservations_per_trip": 10,
+}
+
+SEED_SQL = """
+    INSERT INTO user_roles (role_name, description) VALUES
+        ('Ranger', 'Guía'), ('Explorer', 'Viajero'), ('Admin', 'Administrador');
+
+    INSERT INTO users (username, first_name, last_name, nationality, role_id, email,
+                       user_status, country, biography, biography_extend, calification)
+    SELECT 'ranger_' || i, 'Ranger', 'N' || i, 'Chilena',
+           (SELECT id FROM user_roles WHERE role_name = 'Ranger'),
+           'ranger_' || i || '@bench.local',
+           CASE WHEN i %% 5 = 0 THEN 'inactivo' ELSE 'activo' END,
+           (ARRAY['Chile', 'Argentina', 'Perú'])[1 + i %% 3],
+           'Guía de montaña',
+           jsonb_build_object('title', 'Guía', 'specialties', jsonb_build_array('trekking', 'kayak'),
+                              'languages', jsonb_build_array('es', 'en')),
+           round((3 + random() * 2)::numeric, 1)
+    FROM generate_series(1, %(rangers)s) AS i;
+
+    INSERT INTO users (username, first_name, last_name, nationality, role_id, email)
+    SELECT 'explorer_' || i, 'Explorer', 'N' || i, 'Chilena',
+           (SELECT id FROM user_roles WHERE role_name = 'Explorer'),
+           'explorer_' || i || '@bench.local'
+    FROM generate_series(1, %(explorers)s) AS i;
+
+    INSERT INTO users (username, first_name, last_name, nationality, role_id, email, password)
+    VALUES (%(bench_user)s, 'Bench', 'User', 'Chilena',
+            (SELECT id FROM user_roles WHERE role_name = 'Explorer'),
+            'bench@bench.local', %(bench_password_hash)s);
+
+    INSERT INTO locations (place_name, place_type, country, province, nearest_city, coordinates)
+    SELECT 'Lugar ' || i, (ARRAY['parque', 'reserva', 'volcán'])[1 + i %% 3],
+           (ARRAY['Chile', 'Argentina', 'Perú'])[1 + i %% 3],
+           'Provincia ' || (i %% 25), 'Ciudad ' || (i %% 60),
+           point(-55 + random() * 38, -75 + random() * 8)
+    FROM generate_series(1, %(locations)s) AS i;
+
+    INSERT INTO activity_categories (name, description)
+    SELECT 'Categoría ' || i, 'Categoría generada' FROM generate_series(1, 8) AS i;
+
+    INSERT INTO activities (category_id, location_id, name, description, duration, difficulty,
+                            min_participants, max_participants, cost)
+    SELECT (SELECT id FROM activity_categories ORDER BY name OFFSET i %% 8 LIMIT 1),
+           l.id, 'Actividad ' || l.place_name || ' ' || i, 'Actividad generada',
+           1 + i %% 6, (ARRAY['baja', 'media', 'alta'])[1 + i %% 3], 1, 12, 10000 + i * 10
+    FROM locations l, generate_series(1, 2) AS i;
+
+    INSERT INTO resources (name, description, cost)
+    SELECT 'Recurso ' || i, jsonb_build_object('detalle', 'generado'), 5000 + i
+    FROM generate_series(1, 50) AS i;
+
+    WITH rangers AS (
+        SELECT array_agg(u.id ORDER BY u.username) AS ids FROM users u
+        JOIN user_roles r ON r.id = u.role_id WHERE r.role_name = 'Ranger'
+    )
+    INSERT INTO trips (trip_name, start_date, end_date, max_participants_number,
+                       trip_status, total_cost, lead_ranger, description)
+    SELECT 'Viaje ' || i,
+           now() + ((i %% 365) - 180) * interval '1 day',
+           now() + ((i %% 365) - 177) * interval '1 day',
+           %(participants)s, 'pendiente', 150000 + i,
+           ids[1 + i %% array_length(ids, 1)], 'Viaje generado'
+    FROM rangers, generate_series(1, %(trips)s) AS i;
+
+    WITH numbered_trips AS (
+        SELECT id, row_number() OVER (ORDER BY trip_name) AS n FROM trips
+    ), numbered_activities AS (
+        SELECT id, row_number() OVER (ORDER BY name) AS n, count(*) OVER () AS total FROM activities
+    )
+    INSERT INTO activity_trips (activity_id, trip_id)
+    SELECT a.id, t.id
+    FROM numbered_trips t, generate_series(0, %(activities_per_trip)s - 1) AS j, numbered_activities a
+    WHERE a.n = 1 + (t.n * %(activities_per_trip)s + j) %% a.total;
+
+    WITH numbered_trips AS (
+        SELECT id, row_number() OVER (ORDER BY trip_name) AS n FROM trips
+    ), numbered_resources AS (
+        SELECT id, row_number() OVER (ORDER BY name) AS n FROM resources
+    )
+    INSERT INTO trip_resources (resource_id, trip_id)
+    SELECT r.id, t.id
+    FROM numbered_trips t, generate_series(0, 2) AS j, numbered_resources r
+    WHERE r.n = 1 + (t.n * 3 + j) %% 50;
+
+    WITH numbered_trips AS (
+        SELECT id, row_number() OVER (ORDER BY trip_name) AS n FROM trips
+    ), numbered_explorers AS (
+        SELECT u.id, row_number() OVER (ORDER BY u.username) AS n, count(*) OVER () AS total
+        FROM users u JOIN user_roles r ON r.id = u.role_id
+        WHERE r.role_name = 'Explorer' AND u.username <> %(bench_user)s
+    )
+    INSERT INTO reservations (trip_id, user_id, status)
+    SELECT t.id, e.id, 'confirmada'
+    FROM numbered_trips t, generate_series(0, %(reservations_per_trip)s - 1) AS j, numbered_explorers e
+    WHERE e.n = 1 + (t.n * %(reservations_per_trip)s + j) %% e.total;
+
+    INSERT INTO payments (user_id, trip_id, payment_amount, payment_method, payment_date,
+                          payment_voucher_url, payment_status)
+    SELECT r.user_id, r.trip_id, 150000, 'transferencia', CURRENT_DATE,
+           'https://bench.local/vouchers/' || r.id || '.pdf',
+           (ARRAY['Pendiente', 'Confirmado', 'Rechazado'])[1 + abs(hashtext(r.id::text)) %% 3]
+    FROM reservations r;
+
+    INSERT INTO ranger_califications (trip_id, user_id, calification, user_comment)
+    SELECT r.trip_id, r.user_id, round((1 + random() * 4)::numeric, 1),
+           CASE WHEN random() < 0.5 THEN 'Muy buen viaje' END
+    FROM reservations r
+    JOIN trips t ON t.id = r.trip_id
+    WHERE t.end_date < now();
+"""
+
+
+class NoCache:
+    """Backend de caché que nunca acierta, para que cada petición llegue a la base"""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl):
+        pass
+
+    def delete_prefix(self, prefix):
+        pass
+
+
+def locate_pg_bin():
+    """Directorio con initdb/pg_ctl (PG_BIN, PATH o rutas habituales), o None"""
+    candidates = [os.getenv("PG_BIN")] if os.getenv("PG_BIN") else []
+    if shutil.which("initdb"):
+        candidates.append(os.path.dirname(shutil.which("initdb")))
+    candidates += sorted(glob.glob("/usr/lib/postgresql/*/bin"), reverse=True)
+    candidates += sorted(glob.glob("/usr/local/opt/postgresql*/bin"), reverse=True)
+    for candidate in candidates:
+        if os.path.exists(os.path.join(candidate, "initdb")):
+            return candidate
+    return None
+
+
+def find_pg_bin():
+    pg_bin = locate_pg_bin()
+    if pg_bin is None:
+        sys.exit("No se encontró initdb; instala PostgreSQL o define PG_BIN")
+    return pg_bin
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ThrowawayPostgres:
+    """Clúster PostgreSQL temporal, solo accesible por socket Unix, que se borra al salir"""
+
+    def __init__(self, pg_bin):
+        self.pg_bin = pg_bin
+        self.workdir = tempfile.mkdtemp(prefix="rangerhub-bench-")
+        self.datadir = os.path.join(self.workdir, "data")
+        self.port = free_port()
+
+    def _run(self, tool, *args):
+        subprocess.run([os.path.join(self.pg_bin, tool), *args], check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def start(self):
+        self._run("initdb", "-D", self.datadir, "-U", "bench", "-A", "trust", "-E", "UTF8", "--no-sync")
+        options = f"-p {self.port} -k {self.workdir} -c listen_addresses='' -c fsync=off " \
+                  f"-c synchronous_commit=off -c full_page_writes=off"
+        self._run("pg_ctl", "-D", self.datadir, "-o", options, "-l",
+                  os.path.join(self.workdir, "postgres.log"), "-w", "start")
+        admin = psycopg2.connect(host=self.workdir, port=self.port, user="bench", dbname="postgres")
+        admin.autocommit = True
+        with admin.cursor() as cursor:
+            cursor.execute("CREATE DATABASE rangerhub")
+        admin.close()
+        return f"host={self.workdir} port={self.port} user=bench dbname=rangerhub"
+
+    def stop(self):
+        try:
+            self._run("pg_ctl", "-D", self.datadir, "-m", "fast", "-w", "stop")
+        finally:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def prepare_database(dsn, args, index):
+    connection = psycopg2.connect(dsn)
+    try:
+        with open(os.path.join(ROOT, "rangerhub_schema.sql"), encoding="utf-8") as f:
+            schema = f.read()
+        with connection.cursor() as cursor:
+            cursor.execute(schema)
+            cursor.execute(SEED_SQL, {
+                "rangers": args.rangers,
+                "explorers": args.explorers,
+                "locations": args.locations,
+                "trips": args.trips,
+                "participants": args.reservations_per_trip * 2,
+                "activities_per_trip": args.activities_per_trip,
+                "reservations_per_trip": args.reservations_per_trip,
+                "bench_user": BENCH_USER,
+                "bench_password_hash": index.hash_password(BENCH_PASSWORD),
+            })
+        connection.commit()
+        # Las migraciones crean los índices y rellenan ranger_stats, trip_rating_stats y seats_taken
+        migrate.migrate(connection, out=sys.stderr)
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute("VACUUM ANALYZE")
+            cursor.execute("SHOW server_version")
+            server_version = cursor.fetchone()[0]
+            cursor.execute("""
+                SELECT t.id FROM trips t
+                JOIN reservations r ON r.trip_id = t.id
+                GROUP BY t.id ORDER BY count(*) DESC, t.id LIMIT 1
+            """)
+            trip_id = str(cursor.fetchone()[0])
+    finally:
+        connection.close()
+    return server_version, trip_id
+
+
+def scenarios(trip_id):
+    """(nombre, método, ruta, cuerpo JSON)"""
+    return [
+        ("POST /login", "POST", "/login", {"username": BENCH_USER, "password": BENCH_PASSWORD}),
+        ("GET /trips", "GET", "/trips", None),
+        ("GET /trips?limit=50", "GET", "/trips?limit=50", None),
+        ("GET /rangers", "GET", "/rangers", None),
+        ("GET /locations", "GET", "/locations", None),
+        ("GET /locations?search=", "GET", "/locations?search=lugar%201", None),
+        ("GET /trips/<id>/activities", "GET", f"/trips/{trip_id}/activities", None),
+        ("GET /trips/<id>/full", "GET", f"/trips/{trip_id}/full", None),
+        ("GET /payments/trip/<id>", "GET", f"/payments/trip/{trip_id}", None),
+    ]
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def measure(index, method, path, body, requests, clients, warmup):
+    client = index.app.test_client()
+
+    def one(_):
+        started = time.perf_counter()
+        response = client.open(path, method=method, json=body)
+        return response.status_code, (time.perf_counter() - started) * 1000
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(one, range(warmup)))
+        with index._route_metrics_lock:
+            index.ROUTE_METRICS.clear()
+        started = time.perf_counter()
+        results = list(pool.map(one, range(requests)))
+        elapsed = time.perf_counter() - started
+
+    latencies = sorted(ms for _, ms in results)
+    statuses = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    with index._route_metrics_lock:
+        route_metrics = list(index.ROUTE_METRICS.values())
+    db_queries = sum(m["db_queries"].sum for m in route_metrics)
+    db_time = sum(m["db_time"].sum for m in route_metrics)
+    return {
+        "requests": requests,
+        "clients": clients,
+        "req_per_s": round(requests / elapsed, 1),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p90_ms": round(percentile(latencies, 0.90), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "max_ms": round(latencies[-1], 3),
+        "db_queries_per_request": round(db_queries / requests, 2),
+        "db_ms_per_request": round(db_time * 1000 / requests, 3),
+        "statuses": statuses,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    header = f"{'ruta':<30} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'consultas':>9}"
+    if baseline:
+        header += f" {'Δp50':>8} {'Δp95':>8}"
+    print(header)
+    for name, route in results["routes"].items():
+        line = (f"{name:<30} {route['req_per_s']:>9.1f} {route['p50_ms']:>9.2f} {route['p95_ms']:>9.2f} "
+                f"{route['p99_ms']:>9.2f} {route['db_queries_per_request']:>9.2f}")
+        previous = (baseline or {}).get("routes", {}).get(name)
+        if previous:
+            for key in ("p50_ms", "p95_ms"):
+                delta = (route[key] - previous[key]) / previous[key] * 100 if previous[key] else 0
+                line += f" {delta:>+7.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=300, help="peticiones medidas por ruta")
+    parser.add_argument("--clients", type=int, default=1, help="peticiones concurrentes")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--rangers", type=int, default=SEED_DEFAULTS["rangers"])
+    parser.add_argument("--explorers", type=int, default=SEED_DEFAULTS["explorers"])
+    parser.add_argument("--locations", type=int, default=SEED_DEFAULTS["locations"])
+    parser.add_argument("--trips", type=int, default=SEED_DEFAULTS["trips"])
+    parser.add_argument("--activities-per-trip", type=int, default=SEED_DEFAULTS["activities_per_trip"])
+    parser.add_argument("--reservations-per-trip", type=int, default=SEED_DEFAULTS["reservations_per_trip"])
+    parser.add_argument("--with-cache", action="store_true", help="mide con la caché de respuestas activa")
+    parser.add_argument("--output", help="archivo JSON de resultados (por defecto benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="resultado JSON anterior contra el que comparar")
+    args = parser.parse_args()
+
+    postgres = ThrowawayPostgres(find_pg_bin())
+    dsn = postgres.start()
+    try:
+        # La app lee la configuración al importarse
+        os.environ["DATABASE_URL"] = dsn
+        os.environ.setdefault("DB_POOL_MAX", str(max(args.clients, 10)))
+        import index
+
+        if not args.with_cache:
+            index.CACHE_BACKEND = NoCache()
+        # Los handlers registran cada petición con logging.info
+        logging.getLogger().setLevel(logging.WARNING)
+
+        server_version, trip_id = prepare_database(dsn, args, index)
+        results = {
+            "commit": git_commit(),
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "postgres": server_version,
+            "python": platform.python_version(),
+            "params": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+            "routes": {},
+        }
+        for name, method, path, body in scenarios(trip_id):
+            print(f"midiendo {name}...", file=sys.stderr)
+            results["routes"][name] = measure(index, method, path, body, args.requests, args.clients, args.warmup)
+        if index._db_pool is not None:
+            index._db_pool.closeall()
+    finally:
+        postgres.stop()
+
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"{(results['commit'] or 'local')[:12]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    print(f"\nresultados en {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Compara la serialización de respuestas de 10k filas antes y después de OrjsonProvider.
+
+"Antes" reproduce lo que hacía GET /payments/trip/<id>: un bucle por fila que
+convierte UUID/Decimal/datetime y luego el encoder estándar de Flask. "Después"
+entrega las filas tal cual al proveedor orjson de la app.
+
+    python benchmarks/json_serialization.py --rows 10000 --runs 20
+"""
+import argparse
+import datetime
+import os
+import statistics
+import sys
+import time
+import uuid
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "api"))
+
+import index  # noqa: E402
+
+
+def make_rows(count):
+    trip_id = uuid.uuid4()
+    started = datetime.datetime(2024, 1, 1, 9, 30)
+    return [{
+        "id": uuid.uuid4(),
+        "user_id": uuid.uuid4(),
+        "trip_id": trip_id,
+        "payment_amount": Decimal("125000.50") + i,
+        "payment_method": "transferencia",
+        "payment_date": started + datetime.timedelta(minutes=i),
+        "payment_voucher_url": f"https://example.com/vouchers/{i}.pdf",
+        "payment_status": "approved",
+    } for i in range(count)]
+
+
+def before(provider, rows):
+    payment_list = []
+    for payment in rows:
+        payment_list.append({
+            "id": str(payment['id']),
+            "user_id": str(payment['user_id']),
+            "trip_id": str(payment['trip_id']),
+            "payment_amount": float(payment['payment_amount']) if payment['payment_amount'] else None,
+            "payment_method": payment['payment_method'],
+            "payment_date": payment['payment_date'].isoformat() if payment['payment_date'] else None,
+            "payment_voucher_url": payment['payment_voucher_url'],
+            "payment_status": payment['payment_status'],
+        })
+    return provider.dumps(payment_list)
+
+
+def after(provider, rows):
+    return provider.dumps(rows)
+
+
+def measure(fn, provider, rows, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn(provider, rows)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    default_provider = DefaultJSONProvider(index.app)
+    cases = [
+        ("antes (bucle + json estándar)", before, default_provider),
+        ("después (orjson nativo)", after, index.app.json),
+    ]
+    print(f"{args.rows} filas, {args.runs} ejecuciones")
+    for name, fn, provider in cases:
+        median, best = measure(fn, provider, rows, args.runs)
+        print(f"{name:<32} mediana {median:8.2f} ms   mínimo {best:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
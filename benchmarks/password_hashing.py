@@ -0,0 +1,61 @@
+"""Mide el throughput de verificación de contraseñas (login) con distintos costos.
+
+Usa las mismas funciones que /login (verify_password sobre el pool acotado de
+hashing) con varios clientes concurrentes, sin tocar la base de datos.
+
+    PASSWORD_HASH_WORKERS=4 python benchmarks/password_hashing.py --costs 60000 120000 240000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "api"))
+
+import index  # noqa: E402
+
+
+def run(cost, clients, logins):
+    stored = index.hash_password("contraseña-de-prueba", iterations=cost)
+    latencies = []
+
+    def one_login(_):
+        started = time.perf_counter()
+        valid, _ = index.verify_password("contraseña-de-prueba", stored, iterations=cost)
+        latencies.append((time.perf_counter() - started) * 1000)
+        return valid
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        assert all(pool.map(one_login, range(logins)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "cost": cost,
+        "logins_per_s": logins / elapsed,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--costs", type=int, nargs="+", default=[30000, 60000, 120000, 240000])
+    parser.add_argument("--clients", type=int, default=16, help="peticiones de login concurrentes")
+    parser.add_argument("--logins", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"workers={index.PASSWORD_HASH_WORKERS} max_pending={index.PASSWORD_HASH_MAX_PENDING} "
+          f"clients={args.clients} logins={args.logins}")
+    print(f"{'iteraciones':>12} {'logins/s':>10} {'p50 ms':>9} {'p95 ms':>9}")
+    for cost in args.costs:
+        result = run(cost, args.clients, args.logins)
+        print(f"{result['cost']:>12} {result['logins_per_s']:>10.1f} "
+              f"{result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
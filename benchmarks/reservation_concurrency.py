@@ -0,0 +1,146 @@
+"""Dispara cientos de POST /reservations simultáneos contra un mismo viaje y mide latencias y resultados.
+
+Herramienta de carga opcional: la verificación de que no hay sobreventa es
+tests/test_reservation_concurrency.py, que reutiliza setup/fire/teardown.
+
+Crea un viaje temporal con --seats cupos y --explorers usuarios, lanza todas las
+reservas a la vez (detrás de una barrera) a través de la app Flask e informa las
+respuestas, las reservas creadas y trips.seats_taken frente a la capacidad, y
+los percentiles de latencia. Al final elimina todo lo que creó. Requiere
+migrations/0007. Cada hilo usa su propio cliente de pruebas y el pool de la app
+se dimensiona con --clients (salvo que DB_POOL_MAX esté definido), para que la
+contención medida sea la del lock del viaje y no la espera por conexiones.
+
+    DATABASE_URL=postgresql://... python benchmarks/reservation_concurrency.py --seats 50 --explorers 400 --clients 50
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "api"))
+
+import psycopg2  # noqa: E402
+from dotenv import load_dotenv  # noqa: E402
+
+
+def connect():
+    load_dotenv()
+    if os.getenv("DATABASE_URL"):
+        return psycopg2.connect(os.getenv("DATABASE_URL"))
+    return psycopg2.connect(
+        dbname=os.getenv("DATABASE_NAME"),
+        user=os.getenv("DATABASE_USER"),
+        password=os.getenv("DATABASE_PASSWORD"),
+        host=os.getenv("DATABASE_HOST"),
+        port=os.getenv("DATABASE_PORT"),
+    )
+
+
+def setup(connection, seats, explorers):
+    tag = uuid.uuid4().hex[:8]
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT id FROM user_roles WHERE role_name = 'Explorer'")
+        role = cursor.fetchone()
+        if not role:
+            sys.exit("No existe el rol 'Explorer'")
+        cursor.execute("""
+            INSERT INTO trips (trip_name, start_date, end_date, max_participants_number)
+            VALUES (%s, now() + interval '30 days', now() + interval '32 days', %s)
+            RETURNING id
+        """, (f"bench-{tag}", seats))
+        trip_id = str(cursor.fetchone()[0])
+        user_ids = []
+        for i in range(explorers):
+            cursor.execute("""
+                INSERT INTO users (username, first_name, last_name, nationality, role_id, email)
+                VALUES (%s, 'Bench', %s, 'CL', %s, %s)
+                RETURNING id
+            """, (f"bench-{tag}-{i}", str(i), role[0], f"bench-{tag}-{i}@example.com"))
+            user_ids.append(str(cursor.fetchone()[0]))
+    connection.commit()
+    return trip_id, user_ids
+
+
+def teardown(connection, trip_id, user_ids):
+    connection.rollback()
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM reservations WHERE trip_id = %s", (trip_id,))
+        cursor.execute("DELETE FROM trips WHERE id = %s", (trip_id,))
+        cursor.execute("DELETE FROM users WHERE id = ANY(%s::uuid[])", (user_ids,))
+    connection.commit()
+
+
+def fire(index, trip_id, user_ids, clients):
+    barrier = threading.Barrier(min(clients, len(user_ids)))
+    local = threading.local()
+    results = []
+
+    def reserve(user_id):
+        # El cliente de pruebas guarda cookies y entorno: uno por hilo
+        if not hasattr(local, "client"):
+            local.client = index.app.test_client()
+        try:
+            barrier.wait(timeout=30)
+        except threading.BrokenBarrierError:
+            pass
+        started = time.perf_counter()
+        response = local.client.post("/reservations", json={
+            "trip_id": trip_id, "user_id": user_id, "status": "pendiente"
+        })
+        results.append((response.status_code, (time.perf_counter() - started) * 1000))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(reserve, user_ids))
+    return results, time.perf_counter() - started
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seats", type=int, default=50)
+    parser.add_argument("--explorers", type=int, default=400, help="reservas simultáneas (una por usuario)")
+    parser.add_argument("--clients", type=int, default=50, help="hilos que disparan las reservas")
+    args = parser.parse_args()
+
+    # La app lee la configuración al importarse: una conexión por hilo
+    load_dotenv()
+    os.environ.setdefault("DB_POOL_MAX", str(args.clients))
+    import index
+
+    connection = connect()
+    trip_id, user_ids = setup(connection, args.seats, args.explorers)
+    try:
+        results, elapsed = fire(index, trip_id, user_ids, args.clients)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM reservations WHERE trip_id = %s", (trip_id,))
+            reserved = cursor.fetchone()[0]
+            cursor.execute("SELECT seats_taken FROM trips WHERE id = %s", (trip_id,))
+            seats_taken = cursor.fetchone()[0]
+    finally:
+        teardown(connection, trip_id, user_ids)
+        connection.close()
+
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    latencies = sorted(ms for _, ms in results)
+    expected = min(args.seats, args.explorers)
+
+    print(f"cupos={args.seats} reservas={args.explorers} clientes={args.clients} "
+          f"pool={index.DB_POOL_MAX} en {elapsed:.2f} s")
+    print("respuestas: " + ", ".join(f"{code}={count}" for code, count in sorted(statuses.items())))
+    print(f"reservas creadas={reserved} seats_taken={seats_taken} esperado={expected}")
+    print(f"latencia p50={percentile(latencies, 0.50):.1f} ms p95={percentile(latencies, 0.95):.1f} ms "
+          f"p99={percentile(latencies, 0.99):.1f} ms máx={latencies[-1]:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
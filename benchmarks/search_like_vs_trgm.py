@@ -0,0 +1,114 @@
+"""Compara la búsqueda LIKE de GET /locations con la consulta de /search, con y sin los índices de migrations/0001.
+
+Levanta el PostgreSQL desechable de endpoint_suite.py con sus datos generados
+(--locations ubicaciones, dos actividades por ubicación) y todas las
+migraciones, y mide index.SEARCH_QUERY tal como la ejecuta GET /search (UNION
+ALL sobre locations y activities, orden por score y LIMIT). Luego repite las
+mediciones dentro de una transacción que elimina los índices de 0001 y la
+revierte al terminar.
+
+    python benchmarks/search_like_vs_trgm.py --locations 100000 --term "ciudad 12"
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+
+import psycopg2
+
+from endpoint_suite import SEED_DEFAULTS, ThrowawayPostgres, find_pg_bin, prepare_database
+
+# Índices de migrations/0001_search_indexes.sql
+SEARCH_INDEXES = [
+    "locations_place_name_trgm_idx",
+    "locations_country_trgm_idx",
+    "locations_province_trgm_idx",
+    "locations_search_tsv_idx",
+    "activities_name_trgm_idx",
+    "activities_search_tsv_idx",
+]
+
+# Filtro de GET /locations?search=
+LIKE_QUERY = """
+    SELECT id FROM locations
+    WHERE LOWER(place_name) LIKE %(pattern)s
+       OR LOWER(country) LIKE %(pattern)s
+       OR LOWER(province) LIKE %(pattern)s
+    ORDER BY id LIMIT 20
+"""
+
+
+def plan_indexes(node):
+    """Nombres de índices usados en un nodo del plan y sus hijos"""
+    found = {node["Index Name"]} if "Index Name" in node else set()
+    for child in node.get("Plans", []):
+        found |= plan_indexes(child)
+    return found
+
+
+def measure(cursor, query, params, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        cursor.execute(query, params)
+        cursor.fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    cursor.execute("EXPLAIN (FORMAT JSON) " + query, params)
+    used = plan_indexes(cursor.fetchone()[0][0]["Plan"])
+    return statistics.median(timings), max(timings), used
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--locations", type=int, default=100_000)
+    parser.add_argument("--runs", type=int, default=5)
+    # Todas las ubicaciones generadas se llaman "Lugar N": un término con "lugar"
+    # supera el umbral trigram en casi todas las filas
+    parser.add_argument("--term", default="ciudad 12")
+    args = parser.parse_args()
+
+    postgres = ThrowawayPostgres(find_pg_bin())
+    dsn = postgres.start()
+    try:
+        os.environ["DATABASE_URL"] = dsn
+        import index
+
+        logging.getLogger().setLevel(logging.WARNING)
+        print(f"Generando datos con {args.locations} ubicaciones...", file=sys.stderr)
+        seed = argparse.Namespace(**dict(SEED_DEFAULTS, locations=args.locations))
+        prepare_database(dsn, seed, index)
+
+        # Misma sentencia que arma GET /search sin filtros ni cursor
+        search_query = index.SEARCH_QUERY + " ORDER BY score DESC, type DESC, id DESC LIMIT %(limit)s"
+        search_params = {"term": args.term, "limit": 21}
+        like_params = {"pattern": f"%{args.term.lower()}%"}
+
+        connection = psycopg2.connect(dsn)
+        try:
+            with connection.cursor() as cursor:
+                results = [
+                    ("LIKE con índices", measure(cursor, LIKE_QUERY, like_params, args.runs)),
+                    ("/search con índices", measure(cursor, search_query, search_params, args.runs)),
+                ]
+                for name in SEARCH_INDEXES:
+                    cursor.execute(f"DROP INDEX {name}")
+                results += [
+                    ("LIKE sin índices", measure(cursor, LIKE_QUERY, like_params, args.runs)),
+                    ("/search sin índices", measure(cursor, search_query, search_params, args.runs)),
+                ]
+        finally:
+            # Revierte los DROP INDEX
+            connection.rollback()
+            connection.close()
+    finally:
+        postgres.stop()
+
+    print(f"{'consulta':<24}{'mediana ms':>12}{'máx ms':>12}  índices")
+    for name, (median, worst, used) in results:
+        print(f"{name:<24}{median:>12.1f}{worst:>12.1f}  {', '.join(sorted(used)) or 'seq scan'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+-- Índices de búsqueda para locations y activities.
+-- Los índices trigram sobre lower(...) también aceleran los filtros LIKE '%x%'
+-- que ya usa GET /locations; los índices tsvector sirven al ranking de /search.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS locations_place_name_trgm_idx
+    ON locations USING gin (lower(place_name) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS locations_country_trgm_idx
+    ON locations USING gin (lower(country) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS locations_province_trgm_idx
+    ON locations USING gin (lower(province) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS locations_search_tsv_idx
+    ON locations USING gin (
+        to_tsvector('simple', place_name || ' ' || country || ' ' || province || ' ' || nearest_city)
+    );
+
+CREATE INDEX IF NOT EXISTS activities_name_trgm_idx
+    ON activities USING gin (lower(name) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS activities_search_tsv_idx
+    ON activities USING gin (
+        to_tsvector('spanish', name || ' ' || description)
+    );
@@ -0,0 +1,10 @@
+-- Índices para GET /locations/nearby.
+-- coordinates se guarda como point(latitud, longitud); el índice GiST permite
+-- el orden k-NN con <-> y el filtro por caja con <@.
+
+CREATE INDEX IF NOT EXISTS locations_coordinates_gist_idx
+    ON locations USING gist (coordinates);
+
+-- Las actividades de cada ubicación se agregan en la misma consulta
+CREATE INDEX IF NOT EXISTS activities_location_id_idx
+    ON activities (location_id);
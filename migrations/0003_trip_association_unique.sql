@@ -0,0 +1,28 @@
+-- Restricciones únicas para que las asociaciones de viajes se inserten con
+-- INSERT ... ON CONFLICT DO NOTHING en un solo round trip.
+
+-- Eliminar duplicados previos (se conserva una fila por par)
+DELETE FROM activity_trips a
+USING activity_trips b
+WHERE a.ctid > b.ctid
+  AND a.activity_id = b.activity_id
+  AND a.trip_id = b.trip_id;
+
+DELETE FROM trip_resources a
+USING trip_resources b
+WHERE a.ctid > b.ctid
+  AND a.resource_id = b.resource_id
+  AND a.trip_id = b.trip_id;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'activity_trips_activity_id_trip_id_key') THEN
+        ALTER TABLE activity_trips
+            ADD CONSTRAINT activity_trips_activity_id_trip_id_key UNIQUE (activity_id, trip_id);
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'trip_resources_trip_id_resource_id_key') THEN
+        ALTER TABLE trip_resources
+            ADD CONSTRAINT trip_resources_trip_id_resource_id_key UNIQUE (trip_id, resource_id);
+    END IF;
+END
+$$;
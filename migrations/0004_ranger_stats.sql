@@ -0,0 +1,30 @@
+-- Modelo de lectura con las estadísticas de cada ranger. La API lo mantiene
+-- incrementalmente en cada escritura de viajes y calificaciones; el endpoint
+-- /admin/update-all-rangers-trip-counts lo reconstruye completo.
+
+CREATE INDEX IF NOT EXISTS trips_lead_ranger_idx ON trips (lead_ranger);
+CREATE INDEX IF NOT EXISTS ranger_califications_trip_id_idx ON ranger_califications (trip_id);
+
+CREATE TABLE IF NOT EXISTS ranger_stats (
+    ranger_id uuid PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    trips_led integer NOT NULL DEFAULT 0,
+    review_count integer NOT NULL DEFAULT 0,
+    rating_sum numeric(12,1) NOT NULL DEFAULT 0,
+    rating_count integer NOT NULL DEFAULT 0,
+    last_trip_date timestamptz,
+    updated_at timestamptz NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Carga inicial
+INSERT INTO ranger_stats (ranger_id, trips_led, review_count, rating_sum, rating_count, last_trip_date)
+SELECT t.lead_ranger,
+       COUNT(DISTINCT t.id),
+       COUNT(rc.id) FILTER (WHERE NULLIF(btrim(rc.user_comment), '') IS NOT NULL),
+       COALESCE(SUM(rc.calification), 0),
+       COUNT(rc.id),
+       MAX(t.start_date)
+FROM trips t
+LEFT JOIN ranger_califications rc ON rc.trip_id = t.id
+WHERE t.lead_ranger IS NOT NULL
+GROUP BY t.lead_ranger
+ON CONFLICT (ranger_id) DO NOTHING;
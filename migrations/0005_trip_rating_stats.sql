@@ -0,0 +1,17 @@
+-- Suma y conteo de calificaciones por viaje, mantenidos por la API en cada
+-- alta/edición/baja de ranger_califications (el agregado por ranger vive en
+-- ranger_stats). GET /admin/rating-drift los compara con un recálculo completo.
+
+CREATE TABLE IF NOT EXISTS trip_rating_stats (
+    trip_id uuid PRIMARY KEY REFERENCES trips(id) ON DELETE CASCADE,
+    rating_sum numeric(12,1) NOT NULL DEFAULT 0,
+    rating_count integer NOT NULL DEFAULT 0,
+    updated_at timestamptz NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Carga inicial
+INSERT INTO trip_rating_stats (trip_id, rating_sum, rating_count)
+SELECT trip_id, SUM(calification), COUNT(*)
+FROM ranger_califications
+GROUP BY trip_id
+ON CONFLICT (trip_id) DO NOTHING;
@@ -0,0 +1,43 @@
+-- Índices para los predicados WHERE/JOIN de api/index.py. Se crean con
+-- CONCURRENTLY para no bloquear escrituras, así que el runner aplica este
+-- archivo en modo autocommit, sentencia por sentencia.
+--
+-- Ya cubiertos y no repetidos aquí: users.username y users.email (UNIQUE),
+-- activity_trips (activity_id, trip_id) y trip_resources (trip_id, resource_id)
+-- por 0003, activities.location_id por 0002, ranger_califications.trip_id por 0004.
+
+-- Reservas por viaje (conteos, exploradores, borrado) y por viaje+usuario
+CREATE INDEX CONCURRENTLY IF NOT EXISTS reservations_trip_id_user_id_idx
+    ON reservations (trip_id, user_id);
+-- Reservas y próximo viaje de un explorer
+CREATE INDEX CONCURRENTLY IF NOT EXISTS reservations_user_id_idx
+    ON reservations (user_id);
+
+-- Viajes de un ranger y su próximo viaje (WHERE lead_ranger = ? ORDER BY start_date)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS trips_lead_ranger_start_date_idx
+    ON trips (lead_ranger, start_date);
+-- Reemplazado por el índice compuesto anterior
+DROP INDEX CONCURRENTLY IF EXISTS trips_lead_ranger_idx;
+
+-- Actividades de un viaje (la restricción única empieza por activity_id)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS activity_trips_trip_id_idx
+    ON activity_trips (trip_id);
+-- Viajes que usan un recurso (al eliminar recursos)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS trip_resources_resource_id_idx
+    ON trip_resources (resource_id);
+
+-- Pagos de un viaje y pago de un usuario en un viaje
+CREATE INDEX CONCURRENTLY IF NOT EXISTS payments_trip_id_user_id_idx
+    ON payments (trip_id, user_id);
+
+-- "¿Ya calificó este usuario este viaje?"
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ranger_califications_user_id_trip_id_idx
+    ON ranger_califications (user_id, trip_id);
+
+-- Certificaciones de un ranger (la restricción única empieza por certification_id)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ranger_certifications_user_id_idx
+    ON ranger_certifications (user_id);
+
+-- Listado de rangers por rol
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_role_id_idx
+    ON users (role_id);
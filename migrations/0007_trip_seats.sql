@@ -0,0 +1,15 @@
+-- Cupos ocupados por viaje. POST /reservations reclama el cupo con un UPDATE
+-- condicional sobre la fila del viaje en la misma sentencia que inserta la
+-- reserva, así que reservas concurrentes nunca superan max_participants_number.
+-- Las bajas de reservas lo descuentan en la misma sentencia del DELETE.
+
+ALTER TABLE trips ADD COLUMN IF NOT EXISTS seats_taken integer NOT NULL DEFAULT 0;
+
+-- Carga inicial
+UPDATE trips t
+SET seats_taken = r.taken
+FROM (SELECT trip_id, COUNT(*) AS taken FROM reservations GROUP BY trip_id) r
+WHERE r.trip_id = t.id;
+
+ALTER TABLE trips DROP CONSTRAINT IF EXISTS trips_seats_taken_check;
+ALTER TABLE trips ADD CONSTRAINT trips_seats_taken_check CHECK (seats_taken >= 0);
@@ -0,0 +1,268 @@
+"""Aplica en orden los archivos migrations/NNNN_nombre.sql pendientes.
+
+Cada migración aplicada queda registrada en schema_migrations con el checksum
+SHA-256 del archivo; si un archivo ya aplicado cambia, el runner se detiene.
+Las migraciones que usan CREATE/DROP INDEX CONCURRENTLY (o que declaran
+"-- migrate:no-transaction") se ejecutan sentencia por sentencia en modo
+autocommit, porque PostgreSQL no permite CONCURRENTLY dentro de una transacción.
+
+    python migrations/migrate.py            # aplica las pendientes
+    python migrations/migrate.py status     # muestra el estado
+    python migrations/migrate.py --dry-run  # lista lo que aplicaría
+"""
+import argparse
+import hashlib
+import os
+import re
+import sys
+import time
+
+import psycopg2
+from dotenv import load_dotenv
+
+MIGRATIONS_DIR = os.path.dirname(os.path.abspath(__file__))
+MIGRATION_FILE = re.compile(r"^(\d{4})_([\w-]+)\.sql$")
+NO_TRANSACTION = re.compile(r"--\s*migrate:no-transaction|\bCONCURRENTLY\b", re.IGNORECASE)
+# Evita que dos despliegues migren a la vez
+ADVISORY_LOCK_ID = 727310017
+
+STATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version varchar(4) PRIMARY KEY,
+        name varchar(255) NOT NULL,
+        checksum char(64) NOT NULL,
+        applied_at timestamptz NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        duration_ms integer NOT NULL
+    )
+"""
+
+
+class MigrationError(Exception):
+    """Una migración no se pudo aplicar o no coincide con la registrada"""
+
+
+class Migration:
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+        with open(path, "rb") as f:
+            raw = f.read()
+        self.sql = raw.decode("utf-8")
+        self.checksum = hashlib.sha256(raw).hexdigest()
+
+    @property
+    def transactional(self):
+        return not NO_TRANSACTION.search(self.sql)
+
+
+def connect():
+    load_dotenv()
+    if os.getenv("DATABASE_URL"):
+        return psycopg2.connect(os.getenv("DATABASE_URL"))
+    return psycopg2.connect(
+        dbname=os.getenv("DATABASE_NAME"),
+        user=os.getenv("DATABASE_USER"),
+        password=os.getenv("DATABASE_PASSWORD"),
+        host=os.getenv("DATABASE_HOST"),
+        port=os.getenv("DATABASE_PORT"),
+    )
+
+
+def discover(directory=MIGRATIONS_DIR):
+    """Migraciones del directorio ordenadas por versión"""
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE.match(filename)
+        if match:
+            migrations.append(Migration(match.group(1), match.group(2), os.path.join(directory, filename)))
+    versions = [m.version for m in migrations]
+    duplicated = {v for v in versions if versions.count(v) > 1}
+    if duplicated:
+        raise MigrationError(f"Versiones duplicadas: {', '.join(sorted(duplicated))}")
+    return migrations
+
+
+def split_statements(sql):
+    """Separa un script SQL en sentencias, respetando comillas, $$ y comentarios"""
+    statements, current = [], []
+    i, length = 0, len(sql)
+    while i < length:
+        char = sql[i]
+        if sql.startswith("--", i):
+            end = sql.find("\n", i)
+            end = length if end == -1 else end
+            current.append(sql[i:end])
+            i = end
+            continue
+        if sql.startswith("/*", i):
+            end = sql.find("*/", i + 2)
+            end = length if end == -1 else end + 2
+            current.append(sql[i:end])
+            i = end
+            continue
+        if char in ("'", '"'):
+            end = i + 1
+            while end < length:
+                if sql[end] == char:
+                    if end + 1 < length and sql[end + 1] == char:
+                        end += 2
+                        continue
+                    break
+                end += 1
+            current.append(sql[i:end + 1])
+            i = end + 1
+            continue
+        if char == "$":
+            tag = re.match(r"\$[A-Za-z_]*\$", sql[i:])
+            if tag:
+                end = sql.find(tag.group(0), i + len(tag.group(0)))
+                end = length if end == -1 else end + len(tag.group(0))
+                current.append(sql[i:end])
+                i = end
+                continue
+        if char == ";":
+            statements.append("".join(current))
+            current = []
+            i += 1
+            continue
+        current.append(char)
+        i += 1
+    statements.append("".join(current))
+    # Descarta fragmentos que solo contienen comentarios o espacios
+    meaningful = re.compile(r"^(\s|--[^\n]*(\n|$)|/\*.*?\*/)*$", re.DOTALL)
+    return [s.strip() for s in statements if not meaningful.match(s)]
+
+
+def applied_migrations(cursor):
+    cursor.execute("SELECT version, name, checksum, applied_at FROM schema_migrations ORDER BY version")
+    return {row[0]: row for row in cursor.fetchall()}
+
+
+def verify_checksums(migrations, applied):
+    for migration in migrations:
+        row = applied.get(migration.version)
+        if row and row[2] != migration.checksum:
+            raise MigrationError(
+                f"{migration.version}_{migration.name}.sql cambió después de aplicarse "
+                f"(registrado {row[2][:12]}, actual {migration.checksum[:12]}); "
+                "crea una migración nueva en lugar de editarla"
+            )
+
+
+def invalid_indexes(cursor):
+    """Índices que quedaron INVALID por un CREATE INDEX CONCURRENTLY fallido"""
+    cursor.execute("""
+        SELECT c.relname FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE NOT i.indisvalid
+    """)
+    return [row[0] for row in cursor.fetchall()]
+
+
+def apply(connection, migration):
+    started = time.perf_counter()
+    if migration.transactional:
+        with connection.cursor() as cursor:
+            cursor.execute(migration.sql)
+    else:
+        connection.commit()
+        connection.autocommit = True
+        try:
+            with connection.cursor() as cursor:
+                for statement in split_statements(migration.sql):
+                    cursor.execute(statement)
+        except psycopg2.Error as e:
+            with connection.cursor() as cursor:
+                broken = invalid_indexes(cursor)
+            hint = f"; índices inválidos a eliminar con DROP INDEX CONCURRENTLY: {', '.join(broken)}" if broken else ""
+            raise MigrationError(f"{migration.version}_{migration.name}.sql falló: {e}{hint}") from e
+        finally:
+            connection.autocommit = False
+    duration_ms = int((time.perf_counter() - started) * 1000)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO schema_migrations (version, name, checksum, duration_ms) VALUES (%s, %s, %s, %s)",
+            (migration.version, migration.name, migration.checksum, duration_ms)
+        )
+    connection.commit()
+    return duration_ms
+
+
+def migrate(connection, dry_run=False, out=sys.stdout):
+    """Aplica las migraciones pendientes; devuelve las versiones aplicadas"""
+    migrations = discover()
+    with connection.cursor() as cursor:
+        cursor.execute(STATE_TABLE_SQL)
+        connection.commit()
+        cursor.execute("SELECT pg_advisory_lock(%s)", (ADVISORY_LOCK_ID,))
+    try:
+        with connection.cursor() as cursor:
+            applied = applied_migrations(cursor)
+        connection.commit()
+        verify_checksums(migrations, applied)
+
+        done = []
+        for migration in migrations:
+            if migration.version in applied:
+                continue
+            mode = "transacción" if migration.transactional else "autocommit"
+            if dry_run:
+                print(f"pendiente {migration.version}_{migration.name} ({mode})", file=out)
+                continue
+            try:
+                duration_ms = apply(connection, migration)
+            except MigrationError:
+                raise
+            except psycopg2.Error as e:
+                connection.rollback()
+                raise MigrationError(f"{migration.version}_{migration.name}.sql falló: {e}") from e
+            print(f"aplicada  {migration.version}_{migration.name} ({mode}, {duration_ms} ms)", file=out)
+            done.append(migration.version)
+        return done
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (ADVISORY_LOCK_ID,))
+        connection.commit()
+
+
+def status(connection, out=sys.stdout):
+    migrations = discover()
+    with connection.cursor() as cursor:
+        cursor.execute(STATE_TABLE_SQL)
+        applied = applied_migrations(cursor)
+    connection.commit()
+    for migration in migrations:
+        row = applied.get(migration.version)
+        if not row:
+            state = "pendiente"
+        elif row[2] != migration.checksum:
+            state = "MODIFICADA"
+        else:
+            state = f"aplicada {row[3]:%Y-%m-%d %H:%M}"
+        print(f"{migration.version}_{migration.name:<32} {state}", file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", nargs="?", choices=["up", "status"], default="up")
+    parser.add_argument("--dry-run", action="store_true", help="solo lista las migraciones pendientes")
+    args = parser.parse_args()
+
+    connection = connect()
+    try:
+        if args.command == "status":
+            status(connection)
+        else:
+            applied = migrate(connection, dry_run=args.dry_run)
+            if not args.dry_run and not applied:
+                print("Sin migraciones pendientes")
+    except MigrationError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
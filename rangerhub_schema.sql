@@ -26,10 +26,12 @@ CREATE TABLE users (
     profile_picture_url varchar(255) UNIQUE,
     profile_visibility BOOLEAN NOT NULL DEFAULT TRUE,
     phone_number varchar(25) UNIQUE,
-    calification numeric(2,1)
+    calification numeric(2,1),
     country varchar(30),
     state_province varchar(30),
     languages varchar ARRAY[30],
+    password varchar(255),
+    biography_extend jsonb
 );
 
 
@@ -44,9 +46,10 @@ CREATE TABLE trips (
     created_at TIMESTAMP with time zone DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP with time zone,
     total_cost numeric(10,2),
-    trip_image_url varchar(255)
-    trip_name varchar(50) UNIQUE
-    lead_ranger UUID REFERENCES users(id)
+    trip_image_url varchar(255),
+    trip_name varchar(50) UNIQUE,
+    lead_ranger UUID REFERENCES users(id),
+    seats_taken integer NOT NULL DEFAULT 0 CHECK (seats_taken >= 0)
 );
 
 
@@ -58,7 +61,8 @@ CREATE TABLE payments (
     payment_method VARCHAR(50),
     payment_date date,
     payment_voucher_url varchar(255) UNIQUE,
-    payment_status VARCHAR(50)
+    payment_status VARCHAR(50),
+    updated_at TIMESTAMP with time zone
 );
 
 
@@ -110,7 +114,8 @@ CREATE TABLE activities (
 CREATE TABLE activity_trips (
    id UUID DEFAULT uuid_generate_v4() PRIMARY KEY,
    activity_id uuid NOT NULL REFERENCES activities(id) ON DELETE CASCADE,
-   trip_id uuid NOT NULL REFERENCES trips(id) ON DELETE CASCADE
+   trip_id uuid NOT NULL REFERENCES trips(id) ON DELETE CASCADE,
+   UNIQUE (activity_id, trip_id)
 );
 
 
@@ -126,7 +131,8 @@ CREATE TABLE resources (
 CREATE TABLE trip_resources (
    id UUID DEFAULT uuid_generate_v4() PRIMARY KEY,
    resource_id uuid NOT NULL REFERENCES resources(id),
-   trip_id uuid NOT NULL REFERENCES trips(id)
+   trip_id uuid NOT NULL REFERENCES trips(id),
+   UNIQUE (trip_id, resource_id)
 );
 
 
@@ -150,12 +156,13 @@ CREATE TABLE ranger_certifications (
 );
 
 create table ranger_califications (
-id uuid default uuid_generate_va() primary ke,
+id uuid default uuid_generate_v4() primary key,
 trip_id uuid not null references trips(id) on delete cascade,
 user_id uuid not null references users(id) on delete cascade,
-calification numeric(2,1) not null
-user_comment text
-)
+calification numeric(2,1) not null,
+user_comment text,
+created_at TIMESTAMP with time zone DEFAULT CURRENT_TIMESTAMP
+);
 
 CREATE TABLE ranger_activities (
     id UUID DEFAULT uuid_generate_v4() PRIMARY KEY,
@@ -164,3 +171,19 @@ CREATE TABLE ranger_activities (
     UNIQUE(activity_id, user_id)
 );
 
+CREATE TABLE ranger_stats (
+    ranger_id uuid PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    trips_led integer NOT NULL DEFAULT 0,
+    review_count integer NOT NULL DEFAULT 0,
+    rating_sum numeric(12,1) NOT NULL DEFAULT 0,
+    rating_count integer NOT NULL DEFAULT 0,
+    last_trip_date timestamptz,
+    updated_at timestamptz NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE trip_rating_stats (
+    trip_id uuid PRIMARY KEY REFERENCES trips(id) ON DELETE CASCADE,
+    rating_sum numeric(12,1) NOT NULL DEFAULT 0,
+    rating_count integer NOT NULL DEFAULT 0,
+    updated_at timestamptz NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,57 @@
+import argparse
+import datetime
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+for folder in ("api", "migrations", "benchmarks"):
+    sys.path.insert(0, os.path.join(ROOT, folder))
+
+
+@pytest.fixture(scope="session")
+def seeded_dsn():
+    """DSN de un PostgreSQL desechable con los datos de endpoint_suite y todas las migraciones"""
+    import endpoint_suite
+
+    pg_bin = endpoint_suite.locate_pg_bin()
+    if pg_bin is None:
+        pytest.skip("initdb no disponible (instala PostgreSQL o define PG_BIN)")
+    import index
+
+    postgres = endpoint_suite.ThrowawayPostgres(pg_bin)
+    dsn = postgres.start()
+    try:
+        endpoint_suite.prepare_database(dsn, argparse.Namespace(**endpoint_suite.SEED_DEFAULTS), index)
+        yield dsn
+    finally:
+        postgres.stop()
+
+
+@pytest.fixture(scope="module")
+def app_index(seeded_dsn):
+    """Módulo index con el pool apuntando al PostgreSQL desechable y sin caché de respuestas"""
+    import endpoint_suite
+    import index
+
+    saved = index.DATABASE_URL, index.DB_POOL_MAX, index.CACHE_BACKEND
+    # El pool se crea perezosamente con estos valores en la primera petición
+    index.DATABASE_URL, index.DB_POOL_MAX, index.CACHE_BACKEND = seeded_dsn, 20, endpoint_suite.NoCache()
+    index._db_pool = None
+    yield index
+    if index._db_pool is not None:
+        index._db_pool.closeall()
+    index._db_pool = None
+    index.close_async_db_pool()
+    index.DATABASE_URL, index.DB_POOL_MAX, index.CACHE_BACKEND = saved
+
+
+def bearer(index, user_id, role_name):
+    """Header Authorization con un token firmado como los de POST /login"""
+    token = index.jwt.encode({
+        "user_id": str(user_id),
+        "role_name": role_name,
+        "exp": datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1),
+    }, index.SECRET_KEY, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
@@ -0,0 +1,34 @@
+"""Los endpoints /admin/* de diagnóstico exigen un token de Admin."""
+import uuid
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("psycopg2")
+
+import index  # noqa: E402
+from conftest import bearer  # noqa: E402
+
+# Solo leen contadores en memoria del proceso: no necesitan base de datos
+ENDPOINTS = [
+    "/admin/query-stats",
+    "/admin/cache-stats",
+    "/admin/runtime-metrics",
+]
+
+
+@pytest.mark.parametrize("path", ENDPOINTS)
+def test_requires_token(path):
+    assert index.app.test_client().get(path).status_code == 401
+
+
+@pytest.mark.parametrize("path", ENDPOINTS)
+def test_rejects_other_roles(path):
+    headers = bearer(index, uuid.uuid4(), "Ranger")
+    assert index.app.test_client().get(path, headers=headers).status_code == 403
+
+
+@pytest.mark.parametrize("path", ENDPOINTS)
+def test_allows_admin(path):
+    headers = bearer(index, uuid.uuid4(), "Admin")
+    assert index.app.test_client().get(path, headers=headers).status_code == 200
@@ -0,0 +1,63 @@
+"""Las vistas de ASYNC_VIEWS responden lo mismo que las secuenciales."""
+import uuid
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+pytest.importorskip("psycopg_pool")
+
+# (vista secuencial sin caché, vista async, ruta)
+VIEWS = [
+    ("get_ranger_details", "/rangers/{id}"),
+    ("get_ranger_certifications", "/rangers/{id}/certifications"),
+]
+
+
+@pytest.fixture(scope="module")
+def ids(seeded_dsn):
+    """Un ranger con certificaciones y un explorer (no ranger)"""
+    connection = psycopg2.connect(seeded_dsn)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT u.id FROM users u JOIN user_roles ur ON ur.id = u.role_id
+                WHERE ur.role_name = %s ORDER BY u.username LIMIT 1
+            """, ("Ranger",))
+            ranger = str(cursor.fetchone()[0])
+            cursor.execute("""
+                SELECT u.id FROM users u JOIN user_roles ur ON ur.id = u.role_id
+                WHERE ur.role_name = %s ORDER BY u.username LIMIT 1
+            """, ("Explorer",))
+            explorer = str(cursor.fetchone()[0])
+    finally:
+        connection.close()
+    return {"ranger": ranger, "explorer": explorer, "missing": str(uuid.uuid4())}
+
+
+def serve(index, view, path, mode):
+    """Responde `path` con la vista secuencial o con la async registrada en el mismo endpoint"""
+    sequential = getattr(index, view)
+    saved = index.app.view_functions[view]
+    index.app.view_functions[view] = (index.ASYNC_VIEW_FUNCTIONS[view] if mode == "async"
+                                      else getattr(sequential, "__wrapped__", sequential))
+    try:
+        response = index.app.test_client().get(path)
+    finally:
+        index.app.view_functions[view] = saved
+    return response.status_code, response.get_json()
+
+
+@pytest.mark.parametrize("who", ["ranger", "explorer", "missing"])
+@pytest.mark.parametrize("view, path", VIEWS, ids=[view for view, _ in VIEWS])
+def test_async_view_matches_sequential(app_index, ids, view, path, who):
+    path = path.format(id=ids[who])
+
+    assert serve(app_index, view, path, "async") == serve(app_index, view, path, "sync")
+
+
+def test_queries_share_the_async_pool(app_index, ids):
+    serve(app_index, "get_ranger_details", f"/rangers/{ids['ranger']}", "async")
+
+    stats = app_index.get_async_db_pool().get_stats()
+    assert stats["pool_max"] == app_index.DB_POOL_MAX
+    assert stats["requests_num"] >= 2
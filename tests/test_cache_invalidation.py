@@ -0,0 +1,45 @@
+"""Las escrituras descartan las respuestas cacheadas que dependen de ellas."""
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+
+@pytest.fixture
+def cached_app(app_index):
+    """app_index con la caché en memoria activa"""
+    saved = app_index.CACHE_BACKEND
+    app_index.CACHE_BACKEND = app_index.MemoryCacheBackend()
+    yield app_index
+    app_index.CACHE_BACKEND = saved
+
+
+@pytest.fixture
+def ranger_id(seeded_dsn):
+    connection = psycopg2.connect(seeded_dsn)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT u.id FROM users u JOIN user_roles ur ON ur.id = u.role_id
+                WHERE ur.role_name = 'Ranger' ORDER BY u.username LIMIT 1
+            """)
+            return str(cursor.fetchone()[0])
+    finally:
+        connection.close()
+
+
+def test_new_certification_shows_in_cached_ranger_details(cached_app, ranger_id):
+    client = cached_app.app.test_client()
+    before = client.get(f"/rangers/{ranger_id}").get_json()
+
+    response = client.post(f"/rangers/{ranger_id}/certifications", json={
+        "title": "Primeros auxilios en montaña",
+        "issued_by": "Cruz Roja",
+        "issued_date": "2026-01-10",
+        "valid_until": "2028-01-10",
+    })
+    assert response.status_code == 201
+
+    after = client.get(f"/rangers/{ranger_id}").get_json()
+    titles = [certification["title"] for certification in after["certifications"]]
+    assert "Primeros auxilios en montaña" in titles
+    assert len(after["certifications"]) == len(before["certifications"]) + 1
@@ -0,0 +1,86 @@
+"""Verifica con EXPLAIN que las consultas de la API usan los índices de migrations/.
+
+Las consultas son las mismas que ejecuta la app (el registro QUERIES y las
+consultas de endpoints definidas en api/index.py), con valores tomados de los
+datos de benchmarks/endpoint_suite.py y sin forzar al planner: si un cambio en
+el SQL o en las migraciones deja una consulta en seq scan, el test falla.
+Necesita initdb/pg_ctl (PATH o PG_BIN); sin ellos se omite.
+"""
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+import index  # noqa: E402
+from endpoint_suite import BENCH_USER  # noqa: E402
+
+# (id, consulta, parámetros a partir de las muestras, índices que el plan debe usar)
+CHECKS = [
+    ("trip_exists", index.QUERIES["trip_exists"], lambda s: (s["trip"],),
+     {"trips_pkey"}),
+    ("user_exists", index.QUERIES["user_exists"], lambda s: (s["explorer"],),
+     {"users_pkey"}),
+    ("user_for_login", index.QUERIES["user_for_login"], lambda s: (BENCH_USER,),
+     {"users_username_key"}),
+    ("trip_has_reservations", index.QUERIES["trip_has_reservations"], lambda s: (s["trip"],),
+     {"reservations_trip_id_user_id_idx"}),
+    ("trip_reservation_count", index.QUERIES["trip_reservation_count"], lambda s: (s["trip"],),
+     {"reservations_trip_id_user_id_idx"}),
+    ("user_reservation_on_trip", index.QUERIES["user_reservation_on_trip"],
+     lambda s: (s["explorer"], s["trip"]),
+     {"reservations_trip_id_user_id_idx"}),
+    ("calification_by_user_trip", index.QUERIES["calification_by_user_trip"],
+     lambda s: (s["explorer"], s["trip"]),
+     {"ranger_califications_user_id_trip_id_idx"}),
+    ("explorers_by_trip", index.EXPLORERS_BY_TRIP_QUERY, lambda s: (s["trip"],),
+     {"reservations_trip_id_user_id_idx"}),
+    ("dashboard_explorer", index.DASHBOARD_EXPLORER_QUERY, lambda s: (s["explorer"],),
+     {"reservations_user_id_idx", "payments_trip_id_user_id_idx"}),
+    ("ranger_details", index.RANGER_DETAILS_QUERY, lambda s: (s["ranger"],),
+     {"users_pkey"}),
+    ("ranger_is_ranger", index.RANGER_IS_RANGER_QUERY, lambda s: (s["ranger"],),
+     {"users_pkey"}),
+    ("trip_full", index.trip_full_query(list(index.TRIP_FULL_SECTIONS)), lambda s: (s["trip"],),
+     {"trips_pkey", "activity_trips_trip_id_idx", "trip_resources_trip_id_resource_id_key",
+      "reservations_trip_id_user_id_idx", "payments_trip_id_user_id_idx", "trip_rating_stats_pkey"}),
+]
+
+
+def plan_indexes(node):
+    """Nombres de índices usados en un nodo del plan y sus hijos (incluye subplanes)"""
+    found = {node["Index Name"]} if "Index Name" in node else set()
+    for child in node.get("Plans", []):
+        found |= plan_indexes(child)
+    return found
+
+
+@pytest.fixture(scope="module")
+def database(seeded_dsn):
+    connection = psycopg2.connect(seeded_dsn)
+    yield connection
+    connection.close()
+
+
+@pytest.fixture(scope="module")
+def samples(database):
+    """Un viaje con reservas, uno de sus explorers y su ranger"""
+    with database.cursor() as cursor:
+        cursor.execute("""
+            SELECT t.id, r.user_id, t.lead_ranger
+            FROM trips t JOIN reservations r ON r.trip_id = t.id
+            ORDER BY t.trip_name, r.id LIMIT 1
+        """)
+        trip, explorer, ranger = (str(value) for value in cursor.fetchone())
+    database.rollback()
+    return {"trip": trip, "explorer": explorer, "ranger": ranger}
+
+
+@pytest.mark.parametrize("query, params, expected", [check[1:] for check in CHECKS],
+                         ids=[check[0] for check in CHECKS])
+def test_query_uses_index(database, samples, query, params, expected):
+    with database.cursor() as cursor:
+        # EXPLAIN sin ANALYZE no ejecuta la consulta
+        cursor.execute("EXPLAIN (FORMAT JSON) " + query, params(samples))
+        plan = cursor.fetchone()[0]
+    database.rollback()
+    used = plan_indexes(plan[0]["Plan"])
+    assert expected <= used, f"faltan {sorted(expected - used)}; el plan usa {sorted(used) or 'solo seq scans'}"
@@ -0,0 +1,38 @@
+"""Cursores de los listados paginados por id (/activities, /trips, /resources, /rangers)."""
+import pytest
+
+pytest.importorskip("psycopg2")
+
+LISTINGS = [("/activities", "message"), ("/trips", "message"), ("/resources", "message"), ("/rangers", "error")]
+
+LAST_ID = "ffffffff-ffff-ffff-ffff-ffffffffffff"
+
+
+@pytest.mark.parametrize("values", [["no-es-uuid"], [12], [LAST_ID, LAST_ID], [], [None]],
+                         ids=["texto", "numero", "dos-claves", "vacio", "nulo"])
+@pytest.mark.parametrize("path, key", LISTINGS, ids=[path for path, _ in LISTINGS])
+def test_rejects_invalid_cursor(app_index, path, key, values):
+    after = app_index.encode_cursor(values)
+    response = app_index.app.test_client().get(path, query_string={"limit": 5, "after": after})
+
+    assert response.status_code == 400
+    assert response.get_json()[key] == "Cursor inválido"
+
+
+def test_trips_pages_end_with_empty_page(app_index):
+    client = app_index.app.test_client()
+    seen, after = [], None
+    while True:
+        query = {"limit": 7, **({"after": after} if after else {})}
+        body = client.get("/trips", query_string=query).get_json()
+        seen += [trip["id"] for trip in body["trips"]]
+        after = body["next_cursor"]
+        if after is None:
+            break
+
+    assert seen == sorted(seen)
+    assert len(seen) == len(client.get("/trips").get_json()["trips"])
+
+    response = client.get("/trips", query_string={"limit": 7, "after": app_index.encode_cursor([LAST_ID])})
+    assert response.status_code == 200
+    assert response.get_json() == {"trips": [], "next_cursor": None}
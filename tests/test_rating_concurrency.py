@@ -0,0 +1,85 @@
+"""Escrituras simultáneas sobre una misma calificación no desvían ranger_stats ni trip_rating_stats."""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+from conftest import bearer  # noqa: E402
+
+CLIENTS = 16
+
+
+def concurrently(index, request):
+    """Lanza CLIENTS peticiones a la vez (detrás de una barrera), cada una con su cliente"""
+    barrier = threading.Barrier(CLIENTS)
+
+    def one(i):
+        client = index.app.test_client()
+        barrier.wait(timeout=30)
+        return request(client, i).status_code
+
+    with ThreadPoolExecutor(max_workers=CLIENTS) as pool:
+        return list(pool.map(one, range(CLIENTS)))
+
+
+@pytest.fixture
+def calification(app_index, seeded_dsn):
+    """Una calificación con comentario de un viaje con ranger, distinta en cada test"""
+    connection = psycopg2.connect(seeded_dsn)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT rc.id, rc.user_id, rc.trip_id, t.lead_ranger
+                FROM ranger_califications rc JOIN trips t ON t.id = rc.trip_id
+                WHERE t.lead_ranger IS NOT NULL AND rc.user_comment IS NOT NULL
+                ORDER BY random() LIMIT 1
+            """)
+            return dict(zip(("id", "user_id", "trip_id", "ranger_id"), (str(v) for v in cursor.fetchone())))
+    finally:
+        connection.close()
+
+
+def drift(index, seeded_dsn, calification):
+    """Filas de RATING_DRIFT_SQL para el viaje y el ranger de la calificación"""
+    connection = psycopg2.connect(seeded_dsn)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(index.RATING_DRIFT_SQL)
+            return [row for row in cursor.fetchall()
+                    if str(row[1]) in (calification["trip_id"], calification["ranger_id"])]
+    finally:
+        connection.close()
+
+
+def test_concurrent_updates_keep_aggregates(app_index, seeded_dsn, calification):
+    headers = bearer(app_index, calification["user_id"], "Explorer")
+    statuses = concurrently(app_index, lambda client, i: client.put(
+        f"/api/ranger-califications/{calification['id']}", headers=headers,
+        json={"user_id": calification["user_id"], "calification": 1 + i % 5,
+              "user_comment": "Muy buen viaje" if i % 2 else ""}
+    ))
+
+    assert statuses == [200] * CLIENTS
+    assert drift(app_index, seeded_dsn, calification) == []
+
+
+def test_concurrent_ranger_ratings_keep_aggregates(app_index, seeded_dsn, calification):
+    statuses = concurrently(app_index, lambda client, i: client.post(
+        f"/rangers/{calification['ranger_id']}/trips/{calification['trip_id']}/rating",
+        json={"user_id": calification["user_id"], "rating": 1 + i % 5}
+    ))
+
+    assert statuses == [200] * CLIENTS
+    assert drift(app_index, seeded_dsn, calification) == []
+
+
+def test_concurrent_deletes_subtract_once(app_index, seeded_dsn, calification):
+    headers = bearer(app_index, calification["user_id"], "Explorer")
+    statuses = concurrently(app_index, lambda client, i: client.delete(
+        f"/api/ranger-califications/{calification['id']}", headers=headers
+    ))
+
+    assert sorted(statuses) == [200] + [404] * (CLIENTS - 1)
+    assert drift(app_index, seeded_dsn, calification) == []
@@ -0,0 +1,209 @@
+"""RedisCacheBackend contra un servidor RESP falso en un hilo (socketserver)."""
+import fnmatch
+import socket
+import socketserver
+import threading
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("psycopg2")
+
+import index  # noqa: E402
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+            self.server.sockets.append(self.request)
+        self.authenticated = self.server.password is None
+
+    def handle(self):
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            with self.server.lock:
+                self.server.commands.append(args)
+            self.wfile.write(self.reply(args[0].decode().upper(), args[1:]))
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line.startswith(b"*"):
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def reply(self, name, args):
+        server = self.server
+        if name == "AUTH":
+            if args[0].decode() != server.password:
+                return b"-WRONGPASS invalid username-password pair\r\n"
+            self.authenticated = True
+            return b"+OK\r\n"
+        if not self.authenticated:
+            return b"-NOAUTH Authentication required.\r\n"
+        if name == "SELECT":
+            return b"+OK\r\n"
+        if name == "GET":
+            if args[0] in server.wrongtype:
+                return b"-WRONGTYPE Operation against a key holding the wrong kind of value\r\n"
+            if args[0] in server.garbage:
+                return b"?no es RESP\r\n"
+            value = server.data.get(args[0])
+            return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+        if name == "SET":
+            server.data[args[0]] = args[1]
+            server.ttls[args[0]] = int(args[3]) if len(args) > 3 and args[2].upper() == b"EX" else None
+            return b"+OK\r\n"
+        if name == "SCAN":
+            # Páginas de dos claves para obligar a seguir el cursor; el orden se fija al
+            # empezar la iteración para que los DEL entre páginas no salten claves
+            start = int(args[0])
+            if start == 0:
+                server.scan_order = sorted(server.data)
+            keys = server.scan_order
+            page = [key for key in keys[start:start + 2]
+                    if key in server.data and fnmatch.fnmatchcase(key.decode(), args[2].decode())]
+            cursor = str(start + 2 if start + 2 < len(keys) else 0).encode()
+            reply = b"*2\r\n$%d\r\n%s\r\n*%d\r\n" % (len(cursor), cursor, len(page))
+            return reply + b"".join(b"$%d\r\n%s\r\n" % (len(key), key) for key in page)
+        if name == "DEL":
+            removed = sum(server.data.pop(key, None) is not None for key in args)
+            return b":%d\r\n" % removed
+        return b"-ERR unknown command '%s'\r\n" % name.encode()
+
+
+class FakeRedis(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, password=None):
+        super().__init__(("127.0.0.1", 0), RespHandler)
+        self.password = password
+        self.lock = threading.Lock()
+        self.data, self.ttls = {}, {}
+        self.scan_order = []
+        self.wrongtype, self.garbage = set(), set()
+        self.commands, self.sockets = [], []
+        self.connections = 0
+
+    def url(self, auth="", db=0):
+        return f"redis://{auth}127.0.0.1:{self.server_address[1]}/{db}"
+
+    def drop_connections(self):
+        with self.lock:
+            for sock in self.sockets:
+                sock.shutdown(socket.SHUT_RDWR)
+            self.sockets.clear()
+
+    def command_names(self):
+        with self.lock:
+            return [args[0].decode().upper() for args in self.commands]
+
+
+@pytest.fixture
+def server():
+    fake = FakeRedis()
+    threading.Thread(target=fake.serve_forever, daemon=True).start()
+    yield fake
+    fake.shutdown()
+    fake.server_close()
+
+
+@pytest.fixture
+def backend(server):
+    cache = index.RedisCacheBackend(server.url())
+    yield cache
+    cache._close()
+
+
+def test_get_and_set_with_expiry(server, backend):
+    assert backend.get("trips:/trips") is None
+    backend.set("trips:/trips", b'{"trips": []}', 30)
+    backend.set("trips:/trips?limit=1", b"[]", 0.2)
+
+    assert backend.get("trips:/trips") == b'{"trips": []}'
+    assert server.ttls[b"trips:/trips"] == 30
+    # Redis rechaza EX 0: el TTL mínimo es un segundo
+    assert server.ttls[b"trips:/trips?limit=1"] == 1
+    assert server.connections == 1
+
+
+def test_delete_prefix_follows_scan_cursor(server, backend):
+    for i in range(5):
+        backend.set(f"trips:/trips/{i}", b"x", 60)
+    backend.set("rangers:/rangers", b"x", 60)
+    backend.set("locations:/locations", b"x", 60)
+
+    backend.delete_prefix("trips:")
+
+    assert sorted(server.data) == [b"locations:/locations", b"rangers:/rangers"]
+    assert server.command_names().count("SCAN") > 1
+    assert "DEL" in server.command_names()
+
+
+def test_reconnects_after_dropped_socket(server, backend):
+    backend.set("trips:/trips", b"x", 60)
+    server.drop_connections()
+
+    assert backend.get("trips:/trips") == b"x"
+    assert server.connections == 2
+
+
+def test_error_reply_keeps_connection(server, backend):
+    server.wrongtype.add(b"trips:/trips")
+    backend.set("rangers:/rangers", b"x", 60)
+
+    with pytest.raises(index.RedisError, match="WRONGTYPE"):
+        backend.get("trips:/trips")
+    # La respuesta de error no desincroniza el protocolo ni se reintenta
+    assert backend.get("rangers:/rangers") == b"x"
+    assert server.command_names().count("GET") == 2
+    assert server.connections == 1
+
+
+def test_unreadable_reply_closes_connection(server, backend):
+    server.garbage.add(b"trips:/trips")
+    backend.set("rangers:/rangers", b"x", 60)
+
+    with pytest.raises(index.RedisProtocolError):
+        backend.get("trips:/trips")
+    assert backend.get("rangers:/rangers") == b"x"
+    assert server.connections == 2
+
+
+def test_auth_and_select_on_connect():
+    fake = FakeRedis(password="secreto")
+    threading.Thread(target=fake.serve_forever, daemon=True).start()
+    try:
+        cache = index.RedisCacheBackend(fake.url(":secreto@", db=3))
+        cache.set("trips:/trips", b"x", 60)
+        assert fake.command_names() == ["AUTH", "SELECT", "SET"]
+        assert fake.commands[1] == [b"SELECT", b"3"]
+        cache._close()
+
+        rejected = index.RedisCacheBackend(fake.url(":incorrecta@"))
+        for _ in range(2):
+            with pytest.raises(index.RedisError, match="WRONGPASS"):
+                rejected.get("trips:/trips")
+        # Cada intento vuelve a autenticarse en vez de reutilizar la conexión rechazada
+        assert fake.command_names().count("GET") == 0
+        assert fake.connections == 3
+    finally:
+        fake.shutdown()
+        fake.server_close()
+
+
+def test_raises_when_server_is_down(server):
+    cache = index.RedisCacheBackend(server.url())
+    server.shutdown()
+    server.server_close()
+
+    with pytest.raises(OSError):
+        cache.get("trips:/trips")
@@ -0,0 +1,41 @@
+"""Reservas simultáneas sobre un mismo viaje no superan su capacidad."""
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+from reservation_concurrency import fire, percentile, setup, teardown  # noqa: E402
+
+SEATS = 10
+EXPLORERS = 60
+# Un hilo por conexión del pool de app_index: la contención es la del lock del viaje
+CLIENTS = 20
+# Cota holgada: detecta esperas en serie por el lock, no variaciones de la máquina
+P99_MS = 5000
+
+
+@pytest.fixture
+def trip(app_index, seeded_dsn):
+    """Viaje temporal con SEATS cupos y EXPLORERS explorers; se elimina al terminar"""
+    connection = psycopg2.connect(seeded_dsn)
+    trip_id, user_ids = setup(connection, SEATS, EXPLORERS)
+    try:
+        yield connection, trip_id, user_ids
+    finally:
+        teardown(connection, trip_id, user_ids)
+        connection.close()
+
+
+def test_concurrent_reservations_fill_capacity_exactly(app_index, trip):
+    connection, trip_id, user_ids = trip
+
+    results, _ = fire(app_index, trip_id, user_ids, CLIENTS)
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM reservations WHERE trip_id = %s", (trip_id,))
+        reserved = cursor.fetchone()[0]
+        cursor.execute("SELECT seats_taken FROM trips WHERE id = %s", (trip_id,))
+        seats_taken = cursor.fetchone()[0]
+    statuses = [status for status, _ in results]
+    assert reserved == seats_taken == statuses.count(201) == SEATS
+    assert statuses.count(409) == EXPLORERS - SEATS
+    assert percentile(sorted(ms for _, ms in results), 0.99) < P99_MS